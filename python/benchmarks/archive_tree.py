@@ -0,0 +1,89 @@
+'''
+Synthetic archive trees for the benchmarks. Builds a DocumentFolder with author folders
+named and laid out like the real archive (middle names, "De_La" last names, letters in
+sub-folders, covers next to the documents, a few misnamed files and Thumbs.db), so the
+indexer takes the same paths through the code as it does on the real folders.
+
+The tree is the same for the same arguments and seed.
+
+    Build a tree to look at, from the python folder:
+        python -m benchmarks.archive_tree <folder> [Letters|Articles|Books] [num_authors] [num_docs]
+'''
+import os, random, sys
+
+FIRST_NAMES = ["Mary", "Joseph", "Teresa", "John", "Agnes", "Francis", "Anne", "Paul",
+               "Brian", "Navin", "Kathryn", "Michael", "Leo", "Sister", "Rachel", "Gezim"]
+MIDDLE_NAMES = ["", "", "", "M", "Ann", "B.", "Marie", "J"]
+LAST_NAMES = ["Kolodiejchuk", "Spink", "Chawla", "Egan", "Le-Joly", "Muggeridge", "Sebba",
+              "Gonzalez-Balado", "O'Connor", "Nirmala", "Alpion", "Chatterjee", "Da_Silva",
+              "De_La_Cruz", "of_Calcutta", "Tanquerey"]
+PERIODICALS = ["Time-Magazine", "The-Statesman", "Catholic-Herald", "National-Catholic-Register",
+               "The-Tablet", "Hindustan-Times", "America"]
+TITLE_WORDS = ["a", "letter", "to", "the", "sisters", "of", "charity", "in", "calcutta", "on",
+               "prayer", "and", "love", "for", "poor", "something", "beautiful", "god", "mother",
+               "teresa", "saint", "gutters", "dark", "night", "faith", "works", "peace", "home"]
+
+DOC_TYPES = {"Letters": "Letter", "Articles": "Article", "Books": "Book"}
+
+def get_author(rand):
+    first = rand.choice(FIRST_NAMES)
+    middle = rand.choice(MIDDLE_NAMES)
+    last = rand.choice(LAST_NAMES)
+    folder = "_".join(part for part in (first, middle, last) if part).replace(" ", "-")
+    initials = f"{first[0]}.{middle[0] + '.' if middle else ''}"
+    return (folder, f"{initials}-{last.split('_')[-1]}")
+
+def get_title(rand):
+    return "-".join(rand.choice(TITLE_WORDS) for _ in range(rand.randint(2, 9)))
+
+def get_stem(rand, doct_name):
+    date = f"19{rand.randint(50, 97)}-{rand.randint(1, 12):02}-{rand.randint(1, 28):02}"
+    if doct_name == "Article":
+        return f"{date[:7]}_{rand.choice(PERIODICALS)}_{get_title(rand)}"
+    elif doct_name == "Letter":
+        return f"{date}_{get_title(rand)}"
+
+    return get_title(rand)
+
+# Create the tree under root, returns the number of document files created. The document
+# type is the DocumentTypes name from settings (Letters, Articles or Books).
+def create_archive_tree(root, doct_type="Letters", num_authors=100, num_docs=25, seed=1):
+    rand = random.Random(seed)
+    doct_name = DOC_TYPES[doct_type]
+    num_files = 0
+
+    author_folders = set()
+    while len(author_folders) < num_authors:
+        (author_folder, author_part) = get_author(rand)
+        author_folder = f"{author_folder}{len(author_folders)}" if author_folder in author_folders else author_folder
+        author_folders.add(author_folder)
+
+        author_path = os.path.join(root, author_folder)
+        sub_path = os.path.join(author_path, "Correspondence")
+        os.makedirs(sub_path, exist_ok=True)
+
+        for i in range(num_docs):
+            # Letters are also filed in sub-folders of the author folder
+            doc_path = sub_path if (doct_name == "Letter" and i % 4 == 0) else author_path
+            stem = f"{get_stem(rand, doct_name)}-{i}"
+
+            # Some documents are misnamed (extra underscore) like in the real archive
+            if rand.random() < 0.02:
+                stem += "_draft"
+
+            open(os.path.join(doc_path, f"{stem}_{author_part}.pdf"), "w").close()
+            open(os.path.join(doc_path, f"{stem}_cover.jpg"), "w").close()
+            num_files += 1
+
+        open(os.path.join(author_path, "Thumbs.db"), "w").close()
+
+    # Folders that are not authors are skipped by the indexer
+    os.makedirs(os.path.join(root, "_Unsorted"), exist_ok=True)
+
+    return num_files
+
+if __name__ == "__main__":
+    (folder, doct_type) = (sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else "Letters")
+    num_authors = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+    num_docs = int(sys.argv[4]) if len(sys.argv) > 4 else 25
+    print(f"Created {create_archive_tree(folder, doct_type, num_authors, num_docs)} documents in {folder}")
@@ -0,0 +1,50 @@
+'''
+Benchmark for the cover file lookup done for every document by the indexer. It builds a
+synthetic letters folder (documents with their covers) and times the old per document
+scandir() scan against the per folder CoverIndex.
+
+    Run from the python folder:
+        python -m benchmarks.cover_lookup_bench [num_docs]
+'''
+import os, sys, tempfile, time
+from mti.author_doc_scan import CoverIndex
+
+def create_folder(folder, num_docs):
+    for i in range(num_docs):
+        stem = f"1950-01-{i % 28 + 1:02}_Letter-To-Friend-Number-{i}"
+        open(os.path.join(folder, f"{stem}_M.-Teresa.pdf"), "w").close()
+        open(os.path.join(folder, f"{stem}_cover.jpg"), "w").close()
+
+    return [name for name in os.listdir(folder) if "_cover" not in name]
+
+# This is how the cover file was looked up before the CoverIndex
+def scan_lookup(folder, doc_names):
+    for name in doc_names:
+        cover_file_name = name.rsplit("_", 1)[0] + "_cover"
+        next((f.name for f in os.scandir(folder)
+            if f.is_file() and f.name.upper().startswith(cover_file_name.upper())), "")
+
+def index_lookup(folder, doc_names):
+    cover_index = CoverIndex()
+    for name in doc_names:
+        cover_file_name = name.rsplit("_", 1)[0] + "_cover"
+        cover_index.find(folder, cover_file_name)
+
+def time_lookup(lookup, folder, doc_names):
+    start = time.perf_counter()
+    lookup(folder, doc_names)
+    return time.perf_counter() - start
+
+def main(num_docs=5000):
+    with tempfile.TemporaryDirectory() as folder:
+        doc_names = create_folder(folder, num_docs)
+
+        print(f"Cover lookup for {num_docs} documents ({num_docs * 2} files in folder)")
+        scan_secs  = time_lookup(scan_lookup, folder, doc_names)
+        index_secs = time_lookup(index_lookup, folder, doc_names)
+        print(f"\t==> Folder scan per document: {scan_secs:8.3f}s")
+        print(f"\t==> Cover index per folder  : {index_secs:8.3f}s")
+        print(f"\t==> Speedup                 : {scan_secs / index_secs:8.1f}x")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
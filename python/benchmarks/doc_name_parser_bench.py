@@ -0,0 +1,59 @@
+'''
+Benchmark for parsing document file names. It times parsing synthetic letter names one
+at a time (regex match, titlecase and split per file, as the indexer used to) against
+parsing them with doc_name_parser (compiled regex, memoized title casing), and checks both
+give the same output.
+
+    Run from the python folder:
+        python -m benchmarks.doc_name_parser_bench [num_names]
+'''
+import random, re, sys, time
+from titlecase import titlecase
+from mti import doc_name_parser
+
+SUBJECTS = ["letter-to-a-friend", "letter-of-thanks", "on-the-missionaries-of-charity",
+            "reply-to-the-archbishop", "greetings-for-christmas", "a-word-of-encouragement"]
+
+def create_names(num_names, seed=1):
+    random.seed(seed)
+    return [
+        f"19{random.randint(50, 97)}-{random.randint(1, 12):02}-{random.randint(1, 28):02}"
+        f"_{random.choice(SUBJECTS)}-{random.randint(1, 50)}_M.-Teresa.pdf"
+        for _ in range(num_names)
+    ]
+
+# This is how names were parsed before doc_name_parser
+def parse_per_file(doct_name, names):
+    parsed = []
+    for name in names:
+        match = re.match(r"^(.+)_([^_]*)$", name)
+        if match and "_cover" not in name:
+            title = titlecase(match.group(1).replace('-', ' '))
+            date, title = tuple(title.split('_'))
+            parsed.append((date.replace(" ", "-"), title))
+
+    return parsed
+
+def parse_memoized(doct_name, names):
+    return [(parsed_name.date, parsed_name.title) 
+            for parsed_name in (doc_name_parser.parse_doc_name(doct_name, name) for name in names)]
+
+def time_parse(parse, names):
+    start = time.perf_counter()
+    parsed = parse("Letter", names)
+    return time.perf_counter() - start, parsed
+
+def main(num_names=500000):
+    names = create_names(num_names)
+
+    print(f"Parsing {num_names} letter file names")
+    file_secs, file_parsed = time_parse(parse_per_file, names)
+    doc_name_parser.title_case_word.cache_clear()
+    parser_secs, parser_parsed = time_parse(parse_memoized, names)
+    print(f"\t==> Per file   : {file_secs:8.3f}s ({num_names / file_secs:10.0f} names/s)")
+    print(f"\t==> Parser     : {parser_secs:8.3f}s ({num_names / parser_secs:10.0f} names/s)")
+    print(f"\t==> Speedup    : {file_secs / parser_secs:8.1f}x")
+    print(f"\t==> Same output: {file_parsed == parser_parsed}")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500000)
@@ -0,0 +1,138 @@
+'''
+Startup benchmark for the quick launch options of the archiver (mti_archiver.py -m quick
+--menu <option>). Each option is imported in a new Python process with -X importtime, the
+way a scheduled run starts, without running the option: mti_archiver is imported and then
+the modules the option's launch function imports (QUICK_LAUNCH_MODULES, which the launch
+functions import from). The import time of the fastest run is compared with the option's
+budget, and the suite exits with an error if an option goes over its budget, e.g. because
+a module now imports pandas, Google or PIL when it is imported instead of when they are
+used (see mti.lazy_imports). An option that fails to import is reported as failed and the
+other options are still checked.
+
+Budgets are for the archiver's machine, --scale adjusts them for a slower or faster one.
+
+    Run from the python folder:
+        python -m benchmarks.startup                        Check every option
+        python -m benchmarks.startup --only WFSYNC INDEXER  Check only the named options
+        python -m benchmarks.startup --repeat 7 --scale 1.5
+'''
+import argparse, subprocess, sys, time
+from pathlib import Path
+
+# Import time budget of each quick launch option, in seconds. The Google options
+# (UPDATER, WCSYNC) need gspread and pandas, the others shouldn't load either.
+BUDGETS = {
+    "INDEXER":      0.5,
+    "LOADER":       0.5,
+    "LOADMANUAL":   0.5,
+    "UPDATER":      1.5,
+    "WCSYNC":       1.5,
+    "WFSYNC":       0.5,
+    "COMPACT":      0.3,
+}
+
+PYTHON_DIR = Path(__file__).parent.parent
+
+# Number of the slowest imports shown for each option
+TOP_IMPORTS = 5
+
+IMPORT_TIME_PREFIX = "import time:"
+
+# A line of -X importtime output: the import's time on its own and with the modules it
+# imported (in microseconds), and its name, indented by its depth in the imports
+class ImportTime:
+    def __init__(self, self_us, cumulative_us, name):
+        self.self_us = int(self_us)
+        self.cumulative_us = int(cumulative_us)
+        self.depth = (len(name) - len(name.lstrip())) // 2
+        self.name = name.strip()
+
+# Modules are listed after the modules they import, the header line is skipped
+def parse_import_times(output):
+    import_times = []
+    for line in output.splitlines():
+        if line.startswith(IMPORT_TIME_PREFIX):
+            (self_us, cumulative_us, name) = line[len(IMPORT_TIME_PREFIX):].split("|")
+            if self_us.strip().isdigit():
+                import_times.append(ImportTime(self_us, cumulative_us, name[1:]))
+
+    return import_times
+
+# An option whose modules couldn't be imported, with the last line of the error
+class ImportFailed(Exception):
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+# Import the option in a new process. Returns the seconds spent importing the archiver and
+# the option's modules, and the top level imports made for them (slowest first).
+def time_option(menuname):
+    code = f"import mti_archiver; mti_archiver.import_quick_launch_modules({menuname!r})"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=PYTHON_DIR,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        errors = [line for line in result.stderr.splitlines() if not line.startswith(IMPORT_TIME_PREFIX)]
+        raise ImportFailed(errors[-1] if errors else f"exit code {result.returncode}")
+
+    # Imports made by Python's startup (site, encodings) are listed before the archiver,
+    # the option's modules after it
+    import_times = parse_import_times(result.stderr)
+    start = next(i for (i, t) in enumerate(import_times) if t.name == "mti_archiver" and t.depth == 0)
+    top_level = [t for t in import_times[start:] if t.depth == 0]
+
+    seconds = sum(t.cumulative_us for t in top_level) / 1e6
+    return (seconds, sorted(top_level, key=lambda t: t.cumulative_us, reverse=True))
+
+# Check the options, returns the names of the ones over their budget and of the ones that
+# failed to import
+def run_startup(names, repeat=5, scale=1.0):
+    over_budget = []
+    failed = []
+
+    print(f"Timing the imports of {len(names)} quick launch options ({repeat} runs each)")
+    for name in names:
+        try:
+            runs = [time_option(name) for _ in range(repeat)]
+        except ImportFailed as e:
+            print(f"\t==> {name:12}: FAILED   {e.message}")
+            failed.append(name)
+            continue
+        (seconds, top_level) = min(runs, key=lambda run: run[0])
+
+        budget = BUDGETS[name] * scale
+        line = f"\t==> {name:12}: {seconds:8.4f}s  budget {budget:8.4f}s"
+        if seconds > budget:
+            line += "  OVER BUDGET"
+            over_budget.append(name)
+        print(line)
+
+        slowest = ", ".join(f"{t.name} {t.cumulative_us / 1e6:.3f}s" for t in top_level[:TOP_IMPORTS])
+        print(f"\t    {'':12}  slowest: {slowest}")
+
+    return (over_budget, failed)
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(description="Check the import time of each quick launch option against its budget.")
+    parser.add_argument("--only", nargs="+", choices=list(BUDGETS), metavar="MENU",
+                        type=str.upper, help="Options to check: " + ", ".join(BUDGETS))
+    parser.add_argument("--repeat", type=int, default=5, help="Runs of each option (default 5)")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="Scale the budgets for a slower (> 1) or faster (< 1) machine")
+    return parser
+
+def main():
+    args = get_args_parser().parse_args()
+
+    start = time.perf_counter()
+    (over_budget, failed) = run_startup(args.only or list(BUDGETS), args.repeat, args.scale)
+    print(f"\nDone in {time.perf_counter() - start:.1f}s")
+
+    if over_budget:
+        print(f"\n{len(over_budget)} options over their startup budget: {', '.join(over_budget)}")
+    if failed:
+        print(f"\n{len(failed)} options failed to import: {', '.join(failed)}")
+    if over_budget or failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
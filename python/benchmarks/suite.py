@@ -0,0 +1,322 @@
+'''
+Benchmark suite for the hot paths of the archiver: scanning author folders, finding the
+changes in an index, generating covers (and rendering PDF covers, if pypdfium2 is
+installed), reading index CSVs (and Parquet snapshots, if pyarrow is installed) and
+converting data frames to sheet rows. Each benchmark runs on synthetic data (see
+archive_tree) built the same way every time, is run a few times after a warm up run, and
+the fastest time is compared with the baseline saved for it. A benchmark more than the
+threshold slower than its baseline is a regression, and the suite exits with an error so
+it can gate a change.
+
+Baselines are timings of this machine, so save them on the machine the suite is run on
+(and save them again after a change that is meant to change the timings). They are not
+checked in (see .gitignore).
+
+The suite runs with its own settings file (see SETTINGS) written to the temporary folder
+the data is built in, so it doesn't need or touch the archiver's settings and data.
+
+    Run from the python folder:
+        python -m benchmarks.suite                          Run and compare to baselines
+        python -m benchmarks.suite --save                   Run and save timings as baselines
+        python -m benchmarks.suite --only author_doc_scan   Run only the named benchmarks
+        python -m benchmarks.suite --threshold 0.1 --repeat 7
+'''
+import argparse, contextlib, csv, io, json, os, platform, random, shutil, statistics, sys, tempfile, time
+from pathlib import Path
+import pandas as pd
+from PIL import Image, ImageDraw
+from benchmarks.archive_tree import create_archive_tree
+from mti import author_doc_scan, book_csv_reader, index_snapshots, pdf_covers
+from mti.mti_config import mticonfig
+from mti.cover_generator import generate_cover, get_cover_renderer
+from mti.mti_indexer import MTIIndexer
+from googlemti import google_util
+
+BASELINES_FILE = Path(__file__).parent / 'baselines.json'
+
+# Sizes of the synthetic data, saved with the baselines since timings are only
+# comparable for the same sizes
+SIZES = {
+    "scan_authors":     200,
+    "scan_docs":        25,
+    "index_rows":       40000,
+    "new_rows":         400,
+    "covers":           20,
+}
+
+# Settings the benchmarks run with, the ScriptDataFolder is in the temporary folder
+SETTINGS = '''
+[Settings]
+Collections=Benchmark Collection
+DocumentTypes=Letters
+ScriptDataFolder={data_dir}
+GenerateCover=False
+CoverSource=Text
+ScanThreads=1
+IncrementalIndex=False
+HashDocuments=False
+IndexStore=False
+IndexSnapshotFormat=CSV
+'''
+
+# Write the settings file in work_dir and use it for the run (and for the worker processes
+# started by the benchmarks, which read it from MTI_ARCHIVER_SETTINGS)
+def use_settings(work_dir):
+    data_dir = work_dir / 'data'
+    os.makedirs(data_dir, exist_ok=True)
+    settings_file = work_dir / 'archive.ini'
+    with open(settings_file, 'w', encoding="utf-8") as file:
+        file.write(SETTINGS.format(data_dir=data_dir))
+
+    os.environ["MTI_ARCHIVER_SETTINGS"] = str(settings_file)
+    mticonfig.settings_file = settings_file
+    with quiet():
+        mticonfig.load_ini()
+
+# Stand in for the gspread worksheet convert_df_to_sheet_rows gets the headers from
+class SheetStub:
+    def __init__(self, headers):
+        self.headers = headers
+
+    def row_values(self, row):
+        return self.headers
+
+    def insert_row(self, values):
+        self.headers = values
+
+# Run without the progress bars and summaries printed by the code being timed
+@contextlib.contextmanager
+def quiet():
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        yield
+
+def scan_folder(folder, out_dir, name):
+    with quiet():
+        author_doc_scan.process_all_author_folders(
+            folder, "Letters",
+            out_dir / f'{name}_Index.csv', out_dir / f'{name}_Index_Debug.txt', out_dir / f'{name}_Index_Error.csv',
+            debug=True, scan_threads=1)
+
+    return out_dir / f'{name}_Index.csv'
+
+# Setup functions build the data for a benchmark in work_dir (not timed) and return the
+# arguments for its run function
+def setup_author_doc_scan(work_dir):
+    folder = work_dir / 'scan' / 'Letters'
+    create_archive_tree(folder, "Letters", SIZES["scan_authors"], SIZES["scan_docs"])
+    return (folder, work_dir)
+
+def run_author_doc_scan(folder, work_dir):
+    scan_folder(folder, work_dir, 'scan')
+
+# The last loaded index and the current one with new_rows documents added to it
+def setup_index_files(work_dir):
+    index_file = work_dir / 'index_Index.csv'
+    if not index_file.exists():
+        num_authors = SIZES["index_rows"] // SIZES["scan_docs"]
+        folder = work_dir / 'index' / 'Letters'
+        create_archive_tree(folder, "Letters", num_authors, SIZES["scan_docs"], seed=2)
+        scan_folder(folder, work_dir, 'index')
+
+    with open(index_file, 'r', newline="", encoding="utf-8") as file:
+        lines = file.readlines()
+
+    rand = random.Random(3)
+    new_lines = list(lines)
+    for i in range(SIZES["new_rows"]):
+        pos = rand.randint(1, len(new_lines))
+        new_lines.insert(pos, lines[rand.randint(1, len(lines) - 1)].replace(".pdf", f"-new-{i}.pdf"))
+
+    new_index_file = work_dir / 'index_new_Index.csv'
+    with open(new_index_file, 'w', newline="", encoding="utf-8") as file:
+        file.writelines(new_lines)
+
+    return (index_file, new_index_file)
+
+def setup_find_changes(work_dir):
+    return setup_index_files(work_dir)
+
+def run_find_changes(index_file, new_index_file):
+    MTIIndexer.find_changes(index_file, new_index_file)
+
+def setup_generate_cover(work_dir):
+    folder = work_dir / 'covers'
+    os.makedirs(folder, exist_ok=True)
+
+    rand = random.Random(4)
+    with open(setup_index_files(work_dir)[0], 'r', encoding="utf-8") as file:
+        records = list(csv.DictReader(file))
+    titles = [record["Letter Title"] for record in rand.sample(records, SIZES["covers"])]
+
+    return (folder, titles)
+
+def run_generate_cover(folder, titles):
+    for (i, title) in enumerate(titles):
+        generate_cover(title, "Mother Teresa", folder, f"cover-{i}_cover")
+
+# The cover without saving it, the cost of drawing the text of each title
+def setup_render_cover(work_dir):
+    return (setup_generate_cover(work_dir)[1],)
+
+def run_render_cover(titles):
+    renderer = get_cover_renderer()
+    for title in titles:
+        renderer.render(title, "Mother Teresa")
+
+# Covers from the first page of PDFs (scanned pages, as images in the PDF), not cached
+def setup_render_pdf_cover(work_dir):
+    folder = work_dir / 'pdfs'
+    os.makedirs(folder, exist_ok=True)
+    pdf_files = []
+    for i in range(SIZES["covers"]):
+        page = Image.effect_noise((1275, 1650), 20 + i).convert("RGB")
+        ImageDraw.Draw(page).rectangle([150, 300, 1125, 700], fill=(30, 30, 30))
+        pdf_files.append(folder / f'doc-{i}.pdf')
+        page.save(pdf_files[-1], "PDF", resolution=150)
+
+    return (pdf_files,)
+
+def run_render_pdf_cover(pdf_files):
+    for pdf_file in pdf_files:
+        pdf_covers.render_first_page(str(pdf_file))
+
+def setup_read_csv_file(work_dir):
+    return (setup_index_files(work_dir)[0],)
+
+def run_read_csv_file(index_file):
+    for _ in book_csv_reader.read_csv_file("Letter", index_file):
+        pass
+
+# The index as read by the Google loader, from the CSV file and from a Parquet snapshot
+def setup_load_index_csv(work_dir):
+    return (setup_index_files(work_dir)[0],)
+
+def run_load_index(index_file):
+    index_snapshots.read_snapshot(index_file)
+
+def setup_parquet_files(work_dir):
+    parquet_files = []
+    for index_file in setup_index_files(work_dir):
+        parquet_file = work_dir / f'{index_file.stem}_snapshot.csv'
+        shutil.copy(index_file, parquet_file)
+        parquet_files.append(index_snapshots.write_parquet(parquet_file))
+
+    return parquet_files
+
+def setup_load_index_parquet(work_dir):
+    return (setup_parquet_files(work_dir)[0],)
+
+def setup_find_changes_parquet(work_dir):
+    return tuple(setup_parquet_files(work_dir))
+
+def setup_convert_df_to_sheet_rows(work_dir):
+    df = pd.read_csv(setup_index_files(work_dir)[0], dtype=str).astype("string")
+    headers = ["Post ID", "WBG Load Date"] + df.columns.tolist()
+    return (df, headers)
+
+def run_convert_df_to_sheet_rows(df, headers):
+    google_util.convert_df_to_sheet_rows(df.copy(), SheetStub(headers))
+
+BENCHMARKS = {
+    "author_doc_scan":          (setup_author_doc_scan, run_author_doc_scan),
+    "find_changes":             (setup_find_changes, run_find_changes),
+    "generate_cover":           (setup_generate_cover, run_generate_cover),
+    "render_cover":             (setup_render_cover, run_render_cover),
+    "read_csv_file":            (setup_read_csv_file, run_read_csv_file),
+    "convert_df_to_sheet_rows": (setup_convert_df_to_sheet_rows, run_convert_df_to_sheet_rows),
+    "load_index_csv":           (setup_load_index_csv, run_load_index),
+}
+
+if index_snapshots.parquet_available():
+    BENCHMARKS["load_index_parquet"] = (setup_load_index_parquet, run_load_index)
+    BENCHMARKS["find_changes_parquet"] = (setup_find_changes_parquet, run_find_changes)
+
+if pdf_covers.pdf_rendering_available():
+    BENCHMARKS["render_pdf_cover"] = (setup_render_pdf_cover, run_render_pdf_cover)
+
+# Time a benchmark, returns the times of each run after the warm up run
+def time_benchmark(name, work_dir, repeat):
+    (setup, run) = BENCHMARKS[name]
+    args = setup(work_dir)
+
+    run(*args)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run(*args)
+        times.append(time.perf_counter() - start)
+
+    return times
+
+def load_baselines(baselines_file):
+    try:
+        with open(baselines_file, 'r', encoding="utf-8") as file:
+            data = json.load(file)
+    except (IOError, ValueError):
+        return {}
+
+    # Timings for other sizes can't be compared
+    return data.get("Benchmarks", {}) if data.get("Sizes") == SIZES else {}
+
+def save_baselines(baselines_file, results):
+    data = {
+        "Machine":      platform.node(),
+        "Python":       platform.python_version(),
+        "Sizes":        SIZES,
+        "Benchmarks":   {name: {"Seconds": min(times)} for (name, times) in results.items()}
+    }
+    with open(baselines_file, 'w', encoding="utf-8") as file:
+        json.dump(data, file, indent=4)
+
+# Run the benchmarks, returns the names of the ones that regressed
+def run_suite(names, repeat=5, threshold=0.2, save=False, baselines_file=BASELINES_FILE):
+    baselines = load_baselines(baselines_file)
+    results = {}
+    regressions = []
+
+    print(f"Running {len(names)} benchmarks ({repeat} runs each, regression threshold {threshold:.0%})")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        use_settings(Path(temp_dir))
+        for name in names:
+            times = time_benchmark(name, Path(temp_dir), repeat)
+            results[name] = times
+
+            best = min(times)
+            line = f"\t==> {name:25}: {best:8.4f}s (median {statistics.median(times):8.4f}s)"
+            baseline = baselines.get(name)
+            if baseline:
+                change = best / baseline["Seconds"] - 1
+                line += f"  baseline {baseline['Seconds']:8.4f}s {change:+7.1%}"
+                if change > threshold:
+                    line += "  REGRESSION"
+                    regressions.append(name)
+            else:
+                line += "  no baseline"
+            print(line)
+
+    if save:
+        save_baselines(baselines_file, {**{name: [b["Seconds"]] for (name, b) in baselines.items()}, **results})
+        print(f"\nBaselines saved: {baselines_file}")
+
+    return regressions
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the archiver hot paths against saved baselines.")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), metavar="NAME",
+                        help="Benchmarks to run: " + ", ".join(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs of each benchmark (default 5)")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Slowdown over the baseline that fails the suite (default 0.2 = 20%%)")
+    parser.add_argument("--save", action="store_true", help="Save the timings as the new baselines")
+    parser.add_argument("--baselines", type=Path, default=BASELINES_FILE, help="Baselines file")
+    return parser
+
+def main():
+    args = get_args_parser().parse_args()
+    regressions = run_suite(args.only or list(BENCHMARKS), args.repeat, args.threshold, args.save, args.baselines)
+    if regressions and not args.save:
+        print(f"\n{len(regressions)} benchmarks regressed: {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,12 @@
-import gspread
-import pandas as pd
 from mti.mti_config import MTIDataKey, mticonfig
 from googlemti import gspread_client, google_util
+from mti import index_snapshots, index_store
+from mti.lazy_imports import lazy_import
 from pathlib import Path
 
+gspread = lazy_import("gspread")
+pd = lazy_import("pandas")
+
 def load_csv_files():   
     last_idx_gen_dt		= mticonfig.exe_details.get(MTIDataKey.LAST_IDX_GEN_FILE_DT)
     last_idx_load_dt	= mticonfig.exe_details.get(MTIDataKey.LAST_IDX_LOAD_FILE_DT)
@@ -12,8 +15,8 @@ def load_csv_files():
     if (last_idx_gen_dt and last_idx_gen_dt == last_idx_run_dt):
         # Get file paths based on last index generated date
         file_prefix = f'{mticonfig.output_dir}/{mticonfig.archive_key}_{last_idx_gen_dt}'
-        last_idx_output_file = Path(file_prefix + '_Index.csv')
-        last_idx_error_file  = Path(file_prefix + '_Index_Error.csv')
+        last_idx_output_file = index_snapshots.get_snapshot_file(file_prefix + '_Index.csv')
+        last_idx_error_file  = index_snapshots.get_snapshot_file(file_prefix + '_Index_Error.csv')
         last_idx_new_file    = Path(file_prefix + '_Index_New.csv')
                 
         print("Updating Google Sheet, please wait ...")
@@ -21,8 +24,15 @@ def load_csv_files():
         # Get existing google sheet for collection
         spreadsheet = gspread_client.get_archiver_report_sheet()
 
+        # With the index store on, the new documents are the ones the loader will load
+        # (see index_store), exported from the store
+        if (index_store.is_enabled() and
+            index_store.get_index_store().get_latest_run_id(mticonfig.archive_key) is not None):
+            tab_name    = mticonfig.doct_name + "-New"
+            load_csv_file(spreadsheet, tab_name, export_not_loaded(file_prefix))
+
         # If index was never loaded, load only the current index as new
-        if (not last_idx_load_dt):
+        elif (not last_idx_load_dt):
             tab_name    = mticonfig.doct_name + "-New"
             load_csv_file(spreadsheet, tab_name, last_idx_output_file)
         
@@ -44,9 +54,19 @@ def load_csv_files():
               f"Index Date : {last_idx_gen_dt} (Verify in Google Sheets Summary Tab) ")
         print(f"Google Sheet successfully updated.")
 
+# Export the documents not loaded yet from the index store to a CSV file
+def export_not_loaded(file_prefix):
+    store = index_store.get_index_store()
+    not_loaded_file = Path(file_prefix + '_Not_Loaded.csv')
+    index_store.export_csv(store.get_not_loaded(mticonfig.archive_key), mticonfig.doct_name, not_loaded_file)
+    return not_loaded_file
+
 def load_csv_file(sheet, tab, file, delimiter=","):
-    # Load CSV File into Pandas DataFrame
-    df = pd.read_csv(file, dtype=str, delimiter=delimiter)
+    # Load CSV File (or Parquet index snapshot) into Pandas DataFrame
+    if index_snapshots.is_parquet(file):
+        df = index_snapshots.read_snapshot(file)
+    else:
+        df = pd.read_csv(file, dtype=str, delimiter=delimiter)
 
     # Replace NaN values with an empty string
     df.fillna("", inplace=True) 
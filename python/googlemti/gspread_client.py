@@ -1,6 +1,8 @@
-import gspread
-from google.oauth2.service_account import Credentials
 from mti.mti_config import mticonfig
+from mti.lazy_imports import lazy_import
+
+gspread = lazy_import("gspread")
+service_account = lazy_import("google.oauth2.service_account")
 
 #TODO: Is this best way to create a singleton client?
 # Global variable to hold the gspread client instance
@@ -13,7 +15,7 @@ def get_gspread_client():
         keyfile = mticonfig.ini['Google']['ServiceAccountKeyFile']
 
         # Authenticate using the Service Account JSON key file
-        creds = Credentials.from_service_account_file(keyfile,
+        creds = service_account.Credentials.from_service_account_file(keyfile,
             scopes=["https://www.googleapis.com/auth/spreadsheets",
                     "https://www.googleapis.com/auth/drive"]
         )
@@ -0,0 +1,104 @@
+'''
+The archiver state is the details of each archive's last runs (index generated, loaded to
+WordPress and Google) and the summary of the last program run. It was kept in
+mtiarchiver.json, rewritten in full on every save, so two archives run at the same time
+(e.g. a scheduled loader run while the watcher indexes) overwrote each other's details,
+and a crash while saving could leave a half written file.
+
+The state is now kept in a SQLite database (mtiarchiver.db in the ScriptDataFolder), one
+row per key of the old JSON document (each archive key and the summary). A save only
+writes the rows that changed since they were loaded or last saved, in one transaction
+holding SQLite's write lock on the database file, so each run only writes its own archive
+and a save either happens in full or not at all.
+
+The first time the database is opened, the rows are imported from mtiarchiver.json if it
+exists (the JSON file is left as it is).
+'''
+import json, os, sqlite3
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS archiver_state (
+    key             TEXT PRIMARY KEY,
+    value           TEXT NOT NULL
+);
+'''
+
+# Seconds to wait for another run's save to finish before giving up
+LOCK_TIMEOUT = 30
+
+class ArchiverStateError(Exception):
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+class ArchiverState:
+
+    def __init__(self, db_file, json_file=None):
+        self.db_file = db_file
+        self.json_file = json_file
+
+        # Values as last loaded or saved, to only save the rows that changed
+        self.saved = {}
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_file, timeout=LOCK_TIMEOUT, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        return conn
+
+    # Load the state of every archive. Returns the data as in the JSON document, and
+    # whether there was any state to load.
+    def load(self):
+        try:
+            conn = self.connect()
+            try:
+                rows = conn.execute("SELECT key, value FROM archiver_state").fetchall()
+                if not rows and self.json_file and os.path.exists(self.json_file):
+                    rows = self.import_json(conn)
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            raise ArchiverStateError(f"Unable to load the archiver state from {self.db_file} ({e}).") from e
+
+        self.saved = {key: value for (key, value) in rows}
+        return ({key: json.loads(value) for (key, value) in rows}, len(rows) > 0)
+
+    # Save the keys of data that changed, returns the number of keys saved
+    def save(self, data):
+        rows = [(key, json.dumps(value)) for (key, value) in data.items()]
+        changed = [(key, value) for (key, value) in rows if self.saved.get(key) != value]
+        if not changed:
+            return 0
+
+        try:
+            conn = self.connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany('''
+                    INSERT INTO archiver_state (key, value) VALUES (?, ?)
+                    ON CONFLICT (key) DO UPDATE SET value = excluded.value
+                    ''', changed)
+                conn.execute("COMMIT")
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            raise ArchiverStateError(f"Unable to save the archiver state to {self.db_file} ({e}).") from e
+
+        self.saved.update(changed)
+        return len(changed)
+
+    # Import the rows from the JSON file the state was kept in before
+    def import_json(self, conn):
+        try:
+            with open(self.json_file, 'r') as file:
+                data = json.load(file)
+        except (IOError, ValueError):
+            return []
+
+        rows = [(key, json.dumps(value)) for (key, value) in data.items()]
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany("INSERT OR IGNORE INTO archiver_state (key, value) VALUES (?, ?)", rows)
+        conn.execute("COMMIT")
+        print(f"Archiver data imported from {self.json_file}")
+
+        return conn.execute("SELECT key, value FROM archiver_state").fetchall()
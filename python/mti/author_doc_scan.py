@@ -1,20 +1,24 @@
 import os, csv, re
-from titlecase import titlecase
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from mti.mti_config import MTIConfig, mticonfig
-from mti.cover_generator import generate_cover
+from mti.cover_generator import CoverPool, generate_cover, get_cover_file_name
+from mti import doc_name_parser, pdf_covers
+from mti.lazy_imports import lazy_import
 from wordpressmti.wbg_book_post import WPGBook
 from tqdm import tqdm
 
+# Imported when first used, as doc_hasher imports the index readers, which import the scan
+doc_hasher = lazy_import("mti.doc_hasher")
+
 class DocError(Exception):
    def __init__(self, message):
         self.message = message
         super().__init__(self.message)
 
-idx_debug = []
-
 # This processes only selected author folders for a given folders_path
 def process_selected_author_folders(folders_path, author_list, doct_name, 
-                                    index_csv, idx_debug_file, index_error_csv, debug=False):
+                                    index_csv, idx_debug_file, index_error_csv, debug=False, scan_threads=None, manifest=None):
 
     author_folders = [
         folder for folder in os.scandir(folders_path) 
@@ -22,87 +26,61 @@ def process_selected_author_folders(folders_path, author_list, doct_name,
         ]
 
     return process_author_folders(folders_path, author_folders, doct_name, 
-                                  index_csv, idx_debug_file, index_error_csv, debug)
+                                  index_csv, idx_debug_file, index_error_csv, debug, scan_threads, manifest)
 
 # This processes all author folders for a given folders_path
 def process_all_author_folders(folders_path, doct_name, 
-                               index_csv, idx_debug_file, index_error_csv, debug=False):
+                               index_csv, idx_debug_file, index_error_csv, debug=False, scan_threads=None, manifest=None):
     author_folders = list(os.scandir(folders_path))
     return process_author_folders(folders_path, author_folders, doct_name, 
-                                  index_csv, idx_debug_file, index_error_csv, debug)
+                                  index_csv, idx_debug_file, index_error_csv, debug, scan_threads, manifest)
 
+# If a ScanManifest is passed, author folders unchanged since the last run reuse their
+# cached results and the manifest is updated with the folders scanned in this run.
 def process_author_folders(folders_path, author_folders, doct_name, 
-                           index_csv, idx_debug_file, index_error_csv, debug=False):
-    idx_debug = []
-    idx_data = []
-    idx_error = []
-
+                           index_csv, idx_debug_file, index_error_csv, debug=False, scan_threads=None, manifest=None):
     authors_processed_count = 0
     document_processed_count = 0
     authors_skipped_count = 0
     document_skipped_count = 0
     error_count = 0
+    authors_cached_count = 0
 
     doct_name = MTIConfig.tosingular(doct_name)
+
+    if scan_threads is None:
+        scan_threads = get_scan_threads()
+
+    # The cover settings are read once for the run, not for each document
+    cover_options = get_cover_options()
     
-    for author_folder in tqdm(author_folders, desc="  Processing"):
-        if author_folder.is_dir():
-            
-            idx_debug.append("==========================================================================================================================")
-            idx_debug.append(f"Processing Author Folder > [{author_folder.name}]")
-            idx_debug.append("==========================================================================================================================")
-            
-            match = re.match(r"^([A-Za-z0-9.-]+)(?:_([A-Za-z0-9.-]+))?_([A-Za-z0-9.'`-]+|of_[A-Za-z0-9.'`-]+|D(?:a|e)_(?:[A-Za-z0-9.'`-]+|La_[A-Za-z0-9.'`-]+))$", author_folder.name)
-            
-            if match:
-                authors_processed_count += 1
-                
-                firstname, middlename, lastname = match.groups()
-                middlename = middlename if middlename else ""
-                
-                #print(f"[{firstname}][{middlename}][{lastname}]")
-                
-                for doc_file in scan_recursive(author_folder.path):
-                    if doc_file.is_file():                        
-                        debug_msg = f"==== Processing File ==> [{doc_file.name}]"
-                        idx_debug.append(debug_msg)
-                        debug_idx = len(idx_debug) - 1
-                        
-                        try:
-                            doc_record = create_doc_record(folders_path, doct_name, doc_file, firstname, middlename, lastname)                           
-
-                            if (len(doc_record) > 0):
-                                idx_data.append(doc_record)
-                                document_processed_count += 1
-                            
-                            idx_debug[debug_idx] = debug_msg.replace("====", "[OK]")
-                        except DocError as de:                                 
-                            idx_debug.append(f"    <<<<<  ERROR!  >>>> {de.message}")
-                            idx_error.append({"Author Directory":author_folder.name, "File Name":doc_file.name, "Error":de.message})
-                            document_skipped_count += 1
-                            error_count += 1
-            else:
-                authors_skipped_count += 1
-                error_count += 1
-                idx_debug.append(f"==    <<< FOLDER ERROR >>> [{author_folder.name}]: Name does not match regex pattern for author")
-                idx_error.append({"Author Directory":author_folder.name,"Error":"Folder does not appear to be an author name"})
+    # Folder scans are returned in the same order as the author folders, even when
+    # scanned in parallel, so the index files are the same as a serial scan. Missing
+    # covers are generated by the cover pool while the scan carries on.
+    #
+    # Each folder scan is written out as soon as it is done (and its covers generated)
+    # instead of being kept until the end, so a run that fails midway still leaves a
+    # partial index
+    with CoverPool(get_cover_processes()) as cover_pool, \
+         IndexWriter(doct_name, index_csv, index_error_csv, idx_debug_file if debug else None) as idx_writer:
+        folder_scans = wait_for_covers(scan_author_folders(folders_path, author_folders, doct_name, scan_threads, manifest, cover_pool, cover_options))
+        for folder_scan in tqdm(folder_scans, total=len(author_folders), desc="  Processing"):
+            authors_processed_count     += folder_scan.authors_processed_count
+            document_processed_count    += folder_scan.document_processed_count
+            authors_skipped_count       += folder_scan.authors_skipped_count
+            document_skipped_count      += folder_scan.document_skipped_count
+            error_count                 += folder_scan.error_count
+
+            # Files are only created once there is an author folder to report on
+            if (folder_scan.authors_processed_count + folder_scan.authors_skipped_count) > 0:
+                idx_writer.write(folder_scan)
+
+            if (manifest and folder_scan.from_cache):
+                authors_cached_count    += 1
+            elif (manifest and folder_scan.dir_mtimes):
+                manifest.update(folder_scan.author_folder, folder_scan.to_manifest_entry())
     
     if (authors_processed_count + authors_skipped_count) > 0:
-        with open(index_csv, "w", newline="", encoding="utf-8") as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=get_fieldnames(doct_name))
-            writer.writeheader()
-            writer.writerows(idx_data)
-
-        with open(index_error_csv, "w", newline="", encoding="utf-8") as csvfile:
-            fieldnames = ["Author Directory", "File Name", "Error"]
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(idx_error)
-
-        if debug:
-            with open(idx_debug_file, "w", encoding="utf-8") as file:
-                file.writelines(line + "\n" for line in idx_debug)
-        
         print("\nIndexing Summary (Python)")
         print(f"\t==> Author Folders Processed: {authors_processed_count}")
         print(f"\t==>     Documents Identified: {document_processed_count}")
@@ -110,19 +88,337 @@ def process_author_folders(folders_path, author_folders, doct_name,
         print(f"\t==>")
         print(f"\t==> Author Folders Skipped : {authors_skipped_count}")
         print(f"\t==> Errors Encountered     : {error_count}")
+        if manifest:
+            print(f"\t==> Author Folders Unchanged: {authors_cached_count} (reused from earlier scan)")
     else:
         print("\nIndexing Summary (Python)")
         print(f"\t==> Author Folders Processed: 0") 
 
     return authors_processed_count  
 
+# Writes the index, error and debug files as author folders are scanned. The files are
+# opened on the first write and flushed after each author folder.
+class IndexWriter:
+    def __init__(self, doct_name, index_csv, index_error_csv, idx_debug_file=None):
+        self.doct_name = doct_name
+        self.index_csv = index_csv
+        self.index_error_csv = index_error_csv
+        self.idx_debug_file = idx_debug_file
+        self.files = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self):
+        index_file = open(self.index_csv, "w", newline="", encoding="utf-8")
+        self.files.append(index_file)
+        self.index_writer = csv.DictWriter(index_file, fieldnames=get_fieldnames(self.doct_name))
+        self.index_writer.writeheader()
+
+        error_file = open(self.index_error_csv, "w", newline="", encoding="utf-8")
+        self.files.append(error_file)
+        self.error_writer = csv.DictWriter(error_file, fieldnames=["Author Directory", "File Name", "Error"])
+        self.error_writer.writeheader()
+
+        self.debug_file = None
+        if self.idx_debug_file:
+            self.debug_file = open(self.idx_debug_file, "w", encoding="utf-8")
+            self.files.append(self.debug_file)
+
+    def write(self, folder_scan):
+        if not self.files:
+            self.open()
+
+        self.index_writer.writerows(folder_scan.idx_data)
+        self.error_writer.writerows(folder_scan.idx_error)
+        if self.debug_file:
+            self.debug_file.writelines(line + "\n" for line in folder_scan.idx_debug)
+
+        for file in self.files:
+            file.flush()
+
+    def close(self):
+        for file in self.files:
+            file.close()
+        self.files = []
+
+# Get the number of threads to scan author folders with. Scanning is mostly waiting
+# on the file system (especially on a network share), so threads help even with the GIL.
+def get_scan_threads():
+    return max(1, mticonfig.ini['Settings'].getint('ScanThreads', fallback=1))
+
+# GenerateCover is True, False or Lazy. Lazy covers are not generated by the indexer,
+# which only records the name the cover will have, they are generated by the WordPress
+# loader for the documents it loads (see wp_loader_main.generate_pending_cover).
+LAZY_COVERS = "Lazy"
+
+def get_generate_cover():
+    value = mticonfig.ini['Settings'].get('GenerateCover', fallback='False').strip()
+    return LAZY_COVERS if value.lower() == LAZY_COVERS.lower() else value.lower() == 'true'
+
+# CoverSource is Text (the title and author card) or PDF (the first page of the document,
+# see pdf_covers). Returns the PdfCover to make the covers with, None for the card.
+def get_pdf_cover():
+    if mticonfig.ini['Settings'].get('CoverSource', fallback='Text').strip().lower() != 'pdf':
+        return None
+
+    if not pdf_covers.pdf_rendering_available():
+        warn_once("WARNING: pypdfium2 is not installed, covers are generated from the title and author.")
+        return None
+
+    return pdf_covers.PdfCover(os.path.join(mticonfig.data_dir, 'pdf_cover_cache'),
+                               digest_cache_file=doc_hasher.get_cache_file())
+
+# How the scan makes missing covers, read from settings once per run
+class CoverOptions:
+    def __init__(self, generate_cover_mode, pdf_cover):
+        self.generate_cover_mode = generate_cover_mode
+        self.pdf_cover = pdf_cover
+
+def get_cover_options():
+    generate_cover_mode = get_generate_cover()
+    return CoverOptions(generate_cover_mode, get_pdf_cover() if generate_cover_mode else None)
+
+# The cover settings the index depends on, cached scan results are only reused for the same
+def get_cover_settings():
+    generate_cover_mode = get_generate_cover()
+    return [generate_cover_mode, "PDF"] if generate_cover_mode and get_pdf_cover() else generate_cover_mode
+
+warnings_shown = set()
+
+def warn_once(message):
+    if message not in warnings_shown:
+        warnings_shown.add(message)
+        print(message)
+
+# Get the number of processes generating missing covers (1 = in the scan threads)
+def get_cover_processes():
+    return max(1, mticonfig.ini['Settings'].getint('CoverProcesses', fallback=os.cpu_count() or 1))
+
+# Scan the author folders, yielding the AuthorFolderScan for each folder in the order
+# of author_folders. When scan_threads > 1 the folders are scanned by a thread pool,
+# with only a few folders queued ahead so finished scans don't pile up in memory.
+def scan_author_folders(folders_path, author_folders, doct_name, scan_threads=1, manifest=None, cover_pool=None, cover_options=None):
+    if scan_threads > 1:
+        with ThreadPoolExecutor(max_workers=scan_threads) as executor:
+            pending = deque()
+            for author_folder in author_folders:
+                pending.append(executor.submit(scan_author_folder, folders_path, author_folder, doct_name, manifest, cover_pool, cover_options))
+                if len(pending) >= scan_threads * 2:
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
+    else:
+        for author_folder in author_folders:
+            yield scan_author_folder(folders_path, author_folder, doct_name, manifest, cover_pool, cover_options)
+
+# Folder scans kept waiting on their covers while the folders after them are scanned
+COVER_LOOK_AHEAD = 64
+
+# Yield the folder scans in order once the covers generated for them are done, without
+# holding up the scan of the folders after them. Once look_ahead scans are waiting, the
+# scan waits for the covers of the first one, so the scans waiting don't pile up in memory.
+def wait_for_covers(folder_scans, look_ahead=COVER_LOOK_AHEAD):
+    pending = deque()
+    for folder_scan in folder_scans:
+        pending.append(folder_scan)
+        if len(pending) >= look_ahead:
+            pending[0].wait_for_covers()
+        while pending and pending[0].covers_done():
+            yield pending.popleft()
+
+    while pending:
+        folder_scan = pending.popleft()
+        folder_scan.wait_for_covers()
+        yield folder_scan
+
+# Index results for a single author folder
+class AuthorFolderScan:
+    def __init__(self, author_folder=""):
+        self.author_folder = author_folder
+        self.idx_debug = []
+        self.idx_data = []
+        self.idx_error = []
+
+        self.authors_processed_count = 0
+        self.document_processed_count = 0
+        self.authors_skipped_count = 0
+        self.document_skipped_count = 0
+        self.error_count = 0
+
+        # Modified times of the folders scanned and size/modified time of the files found,
+        # keyed by path relative to the base path, for the scan manifest
+        self.dir_mtimes = {}
+        self.file_stats = {}
+        self.from_cache = False
+
+        # Covers being generated for the documents found (see CoverJobs)
+        self.cover_jobs = None
+
+    def covers_done(self):
+        return self.cover_jobs is None or self.cover_jobs.done()
+
+    def wait_for_covers(self):
+        if self.cover_jobs:
+            self.cover_jobs.wait()
+
+    def to_manifest_entry(self):
+        return {
+            "Dirs":     self.dir_mtimes,
+            "Files":    self.file_stats,
+            "Records":  self.idx_data,
+            "Errors":   self.idx_error,
+            "Counts":   [self.authors_processed_count, self.document_processed_count,
+                         self.authors_skipped_count, self.document_skipped_count, self.error_count]
+        }
+
+    @staticmethod
+    def from_manifest_entry(author_folder, entry):
+        folder_scan = AuthorFolderScan(author_folder)
+        folder_scan.dir_mtimes  = entry["Dirs"]
+        folder_scan.file_stats  = entry["Files"]
+        folder_scan.idx_data    = entry["Records"]
+        folder_scan.idx_error   = entry["Errors"]
+        folder_scan.idx_debug   = [
+            "==========================================================================================================================",
+            f"Processing Author Folder > [{author_folder}]",
+            "==========================================================================================================================",
+            "==    Unchanged since the last scan, results reused"
+        ]
+        (folder_scan.authors_processed_count, folder_scan.document_processed_count,
+         folder_scan.authors_skipped_count, folder_scan.document_skipped_count,
+         folder_scan.error_count) = entry["Counts"]
+        folder_scan.from_cache  = True
+
+        return folder_scan
+
+def scan_author_folder(folders_path, author_folder, doct_name, manifest=None, cover_pool=None, cover_options=None):
+    # Reuse the last scan if the author folder has not changed
+    if manifest:
+        entry = manifest.get_cached(author_folder)
+        if entry:
+            return AuthorFolderScan.from_manifest_entry(author_folder.name, entry)
+
+    folder_scan = AuthorFolderScan(author_folder.name)
+    idx_debug = folder_scan.idx_debug
+
+    if author_folder.is_dir():
+        
+        idx_debug.append("==========================================================================================================================")
+        idx_debug.append(f"Processing Author Folder > [{author_folder.name}]")
+        idx_debug.append("==========================================================================================================================")
+        
+        # Get the folder time before listing it, so changes made during the scan are picked
+        # up by the next one. Skipped folders are recorded too so they are not rescanned.
+        folder_scan.dir_mtimes[author_folder.name] = author_folder.stat().st_mtime_ns
+
+        match = re.match(r"^([A-Za-z0-9.-]+)(?:_([A-Za-z0-9.-]+))?_([A-Za-z0-9.'`-]+|of_[A-Za-z0-9.'`-]+|D(?:a|e)_(?:[A-Za-z0-9.'`-]+|La_[A-Za-z0-9.'`-]+))$", author_folder.name)
+        
+        if match:
+            folder_scan.authors_processed_count += 1
+            
+            firstname, middlename, lastname = match.groups()
+            middlename = middlename if middlename else ""
+            
+            #print(f"[{firstname}][{middlename}][{lastname}]")
+
+            # Cover file lookups for each document folder, so each folder is only listed once
+            cover_index = CoverIndex()
+            folder_scan.cover_jobs = cover_pool.new_jobs() if cover_pool else None
+
+            doc_files = []
+            for doc_file in scan_recursive(author_folder.path):
+                if is_scanned_dir(doc_file):
+                    folder_scan.dir_mtimes[os.path.relpath(doc_file.path, folders_path)] = doc_file.stat().st_mtime_ns
+                elif doc_file.is_file():                        
+                    doc_stat = doc_file.stat()
+                    folder_scan.file_stats[os.path.relpath(doc_file.path, folders_path)] = [doc_stat.st_size, doc_stat.st_mtime_ns]
+                    doc_files.append(doc_file)
+
+            for doc_file in doc_files:
+                parsed_name = doc_name_parser.parse_doc_name(doct_name, doc_file.name)
+                debug_msg = f"==== Processing File ==> [{doc_file.name}]"
+                idx_debug.append(debug_msg)
+                debug_idx = len(idx_debug) - 1
+                
+                try:
+                    doc_record = create_doc_record(folders_path, doct_name, doc_file, firstname, middlename, lastname, cover_index, idx_debug, parsed_name, folder_scan.cover_jobs, cover_options)
+
+                    if (len(doc_record) > 0):
+                        folder_scan.idx_data.append(doc_record)
+                        folder_scan.document_processed_count += 1
+                    
+                    idx_debug[debug_idx] = debug_msg.replace("====", "[OK]")
+                except DocError as de:                                 
+                    idx_debug.append(f"    <<<<<  ERROR!  >>>> {de.message}")
+                    folder_scan.idx_error.append({"Author Directory":author_folder.name, "File Name":doc_file.name, "Error":de.message})
+                    folder_scan.document_skipped_count += 1
+                    folder_scan.error_count += 1
+        else:
+            folder_scan.authors_skipped_count += 1
+            folder_scan.error_count += 1
+            idx_debug.append(f"==    <<< FOLDER ERROR >>> [{author_folder.name}]: Name does not match regex pattern for author")
+            folder_scan.idx_error.append({"Author Directory":author_folder.name,"Error":"Folder does not appear to be an author name"})
+
+    return folder_scan
+
 def scan_recursive(path):
     with os.scandir(path) as entries:
         for entry in entries:
             yield entry
-            if entry.is_dir(follow_symlinks=False) and "DO NOT LOAD" not in entry.name.upper() :
+            if is_scanned_dir(entry):
                 yield from scan_recursive(entry.path)
 
+# Sub-folders marked "DO NOT LOAD" are skipped by the scan
+def is_scanned_dir(entry):
+    return entry.is_dir(follow_symlinks=False) and "DO NOT LOAD" not in entry.name.upper()
+
+
+# Index of the cover files in each document folder. Each folder is listed only once,
+# and every "_cover" file is keyed by its upper cased name up to (and including) each
+# "_COVER" in it. Looking up a cover is then a single dict lookup instead of a scan
+# of the folder, which matters for folders with thousands of letters on a network share.
+class CoverIndex:
+    COVER_TAG = "_COVER"
+
+    def __init__(self):
+        self.folders = {}
+
+    def find(self, doc_folder, cover_file_name):
+        return self.get_folder_index(doc_folder).get(cover_file_name.upper(), "")
+
+    # Add a file to the index (e.g. a newly generated cover)
+    def add(self, doc_folder, file_name):
+        if file_name:
+            CoverIndex.index_file(self.get_folder_index(doc_folder), file_name)
+
+    def get_folder_index(self, doc_folder):
+        folder_index = self.folders.get(doc_folder)
+        if folder_index is None:
+            folder_index = {}
+            with os.scandir(doc_folder) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        CoverIndex.index_file(folder_index, entry.name)
+            self.folders[doc_folder] = folder_index
+
+        return folder_index
+
+    # Key the file by every prefix ending in "_COVER", keeping the first file listed
+    # for a prefix, which is the same file the old startswith() scan would pick
+    @staticmethod
+    def index_file(folder_index, file_name):
+        upper_name = file_name.upper()
+        pos = upper_name.find(CoverIndex.COVER_TAG)
+        while pos >= 0:
+            end = pos + len(CoverIndex.COVER_TAG)
+            folder_index.setdefault(upper_name[:end], file_name)
+            pos = upper_name.find(CoverIndex.COVER_TAG, end)
+
 
 def get_fieldnames(doct_name):
     fieldnames = [
@@ -148,29 +444,45 @@ def get_fieldnames(doct_name):
     return fieldnames
 
 
-def create_doc_record(folders_path, doct_name, doc_file, firstname, middlename, lastname):
+# If the parsed_name is not passed in, the document file name is parsed here. If
+# cover_jobs is passed, missing covers are generated by the cover pool. If cover_options
+# is not passed in, the cover settings are read here.
+def create_doc_record(folders_path, doct_name, doc_file, firstname, middlename, lastname, cover_index=None, idx_debug=None, parsed_name=None, cover_jobs=None, cover_options=None):
     doc_record = {}
+    if cover_index is None: cover_index = CoverIndex()
+    if parsed_name is None: parsed_name = doc_name_parser.parse_doc_name(doct_name, doc_file.name)
     
-    #match = re.match(r"^(.*?)_", book_file.name) #matches first '_'
-    match = re.match(r"^(.+)_([^_]*)$", doc_file.name)
-    if match and "_cover" not in doc_file.name:
+    if parsed_name.is_doc:
 
         # Get the doc folder, the reason this is not the folders_path, is that it
         # could be a subfolder under the author folder, such as for letters
         doc_folder = os.path.dirname(doc_file.path)
                             
-        title = titlecase(match.group(1).replace('-', ' '))
-        cover_file_name = match.group(1) + "_cover"
-        cover_file = next((f.name for f in os.scandir(doc_folder) 
-            if f.is_file() and f.name.upper().startswith(cover_file_name.upper())), "")        
+        title = parsed_name.full_title
+        cover_file_name = parsed_name.stem + "_cover"
+        cover_file = cover_index.find(doc_folder, cover_file_name)
         if (len(cover_file) == 0):
-            if (mticonfig.bool_flag('Settings','GenerateCover')):
+            if cover_options is None: cover_options = get_cover_options()
+            generate_cover_mode = cover_options.generate_cover_mode
+            pdf_cover = cover_options.pdf_cover
+            if (generate_cover_mode == LAZY_COVERS):
+                cover_file = get_cover_file_name(cover_file_name, pdf_cover is not None)
+                if idx_debug is not None:
+                    idx_debug.append(f"==    Cover Pending: {cover_file}")
+            elif (generate_cover_mode):
                 #This may not be the best place to generate book cover, but it was the easiest                
                 author_name  = WPGBook.get_author(firstname, middlename, lastname)
-                cover_file = generate_cover(title, author_name, doc_folder, cover_file_name)
-                idx_debug.append(f"==    Generated Cover File: {cover_file}") 
+                generate = cover_jobs.generate_cover if cover_jobs else generate_cover
+                cover_file = generate(title, author_name, doc_folder, cover_file_name, pdf_cover, doc_file.path)
+                cover_index.add(doc_folder, cover_file)
+                if idx_debug is not None:
+                    idx_debug.append(f"==    Generated Cover File: {cover_file}") 
             else:
                 raise DocError(f"{doct_name} cover file not found, check if missing or improperly named.")                        
+
+        # Check the document name has the expected parts (date, periodical, title, etc)
+        if parsed_name.error:
+            raise DocError(parsed_name.error)
                             
         # Get the path for file relative to the base path, in most cases this
         # will be the author folder, but for letters this could also be a subfolder of 
@@ -190,45 +502,8 @@ def create_doc_record(folders_path, doct_name, doc_file, firstname, middlename,
             "Base Path": folders_path
         }
 
-        doc_record = add_doc_details(doct_name, doc_record)
-    elif all(substr not in doc_file.name.lower() for substr in ["_cover", "thumbs.db"]):
-        raise DocError(f"{doct_name} not properly named. Title does not match regex pattern.")
-
-    return doc_record
-    
-def add_doc_details(doct_name, doc_record):
-    # Determine if document name includes expected parts (date, periodical, title, etc)
-    # (e.g. Article is Date_Peridical_Title, Letter is Date_Title, Book is Title)
-    expected_num_parts = {
-        'Article': 3,
-        'Journal': 3,    
-        'Letter': 2,
-        'Dissertation': 2,        
-        'Book': 1
-    }
-
-    title = doc_record.get(f'{doct_name} Title')
-    parts = title.split('_')
-
-    if len(parts) > expected_num_parts.get(doct_name):
-        raise DocError(f"{doct_name} file not properly named, too many underscores.")
-    elif len(parts) < expected_num_parts.get(doct_name):
-        raise DocError(f"{doct_name} file not properly named, too few underscores.")
-
-    if (doct_name == 'Article' or doct_name == 'Journal'):
-        date, periodical, title, *_ = tuple(parts)
-
-        doc_record.update({
-            "Date":date.replace(" ", "-"),
-            "Periodical":periodical,
-            f"{doct_name} Title":title
-        })
-    elif (doct_name == 'Letter' or doct_name == 'Dissertation'):
-        date, title = tuple(parts)
-
-        doc_record.update({
-            "Date":date.replace(" ", "-"),
-            f"{doct_name} Title":title
-        })
+        doc_record = parsed_name.add_details(doct_name, doc_record)
+    elif parsed_name.error:
+        raise DocError(parsed_name.error)
 
     return doc_record
@@ -1,5 +1,5 @@
 import csv
-from mti import author_doc_scan
+from mti import author_doc_scan, index_snapshots
 
 def read_csv_file(doct_name, file_path):
     """
@@ -7,19 +7,27 @@ def read_csv_file(doct_name, file_path):
     book title, book file path, book cover image file path.
 
     Args:
-        file_path (str): Path to the CSV file to be read.
+        file_path (str): Path to the CSV file (or Parquet index snapshot) to be read.
 
     Yields:
         dict: A dictionary containing the data for a row.
     """
+    if index_snapshots.is_parquet(file_path):
+        records = index_snapshots.read_records(file_path)
+        check_columns(doct_name, index_snapshots.read_header(file_path))
+        yield from records
+        return
+
     with open(file_path, mode='r', encoding='utf-8') as csv_file:
         csv_reader = csv.DictReader(csv_file)
         # Ensure the CSV has the expected columns
-            
-        expected_columns = author_doc_scan.get_fieldnames(doct_name)
-        if csv_reader.fieldnames is None or any(col not in csv_reader.fieldnames for col in expected_columns):
-            raise ValueError(f"CSV file must contain the following columns: {', '.join(expected_columns)}")
+        check_columns(doct_name, csv_reader.fieldnames)
 
         for row in csv_reader:
             yield row
 
+def check_columns(doct_name, fieldnames):
+    expected_columns = author_doc_scan.get_fieldnames(doct_name)
+    if fieldnames is None or any(col not in fieldnames for col in expected_columns):
+        raise ValueError(f"CSV file must contain the following columns: {', '.join(expected_columns)}")
+
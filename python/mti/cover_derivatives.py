@@ -0,0 +1,155 @@
+'''
+Cover derivatives are the covers as they are uploaded to WordPress: scaled down to the
+width the site shows them at and encoded as JPEG or WebP, instead of the original files
+(scans of several MB for some), and uploaded with the MIME type of what is uploaded.
+
+Derivatives are cached on disk (cover_cache in the ScriptDataFolder), keyed by the hash
+of the source cover and the size, format and quality they are made with, so a cover is
+only encoded once however many times it is uploaded, and renaming or moving a cover
+doesn't encode it again. A derivative that isn't smaller than its source is not used
+(e.g. the generated covers, which are small PNGs), the source is uploaded.
+
+    Settings in [WordPress]:
+        CoverFormat=WebP        WebP, JPEG or Original (upload the cover files as they are)
+        CoverWidth=600          Covers wider than this are scaled down to it
+        CoverQuality=80         Encoder quality (1-100)
+'''
+import mimetypes, os
+from pathlib import Path
+from mti.mti_config import mticonfig
+from mti.lazy_imports import lazy_import
+
+Image = lazy_import("PIL.Image")
+
+# The file hash shared with the document hashing (imported when first used, as doc_hasher
+# imports the index readers, which import the WordPress client this module is used by)
+doc_hasher = lazy_import("mti.doc_hasher")
+
+ORIGINAL = "ORIGINAL"
+
+# Extension and MIME type of each derivative format (Pillow format names)
+FORMATS = {
+    "JPEG":     (".jpg", "image/jpeg"),
+    "WEBP":     (".webp", "image/webp"),
+}
+
+# Image modes the formats can save, other images are converted to RGB
+FORMAT_MODES = {
+    "JPEG":     ("L", "RGB"),
+    "WEBP":     ("L", "RGB", "RGBA"),
+}
+
+DEFAULT_WIDTH = 600
+DEFAULT_QUALITY = 80
+
+class CoverDerivativeError(Exception):
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+# The file to upload for a cover, with the file name and MIME type to upload it as
+class CoverDerivative:
+    def __init__(self, path, filename, mime_type):
+        self.path       = path
+        self.filename   = filename
+        self.mime_type  = mime_type
+
+    def read(self):
+        with open(self.path, 'rb') as file:
+            return file.read()
+
+def get_cover_format():
+    cover_format = mticonfig.ini['WordPress'].get('CoverFormat', fallback='WebP').strip().upper()
+    if cover_format != ORIGINAL and cover_format not in FORMATS:
+        raise CoverDerivativeError(f"CoverFormat {cover_format} in settings is not one of WebP, JPEG or Original.")
+
+    return cover_format
+
+def get_cover_width():
+    return max(1, mticonfig.ini['WordPress'].getint('CoverWidth', fallback=DEFAULT_WIDTH))
+
+def get_cover_quality():
+    return min(100, max(1, mticonfig.ini['WordPress'].getint('CoverQuality', fallback=DEFAULT_QUALITY)))
+
+def get_cache_dir():
+    return Path(mticonfig.data_dir) / 'cover_cache'
+
+# The cover as it is: its MIME type from the file extension
+def get_original(cover_path):
+    mime_type = mimetypes.guess_type(cover_path)[0] or 'application/octet-stream'
+    return CoverDerivative(cover_path, os.path.basename(cover_path), mime_type)
+
+# Get the cover to upload for the cover file in the format, width and quality in settings
+# (or passed), making the derivative if it isn't in the cache yet
+def get_cover_derivative(cover_path, cover_format=None, width=None, quality=None, cache_dir=None):
+    cover_format = cover_format or get_cover_format()
+    if cover_format == ORIGINAL:
+        return get_original(cover_path)
+
+    width       = width or get_cover_width()
+    quality     = quality or get_cover_quality()
+    cache_dir   = Path(cache_dir or get_cache_dir())
+    (extension, mime_type) = FORMATS[cover_format]
+
+    source_hash = doc_hasher.hash_file(cover_path)
+    cache_file = cache_dir / f"{source_hash}_{width}w_q{quality}{extension}"
+    original_file = cache_file.with_name(cache_file.name + ".original")
+
+    # A marker file is cached for covers whose derivative isn't smaller than they are
+    if original_file.exists():
+        return get_original(cover_path)
+
+    if not cache_file.exists():
+        os.makedirs(cache_dir, exist_ok=True)
+        if not create_derivative(cover_path, cache_file, cover_format, width, quality):
+            original_file.touch()
+            return get_original(cover_path)
+
+    filename = os.path.splitext(os.path.basename(cover_path))[0] + extension
+    return CoverDerivative(cache_file, filename, mime_type)
+
+# Encode the cover scaled down to width into cache_file. Returns False (without keeping
+# the derivative) if it isn't smaller than the cover.
+def create_derivative(cover_path, cache_file, cover_format, width, quality):
+    try:
+        with Image.open(cover_path) as img:
+            # JPEG scans are decoded at the smallest scale that is still wide enough
+            if img.width > width:
+                img.draft(img.mode, (width, img.height * width // img.width))
+
+            img = to_format_mode(img, cover_format)
+            if img.width > width:
+                img = img.resize((width, max(1, round(img.height * width / img.width))),
+                                 Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+            # Write to a temp file first so a failed save doesn't leave a partial derivative
+            temp_file = cache_file.with_name(cache_file.name + ".tmp")
+            img.save(temp_file, cover_format, quality=quality, optimize=True)
+    except OSError as e:
+        raise CoverDerivativeError(f"Unable to convert cover {cover_path} ({e}).") from e
+
+    if os.path.getsize(temp_file) >= os.path.getsize(cover_path):
+        os.remove(temp_file)
+        return False
+
+    os.replace(temp_file, cache_file)
+    return True
+
+# Convert the image to a mode the format can save, transparent covers are put on white
+def to_format_mode(img, cover_format):
+    if img.mode in FORMAT_MODES[cover_format]:
+        return img
+
+    if img.mode in ("I;16", "I"):
+        return img.convert("L")
+
+    if img.mode == "P":
+        img = img.convert("RGBA")
+    if img.mode in ("RGBA", "LA", "PA"):
+        if "RGBA" in FORMAT_MODES[cover_format]:
+            return img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img.convert("RGBA"), mask=img.convert("RGBA").getchannel("A"))
+        return background
+
+    return img.convert("RGB")
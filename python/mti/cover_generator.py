@@ -1,113 +1,241 @@
-from PIL import Image, ImageDraw, ImageFont
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 import os
 import math
+import threading
+from mti.lazy_imports import lazy_import
+
+Image = lazy_import("PIL.Image")
+ImageDraw = lazy_import("PIL.ImageDraw")
+ImageFont = lazy_import("PIL.ImageFont")
+
+# Size of the text metrics cache of each renderer (words and lines of titles, and authors)
+TEXT_METRICS_CACHE_SIZE = 20000
+
+# Renders the covers. The fonts, the blank cover with its borders and the bar drawn under
+# the author are made once, so each cover only copies the blank cover and draws its text.
+# Text sizes are cached, as titles share a lot of words (and the lines they start with).
+class CoverRenderer:
+
+    WIDTH, HEIGHT = 600, 900
+    MODE = 'RGB'
+    BACKGROUND_COLOR = (255, 255, 255)
+    TEXT_COLOR = (0, 0, 0)
+    LINE_SPACING = 20               # Between lines of the title
+    BAR_WIDTH = WIDTH // 3
+    BAR_HEIGHT = 10                 # Amplitude of the wave
+    BAR_PADDING = 4                 # Around the wave in the bar mask, for the line width
+
+    def __init__(self):
+        # Load fonts
+        try:
+            self.font_title = ImageFont.truetype("arial.ttf", 48)
+            self.font_author = ImageFont.truetype("arial.ttf", 28)
+        except IOError:
+            self.font_title = ImageFont.load_default()
+            self.font_author = ImageFont.load_default()
+
+        self.template = self.create_template()
+        self.bar_mask = self.create_bar_mask()
+        self.draw = ImageDraw.Draw(self.template.copy())
+        self.get_text_bbox = lru_cache(maxsize=TEXT_METRICS_CACHE_SIZE)(self.measure_text)
+
+    # Blank cover with a double border
+    def create_template(self):
+        (width, height) = (self.WIDTH, self.HEIGHT)
+        img = Image.new(self.MODE, (width, height), color=self.BACKGROUND_COLOR)
+        draw = ImageDraw.Draw(img)
+
+        border_color = self.TEXT_COLOR
+        border_width = 4
+        margin = 10
+        gap = 12 + margin  # Gap between the two borders
+
+        # Outer border
+        draw.rectangle(
+            [margin, margin, width - 1 - margin, height - 1 - margin],
+            outline=border_color,
+            width=border_width
+        )
+        # Inner border
+        draw.rectangle(
+            [gap, gap, width - 1 - gap, height - 1 - gap],
+            outline=border_color,
+            width=border_width
+        )
+
+        return img
+
+    # A tilda-shaped horizontal bar (single crest), one full sine wave cycle across the bar
+    # width, as a mask to paste the bar color through
+    def create_bar_mask(self):
+        (pad, bar_width, bar_height) = (self.BAR_PADDING, self.BAR_WIDTH, self.BAR_HEIGHT)
+        mask = Image.new('L', (bar_width + 1 + 2 * pad, 2 * bar_height + 1 + 2 * pad), 0)
+
+        points = []
+        for i in range(bar_width + 1):
+            x = pad + i
+            y = pad + bar_height + int(bar_height * math.sin(2 * math.pi * i / bar_width))
+            points.append((x, y))
+
+        ImageDraw.Draw(mask).line(points, fill=255, width=3)
+        return mask
+
+    def measure_text(self, text, font):
+        return self.draw.textbbox((0, 0), text, font=font)
+
+    def get_text_size(self, text, font):
+        bbox = self.get_text_bbox(text, font)
+        return (bbox[2] - bbox[0], bbox[3] - bbox[1])
+
+    # Split title into lines that fit the cover width
+    def split_title(self, title):
+        max_title_width = self.WIDTH - 60  # 30px margin on each side
+        lines = []
+        current_line = ""
+        for word in title.split():
+            test_line = current_line + (" " if current_line else "") + word
+            if self.get_text_size(test_line, self.font_title)[0] <= max_title_width:
+                current_line = test_line
+            else:
+                if current_line:
+                    lines.append(current_line)
+                current_line = word
+        if current_line:
+            lines.append(current_line)
+
+        return lines
+
+    # Render the cover for the title (in caps) and author
+    def render(self, title, author):
+        img = self.template.copy()
+        draw = ImageDraw.Draw(img)
+        width = self.WIDTH
+
+        # Position title block in top third, each line centered
+        current_y = self.HEIGHT // 4
+        for line in self.split_title(title.upper()):
+            (line_width, line_height) = self.get_text_size(line, self.font_title)
+            draw.text(((width - line_width) // 2, current_y), line, font=self.font_title, fill=self.TEXT_COLOR)
+            current_y += line_height + self.LINE_SPACING
+
+        # Author centered below title block
+        (author_w, author_h) = self.get_text_size(author, self.font_author)
+        author_y = current_y + 40
+        draw.text(((width - author_w) // 2, author_y), author, font=self.font_author, fill=self.TEXT_COLOR)
+
+        # Bar after the author name
+        bar_x = (width - self.BAR_WIDTH) // 2
+        bar_y = author_y + author_h + 100
+        img.paste(self.TEXT_COLOR, (bar_x - self.BAR_PADDING, bar_y - self.BAR_HEIGHT - self.BAR_PADDING), self.bar_mask)
+
+        return img
+
+    def generate_cover(self, title, author, folder, filename):
+        output_path = os.path.join(folder, get_cover_file_name(filename))
+        self.save_cover(title, author, output_path)
+
+        return os.path.basename(output_path)
+
+    def save_cover(self, title, author, output_path):
+        self.render(title, author).save(output_path)
+
+# Generates covers in a process pool, so a scan finding thousands of documents without a
+# cover uses every core. The pool is only started once the first cover is needed.
+class CoverPool:
+    def __init__(self, processes):
+        self.processes = processes
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(cancel=exc_type is not None)
+
+    # No executor if the covers are generated in the calling thread
+    def get_executor(self):
+        if self.processes <= 1:
+            return None
+
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.processes)
+
+        return self.executor
+
+    def close(self, cancel=False):
+        if self.executor:
+            self.executor.shutdown(wait=True, cancel_futures=cancel)
+            self.executor = None
+
+    def new_jobs(self):
+        return CoverJobs(self)
+
+# Covers submitted to the pool for one author folder. generate_cover returns the cover
+# file name right away, the cover is written once the pool gets to it.
+class CoverJobs:
+    def __init__(self, pool):
+        self.pool = pool
+        self.futures = []
+
+    def generate_cover(self, title, author, folder, filename, pdf_cover=None, pdf_path=None):
+        executor = self.pool.get_executor()
+        if executor is None:
+            return generate_cover(title, author, folder, filename, pdf_cover, pdf_path)
+
+        self.futures.append(executor.submit(generate_cover, title, author, folder, filename, pdf_cover, pdf_path))
+        return get_cover_file_name(filename, pdf_cover is not None)
+
+    def done(self):
+        return all(future.done() for future in self.futures)
+
+    # Wait for the covers, raising the error of a cover that couldn't be generated
+    def wait(self):
+        for future in self.futures:
+            future.result()
+
+# Renderers are kept per thread, as the indexer scans author folders in parallel
+renderers = threading.local()
+
+def get_cover_renderer():
+    if not hasattr(renderers, "renderer"):
+        renderers.renderer = CoverRenderer()
+
+    return renderers.renderer
+
+# Covers made from the first page of the PDF have their own name, the same whether the
+# page was rendered or the card was used instead, so the name is known before the cover
+# is made
+CARD_COVER_SUFFIX = "-simple.png"
+PDF_COVER_SUFFIX = "-page.jpg"
+
+def get_cover_file_name(filename, from_pdf=False):
+    return os.path.basename(filename + (PDF_COVER_SUFFIX if from_pdf else CARD_COVER_SUFFIX))
+
+def is_pdf_cover_file(cover_file):
+    return cover_file.endswith(PDF_COVER_SUFFIX)
 
-def generate_cover(title, author, folder, filename):
-    # Make title all caps
-    title = title.upper()
-
-    # Create output folder if it doesn't exist
-    # Use a safe filename for output
-    safe_title = "".join(c for c in title if c.isalnum() or c in (' ', '_')).rstrip()
-    safe_author = "".join(c for c in author if c.isalnum() or c in (' ', '_')).rstrip()
-    output_path = os.path.join(folder, f"{filename}-simple.png")
-
-    # Create a blank image
-    width, height = 600, 900
-    img = Image.new('RGB', (width, height), color=(255, 255, 255))
-    draw = ImageDraw.Draw(img)
-
-    # Draw double border
-    border_color = (0, 0, 0)
-    border_width = 4
-    margin = 10
-    gap = 12 + margin  # Gap between the two borders
-
-    # Outer border
-    draw.rectangle(
-        [margin, margin, width - 1 - margin, height - 1 - margin],
-        outline=border_color,
-        width=border_width
-    )
-    # Inner border
-    draw.rectangle(
-        [gap, gap, width - 1 - gap, height - 1 - gap],
-        outline=border_color,
-        width=border_width
-    )
-
-    # Load fonts
-    try:
-        font_title = ImageFont.truetype("arial.ttf", 48)
-        font_author = ImageFont.truetype("arial.ttf", 28)
-    except IOError:
-        font_title = ImageFont.load_default()
-        font_author = ImageFont.load_default()
-
-    # Split title into lines that fit the image width
-    max_title_width = width - 60  # 30px margin on each side
-    words = title.split()
-    lines = []
-    current_line = ""
-    for word in words:
-        test_line = current_line + (" " if current_line else "") + word
-        test_bbox = draw.textbbox((0, 0), test_line, font=font_title)
-        test_width = test_bbox[2] - test_bbox[0]
-        if test_width <= max_title_width:
-            current_line = test_line
-        else:
-            if current_line:
-                lines.append(current_line)
-            current_line = word
-    if current_line:
-        lines.append(current_line)
-
-    # Calculate total height of title block
-    line_heights = []
-    for line in lines:
-        bbox = draw.textbbox((0, 0), line, font=font_title)
-        line_heights.append(bbox[3] - bbox[1])
-    total_title_height = sum(line_heights) + (len(lines) - 1) * 20  # 20px between lines
-
-    # Position title block in top third (adjust as needed)
-    title_y = height // 4
-    current_y = title_y
-
-    # Draw each line of the title, centered
-    for i, line in enumerate(lines):
-        bbox = draw.textbbox((0, 0), line, font=font_title)
-        line_width = bbox[2] - bbox[0]
-        line_x = (width - line_width) // 2
-        draw.text((line_x, current_y), line, font=font_title, fill=(0, 0, 0))
-        current_y += line_heights[i] + 20
-
-    # Calculate position for author (centered, below title block)
-    author_bbox = draw.textbbox((0, 0), author, font=font_author)
-    author_w = author_bbox[2] - author_bbox[0]
-    author_x = (width - author_w) // 2
-    author_y = current_y + 40
-
-    # Draw the author
-    draw.text((author_x, author_y), author, font=font_author, fill=(0, 0, 0))
-
-    # Draw a tilda-shaped horizontal bar (single crest) after the author name
-    bar_width = width // 3
-    bar_height = 10  # amplitude of the wave
-    bar_x = (width - bar_width) // 2
-    bar_y = author_y + (author_bbox[3] - author_bbox[1]) + 100
-
-    points = []
-     # One full sine wave cycle across the bar width
-    for i in range(bar_width + 1):
-        x = bar_x + i
-        y = bar_y + int(bar_height * math.sin(2 * math.pi * i / bar_width))
-        points.append((x, y))
-
-
-    draw.line(points, fill=(0, 0, 0), width=3)
-
-    # Save the image
-    img.save(output_path)
+# Generate a cover (run in the cover pool, so it must stay a top level function). If
+# pdf_cover is passed the cover is made from the first page of the PDF (see pdf_covers).
+def generate_cover(title, author, folder, filename, pdf_cover=None, pdf_path=None):
+    if pdf_cover is None:
+        return get_cover_renderer().generate_cover(title, author, folder, filename)
 
+    output_path = os.path.join(folder, get_cover_file_name(filename, True))
+    save_cover(title, author, output_path, pdf_cover, pdf_path)
+    return os.path.basename(output_path)
 
+def save_cover(title, author, output_path, pdf_cover=None, pdf_path=None):
+    if pdf_cover is None or not pdf_cover.generate_cover(pdf_path, output_path):
+        get_cover_renderer().save_cover(title, author, output_path)
 
+# Generate a cover the indexer left pending (GenerateCover=Lazy) if it is still missing.
+# Returns True if the cover was generated.
+def generate_pending_cover(title, author, cover_path, pdf_cover=None, pdf_path=None):
+    if os.path.exists(cover_path):
+        return False
+
+    save_cover(title, author, cover_path, pdf_cover, pdf_path)
+    return True
@@ -0,0 +1,282 @@
+'''
+Content hashing finds the documents filed more than once, e.g. the same PDF under two
+authors or in two collections, which the index (only going by file names) can't tell apart.
+
+The SHA-256 of every document in the latest index of each archive (all the coll:doct
+sections in settings) is computed by a process pool. Digests are cached by path, size and
+modified time, so only new or changed documents are read again on later runs.
+
+Documents with the same digest make up a duplicate group. The first document in a group
+is the one that gets loaded, and it stays first on later runs as long as it is still
+there, so a document already loaded is not replaced by a copy filed later. The groups are
+saved for the loader, which skips the other documents in a group.
+'''
+import os, csv, json, hashlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from mti.mti_config import MTIConfig, MTIDataKey, mticonfig
+from mti import book_csv_reader, index_snapshots
+from tqdm import tqdm
+
+# Size of the reads when hashing a file, so large PDFs are not read into memory at once
+CHUNK_SIZE = 1024 * 1024
+
+# A document in an archive index
+class IndexedDoc:
+    def __init__(self, archive_sectkey, path):
+        self.archive_sectkey = archive_sectkey
+        self.path = path
+        self.key = get_path_key(path)
+
+# Digests of the documents hashed, keyed by path and only valid for the same file size
+# and modified time
+class DigestCache:
+
+    VERSION = 1
+
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+        self.digests = self.load()
+        self.hashed = {}
+
+    def load(self):
+        try:
+            with open(self.cache_file, 'r', encoding="utf-8") as file:
+                data = json.load(file)
+        except (IOError, ValueError):
+            return {}
+
+        return data.get("Digests", {}) if data.get("Version") == DigestCache.VERSION else {}
+
+    # Only the documents hashed in this run are kept, so removed documents drop out
+    def save(self):
+        temp_file = f"{self.cache_file}.tmp"
+        with open(temp_file, 'w', encoding="utf-8") as file:
+            json.dump({"Version": DigestCache.VERSION, "Digests": self.hashed}, file)
+        os.replace(temp_file, self.cache_file)
+
+    def get(self, key, doc_stat):
+        entry = self.digests.get(key)
+        if entry and entry[0] == doc_stat.st_size and entry[1] == doc_stat.st_mtime_ns:
+            return entry[2]
+
+        return None
+
+    def update(self, key, doc_stat, digest):
+        self.hashed[key] = [doc_stat.st_size, doc_stat.st_mtime_ns, digest]
+
+# Duplicate groups from the last hashing run, used by the loader to skip duplicates
+class DuplicateIndex:
+
+    VERSION = 1
+
+    def __init__(self, groups=None, digests=None):
+        self.groups = groups if groups is not None else {}
+        self.digests = digests if digests is not None else {}
+
+    @staticmethod
+    def load(duplicates_file):
+        try:
+            with open(duplicates_file, 'r', encoding="utf-8") as file:
+                data = json.load(file)
+        except (IOError, ValueError):
+            return DuplicateIndex()
+
+        if data.get("Version") != DuplicateIndex.VERSION:
+            return DuplicateIndex()
+
+        return DuplicateIndex(data.get("Groups", {}), data.get("Digests", {}))
+
+    def save(self, duplicates_file):
+        temp_file = f"{duplicates_file}.tmp"
+        with open(temp_file, 'w', encoding="utf-8") as file:
+            json.dump({"Version": DuplicateIndex.VERSION, "Groups": self.groups, "Digests": self.digests}, file, indent=4)
+        os.replace(temp_file, duplicates_file)
+
+    # Returns the path of the document loaded instead of this one, or None if the document
+    # is not a duplicate. A document changed since it was hashed is not treated as a duplicate.
+    def get_duplicate_of(self, path):
+        key = get_path_key(path)
+        entry = self.digests.get(key)
+        if not entry:
+            return None
+
+        try:
+            doc_stat = os.stat(path)
+        except OSError:
+            return None
+        if entry[0] != doc_stat.st_size or entry[1] != doc_stat.st_mtime_ns:
+            return None
+
+        group = self.groups.get(entry[2], [])
+        if len(group) > 1 and group[0]["Key"] != key:
+            return group[0]["Path"]
+
+        return None
+
+# Files are keyed by their normalized path (and case on Windows), so the same file is
+# found however the base path and folder were written in settings and the index
+def get_path_key(path):
+    return os.path.normcase(os.path.normpath(path))
+
+def get_doc_path(record, doct_prefix):
+    return os.path.join(record['Base Path'], record['Author Folder'], record[f"{doct_prefix} File"])
+
+def get_cache_file():
+    return Path(mticonfig.data_dir) / 'doc_digests.json'
+
+def get_duplicates_file():
+    return Path(mticonfig.data_dir) / 'doc_duplicates.json'
+
+def is_enabled():
+    return mticonfig.ini['Settings'].getboolean('HashDocuments', fallback=False)
+
+def get_hash_processes():
+    return max(1, mticonfig.ini['Settings'].getint('HashProcesses', fallback=os.cpu_count() or 1))
+
+def load_duplicate_index():
+    return DuplicateIndex.load(get_duplicates_file())
+
+# SHA-256 of a file, read in chunks. This is the one file hash used for documents, covers
+# and media, so a digest computed by one is valid for the others.
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        while chunk := file.read(CHUNK_SIZE):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+# Hash a document in the process pool (so it must stay a top level function). Returns None
+# if the document can't be read.
+def hash_doc(path):
+    try:
+        return hash_file(path)
+    except OSError as e:
+        print(f"Unable to hash {path} ({e}).")
+        return None
+
+# Get the documents in the latest index of every archive in settings, in settings order
+def get_indexed_docs():
+    docs = []
+    for coll_name in mticonfig.coll_list:
+        for doct_name in mticonfig.doct_list:
+            archive_key = f'{MTIConfig.fileNameFormat(coll_name)}_{MTIConfig.fileNameFormat(doct_name)}'
+            last_idx_gen_dt = mticonfig.dat.get(archive_key, {}).get(MTIDataKey.LAST_IDX_GEN_FILE_DT)
+            if not last_idx_gen_dt:
+                continue
+
+            index_file = index_snapshots.get_snapshot_file(
+                Path(mticonfig.data_dir) / archive_key / f'{archive_key}_{last_idx_gen_dt}_Index.csv')
+            doct_prefix = MTIConfig.tosingular(doct_name)
+            try:
+                for record in book_csv_reader.read_csv_file(doct_prefix, index_file):
+                    docs.append(IndexedDoc(f'{coll_name}:{doct_name}', get_doc_path(record, doct_prefix)))
+            except (IOError, ValueError) as e:
+                print(f"Unable to read index for {coll_name}:{doct_name} ({e}).")
+
+    return docs
+
+# Get the digest of every document, using the cache for the ones unchanged since last
+# hashed and a process pool for the rest. Documents that can't be read are left out.
+def hash_docs(docs, cache, processes=1):
+    to_hash = []
+    seen_keys = set()
+    for doc in docs:
+        if doc.key in seen_keys:
+            continue
+        seen_keys.add(doc.key)
+
+        try:
+            doc_stat = os.stat(doc.path)
+        except OSError:
+            continue
+
+        digest = cache.get(doc.key, doc_stat)
+        if digest:
+            cache.update(doc.key, doc_stat, digest)
+        else:
+            to_hash.append((doc, doc_stat))
+
+    paths = [doc.path for (doc, _) in to_hash]
+    if processes > 1 and len(to_hash) > 1:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            chunksize = max(1, min(32, len(paths) // (processes * 4)))
+            read_count = update_digests(cache, to_hash, executor.map(hash_doc, paths, chunksize=chunksize))
+    else:
+        read_count = update_digests(cache, to_hash, map(hash_doc, paths))
+
+    digests = {key: cache.hashed[key][2] for key in seen_keys if key in cache.hashed}
+    return (digests, read_count)
+
+def update_digests(cache, to_hash, digests):
+    read_count = 0
+    for ((doc, doc_stat), digest) in tqdm(zip(to_hash, digests), total=len(to_hash), desc="  Hashing"):
+        if digest:
+            cache.update(doc.key, doc_stat, digest)
+            read_count += 1
+
+    return read_count
+
+# Group the documents by digest, keeping the order of the last run's groups so the
+# document loaded first stays first, and adding new documents in archive order
+def find_duplicate_groups(docs, digests, last_groups):
+    docs_by_digest = {}
+    for doc in docs:
+        digest = digests.get(doc.key)
+        if digest:
+            docs_by_digest.setdefault(digest, {}).setdefault(doc.key, doc)
+
+    groups = {}
+    for (digest, digest_docs) in docs_by_digest.items():
+        if len(digest_docs) < 2:
+            continue
+
+        last_keys = [entry["Key"] for entry in last_groups.get(digest, []) if entry["Key"] in digest_docs]
+        keys = last_keys + [key for key in digest_docs if key not in last_keys]
+        groups[digest] = [
+            {"Key": key, "Archive": digest_docs[key].archive_sectkey, "Path": digest_docs[key].path}
+            for key in keys
+        ]
+
+    return groups
+
+def write_duplicates_report(report_file, groups):
+    with open(report_file, "w", newline="", encoding="utf-8") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=["Digest", "Archive", "Document", "Duplicate Of"])
+        writer.writeheader()
+        for (digest, group) in groups.items():
+            for (i, entry) in enumerate(group):
+                writer.writerow({
+                    "Digest": digest,
+                    "Archive": entry["Archive"],
+                    "Document": entry["Path"],
+                    "Duplicate Of": group[0]["Path"] if i > 0 else ""
+                })
+
+# Hash the documents in all the archives and report the duplicates found
+def start():
+    print("Hashing documents")
+    print("=================")
+
+    docs = get_indexed_docs()
+    cache = DigestCache(get_cache_file())
+    (digests, read_count) = hash_docs(docs, cache, get_hash_processes())
+    cache.save()
+
+    duplicates_file = get_duplicates_file()
+    groups = find_duplicate_groups(docs, digests, load_duplicate_index().groups)
+    dup_digests = {key: cache.hashed[key] for group in groups.values() for key in (entry["Key"] for entry in group)}
+    DuplicateIndex(groups, dup_digests).save(duplicates_file)
+
+    duplicate_count = sum(len(group) - 1 for group in groups.values())
+    print(mticonfig.idtab, f"Documents Hashed     : {len(digests)} ({read_count} read, {len(digests) - read_count} unchanged)")
+    print(mticonfig.idtab, f"Duplicate Groups     : {len(groups)}")
+    print(mticonfig.idtab, f"Duplicate Documents  : {duplicate_count}")
+
+    if groups:
+        report_file = Path(mticonfig.data_dir) / f'duplicates_{mticonfig.get_timestamp()}.csv'
+        write_duplicates_report(report_file, groups)
+        print(mticonfig.idtab, f"Duplicates report created: {report_file}")
+
+    return groups
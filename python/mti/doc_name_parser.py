@@ -0,0 +1,102 @@
+'''
+This parses document file names into the title, date and periodical parts used for the
+index records, with the regex compiled once for all the names parsed.
+
+Title casing is most of the cost of parsing a name. titlecase() title cases each word on
+its own (only the line being all caps matters), then fixes up small words at the start,
+end and after punctuation. Since the same words repeat across thousands of file names,
+each word is title cased once and memoized, and the title is put back together the same
+way titlecase() does it.
+'''
+import re
+from functools import lru_cache
+from titlecase import titlecase, SMALL_FIRST, SMALL_LAST, SUBPHRASE
+
+# Document name is "<title parts>_<author part>"
+doc_name_regex = re.compile(r"^(.+)_([^_]*)$")
+
+# Number of parts expected in a document name title for each document type
+# (e.g. Article is Date_Peridical_Title, Letter is Date_Title, Book is Title)
+EXPECTED_NUM_PARTS = {
+    'Article': 3,
+    'Journal': 3,
+    'Letter': 2,
+    'Dissertation': 2,
+    'Book': 1
+}
+
+# Parsed details for a document file name. Files that are not documents (covers,
+# Thumbs.db) have is_doc False and no error.
+class ParsedDocName:
+    def __init__(self, is_doc, stem="", full_title="", title="", date="", periodical="", error=None):
+        self.is_doc = is_doc
+        self.stem = stem                # File name without the author part
+        self.full_title = full_title    # Title cased stem, before splitting out the parts
+        self.title = title
+        self.date = date
+        self.periodical = periodical
+        self.error = error
+
+    def add_details(self, doct_name, doc_record):
+        doc_record[f"{doct_name} Title"] = self.title
+        if (doct_name == 'Article' or doct_name == 'Journal'):
+            doc_record["Date"] = self.date
+            doc_record["Periodical"] = self.periodical
+        elif (doct_name == 'Letter' or doct_name == 'Dissertation'):
+            doc_record["Date"] = self.date
+
+        return doc_record
+
+# Same as titlecase(text), using the memoized title case for each word
+def title_case(text):
+    if any(c in text for c in "\r\n\t"):
+        return titlecase(text)
+
+    all_caps = text.upper() == text
+    tc_line = [title_case_word(word, all_caps) for word in text.split(' ')]
+
+    tc_line[0] = SMALL_FIRST.sub(lambda m: f"{m.group(1)}{m.group(2).capitalize()}", tc_line[0])
+    tc_line[-1] = SMALL_LAST.sub(lambda m: m.group(0).capitalize(), tc_line[-1])
+
+    return SUBPHRASE.sub(lambda m: f"{m.group(1)}{m.group(2).capitalize()}", " ".join(tc_line))
+
+# Title case a single word as titlecase() would in a line that is (or isn't) all caps.
+# The "x" added after the word keeps the line all caps (or not), and is not a small word
+# so it doesn't change how the word is title cased.
+@lru_cache(maxsize=2**16)
+def title_case_word(word, all_caps):
+    tail = " X" if all_caps else " x"
+    return titlecase(word + tail, small_first_last=False)[:-len(tail)]
+
+def get_parts_error(doct_name, num_parts):
+    if num_parts > EXPECTED_NUM_PARTS[doct_name]:
+        return f"{doct_name} file not properly named, too many underscores."
+    elif num_parts < EXPECTED_NUM_PARTS[doct_name]:
+        return f"{doct_name} file not properly named, too few underscores."
+
+    return None
+
+def parse_doc_name(doct_name, name):
+    match = doc_name_regex.match(name)
+    if not match or "_cover" in name:
+        error = None
+        if all(substr not in name.lower() for substr in ["_cover", "thumbs.db"]):
+            error = f"{doct_name} not properly named. Title does not match regex pattern."
+        return ParsedDocName(False, error=error)
+
+    stem = match.group(1)
+    full_title = title_case(stem.replace('-', ' '))
+    parts = full_title.split('_')
+
+    error = get_parts_error(doct_name, len(parts))
+    if error:
+        return ParsedDocName(True, stem, full_title, full_title, error=error)
+
+    if (doct_name == 'Article' or doct_name == 'Journal'):
+        date, periodical, title, *_ = tuple(parts)
+        return ParsedDocName(True, stem, full_title, title, date.replace(" ", "-"), periodical)
+    elif (doct_name == 'Letter' or doct_name == 'Dissertation'):
+        date, title = tuple(parts)
+        return ParsedDocName(True, stem, full_title, title, date.replace(" ", "-"))
+
+    return ParsedDocName(True, stem, full_title, full_title)
@@ -0,0 +1,209 @@
+'''
+Finds the documents added, removed and changed between two index files. Rows are keyed
+by document (author folder and document file), so the diff doesn't depend on the order
+of the rows, and a document whose other columns changed (e.g. a new cover file) is
+reported as changed instead of as a new document.
+
+Indexes that fit in memory are diffed by putting the rows of the old index in a dict,
+keyed by document, and going through the new index once (only the lines that are not
+the same in both indexes need to be parsed and keyed). Larger indexes are diffed
+with an external sort-merge: each index is sorted by document in runs written to temp
+files, the runs are merged and the two sorted indexes are compared in a single pass.
+The rows found are then in document order instead of index order.
+
+Either index can be a Parquet snapshot (see index_snapshots) instead of a CSV file.
+'''
+import os, csv, heapq, tempfile
+from itertools import islice
+from mti.mti_config import mticonfig
+from mti import index_snapshots
+
+AUTHOR_FOLDER_COLUMN = "Author Folder"
+
+class IndexDiffError(Exception):
+   def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+# Rows (as lists of column values, in the order of the new index header) added,
+# removed and changed in the new index
+class IndexDiff:
+    def __init__(self, header):
+        self.header = header
+        self.added = []
+        self.removed = []
+        self.changed = []
+
+    def write_rows(self, file, rows):
+        with open(file, "w", newline="", encoding="utf-8") as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(self.header)
+            writer.writerows(rows)
+
+# Reads index rows as lists in the column order of the given header, so indexes written
+# with a different column order (or missing columns) can still be compared
+class IndexReader:
+    def __init__(self, index_file, header=None):
+        self.index_file = index_file
+        self.is_parquet = index_snapshots.is_parquet(index_file)
+        if self.is_parquet:
+            self.file_header = index_snapshots.read_header(index_file)
+        else:
+            with open(index_file, "r", newline="", encoding="utf-8") as csvfile:
+                self.file_header = next(csv.reader(csvfile), None)
+        if not self.file_header:
+            raise IndexDiffError(f"Index file {index_file} is empty.")
+
+        self.header = header if header else self.file_header
+        self.key_columns = get_key_columns(self.header)
+
+        positions = {name: i for (i, name) in enumerate(self.file_header)}
+        self.columns = [positions.get(name) for name in self.header]
+        self.is_reordered = self.columns != list(range(len(self.file_header)))
+
+    def __iter__(self):
+        for row in self.read_rows():
+            if self.is_reordered:
+                row = [row[i] if i is not None and i < len(row) else "" for i in self.columns]
+            yield row
+
+    def read_rows(self):
+        if self.is_parquet:
+            yield from index_snapshots.read_rows(self.index_file)
+            return
+
+        with open(self.index_file, "r", newline="", encoding="utf-8") as csvfile:
+            reader = csv.reader(csvfile)
+            next(reader)
+            yield from reader
+
+    # The data lines of the file, with "\n" line endings (the index has no line breaks
+    # within a row)
+    def lines(self):
+        with open(self.index_file, "r", encoding="utf-8") as csvfile:
+            next(csvfile)
+            return csvfile.readlines()
+
+    def get_key(self, row):
+        return tuple(row[i] for i in self.key_columns)
+
+# The document is identified by its author folder and file (e.g. "Letter File")
+def get_key_columns(header):
+    file_columns = [i for (i, name) in enumerate(header)
+                    if name.endswith(" File") and not name.endswith(" Cover File")]
+    if AUTHOR_FOLDER_COLUMN not in header or len(file_columns) != 1:
+        raise IndexDiffError(f"Index header is missing the {AUTHOR_FOLDER_COLUMN} or document File column.")
+
+    return (header.index(AUTHOR_FOLDER_COLUMN), file_columns[0])
+
+# Get the maximum number of rows of an index diffed in memory, indexes with more rows are
+# diffed with an external sort-merge
+def get_max_rows_in_memory():
+    return max(1, mticonfig.ini['Settings'].getint('DiffMaxRowsInMemory', fallback=1000000))
+
+def count_rows(index_file):
+    if index_snapshots.is_parquet(index_file):
+        return index_snapshots.count_rows(index_file)
+
+    # The last row may not end with a new line
+    (lines, last_chunk) = (0, b"")
+    with open(index_file, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            lines += chunk.count(b"\n")
+            last_chunk = chunk
+    if last_chunk and not last_chunk.endswith(b"\n"):
+        lines += 1
+
+    return lines - 1
+
+# Diff the old (last loaded) and new index files
+def diff_index_files(old_file, new_file, max_rows_in_memory=None):
+    if max_rows_in_memory is None:
+        max_rows_in_memory = get_max_rows_in_memory()
+
+    new_index = IndexReader(new_file)
+    old_index = IndexReader(old_file, new_index.header)
+
+    new_row_count = count_rows(new_file)
+    if max(count_rows(old_file), new_row_count) <= max_rows_in_memory:
+        diff = diff_in_memory(old_index, new_index)
+    else:
+        diff = diff_sort_merge(old_index, new_index, max_rows_in_memory)
+
+    # Check there are not more new and changed documents than documents indexed
+    if len(diff.added) + len(diff.changed) > new_row_count:
+        raise IndexDiffError("More new items found than total items indexed.")
+
+    return diff
+
+# Lines that are the same in both indexes are the same documents, so when the indexes
+# have the same columns only the lines not in both are parsed and keyed (when one of the
+# indexes is a Parquet snapshot the rows are compared in Arrow instead)
+def diff_in_memory(old_index, new_index):
+    diff = IndexDiff(new_index.header)
+
+    if old_index.is_parquet or new_index.is_parquet:
+        (old_rows, new_rows) = index_snapshots.get_unmatched_rows(old_index.index_file, new_index.index_file, new_index.header)
+    elif old_index.is_reordered or new_index.is_reordered:
+        (old_rows, new_rows) = (old_index, new_index)
+    else:
+        (old_lines, new_lines) = (old_index.lines(), new_index.lines())
+        (old_set, new_set) = (set(old_lines), set(new_lines))
+        old_rows = csv.reader(line for line in old_lines if line not in new_set)
+        new_rows = csv.reader(line for line in new_lines if line not in old_set)
+
+    old_rows = {old_index.get_key(row): row for row in old_rows}
+    for row in new_rows:
+        old_row = old_rows.pop(new_index.get_key(row), None)
+        if old_row is None:
+            diff.added.append(row)
+        elif old_row != row:
+            diff.changed.append(row)
+
+    diff.removed.extend(old_rows.values())
+    return diff
+
+def diff_sort_merge(old_index, new_index, run_rows):
+    diff = IndexDiff(new_index.header)
+
+    with tempfile.TemporaryDirectory(dir=mticonfig.temp_dir if os.path.isdir(mticonfig.temp_dir) else None) as temp_dir:
+        old_rows = iter(sort_index(old_index, run_rows, temp_dir, "old"))
+        new_rows = iter(sort_index(new_index, run_rows, temp_dir, "new"))
+
+        old_row = next(old_rows, None)
+        new_row = next(new_rows, None)
+        while old_row is not None or new_row is not None:
+            old_key = old_index.get_key(old_row) if old_row is not None else None
+            new_key = new_index.get_key(new_row) if new_row is not None else None
+
+            if new_row is None or (old_row is not None and old_key < new_key):
+                diff.removed.append(old_row)
+                old_row = next(old_rows, None)
+            elif old_row is None or new_key < old_key:
+                diff.added.append(new_row)
+                new_row = next(new_rows, None)
+            else:
+                if old_row != new_row:
+                    diff.changed.append(new_row)
+                old_row = next(old_rows, None)
+                new_row = next(new_rows, None)
+
+    return diff
+
+# Sort the index by document, in runs of run_rows rows written to temp files, and
+# return the merged rows of the runs
+def sort_index(index, run_rows, temp_dir, name):
+    run_files = []
+    rows = iter(index)
+    while run := list(islice(rows, run_rows)):
+        run.sort(key=index.get_key)
+        run_file = os.path.join(temp_dir, f"{name}_{len(run_files)}.csv")
+        with open(run_file, "w", newline="", encoding="utf-8") as csvfile:
+            csv.writer(csvfile).writerows(run)
+        run_files.append(run_file)
+
+    return heapq.merge(*(read_run(run_file) for run_file in run_files), key=index.get_key)
+
+def read_run(run_file):
+    with open(run_file, "r", newline="", encoding="utf-8") as csvfile:
+        yield from csv.reader(csvfile)
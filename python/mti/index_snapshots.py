@@ -0,0 +1,343 @@
+'''
+Index snapshots are the Index and Index_Error files the indexer keeps for each run that
+found changes. With IndexSnapshotFormat=Parquet in settings they are also written as
+compressed Parquet files (if pyarrow is installed), which are a fraction of the size and
+are read several times faster by the Google loader, the index diff and the other readers
+of the index. The CSV files are kept next to them unless DeleteIndexCSV=True is set, as
+they are what people open and edit by hand. The Index_New, Changed and Removed files stay
+CSV, as they are small and the loader can be given one edited by hand.
+
+Compacting keeps the last SnapshotsToKeep runs of each archive as full snapshots (and any
+run newer than the last generated or loaded run, which the indexer compares with) and
+folds the older runs into a single history file per archive. The history is delta
+encoded: the first run folded is kept in full and each run after it only as the
+documents added, changed and removed (and the index errors new and fixed) since the run
+before, so any run folded can still be rebuilt (see read_history_run). The other files
+of a folded run (Debug, New, Changed and Removed) are deleted.
+'''
+import csv, filecmp, os, re
+from collections import Counter
+from pathlib import Path
+from mti.mti_config import MTIConfig, MTIDataKey, mticonfig
+from mti import index_diff
+from mti.lazy_imports import is_available, lazy_import
+
+pd = lazy_import("pandas")
+
+if is_available("pyarrow"):
+    pa = lazy_import("pyarrow")
+    pc = lazy_import("pyarrow.compute")
+    pa_csv = lazy_import("pyarrow.csv")
+    pq = lazy_import("pyarrow.parquet")
+else:
+    pq = None
+
+PARQUET = "Parquet"
+CSV = "CSV"
+
+PARQUET_COMPRESSION = "zstd"
+
+# Joins the values of a row to compare rows in Arrow (a control character, as it is not in
+# document file names or titles)
+ROW_SEPARATOR = "\x1f"
+
+# Columns of the history before the index (or index error) columns
+RUN_COLUMN = "Run"
+CHANGE_COLUMN = "Change"
+ERROR_COLUMNS = ["Author Directory", "File Name", "Error"]
+
+# Change of a document in the history since the run before
+class Change:
+    ADDED       = "Added"
+    CHANGED     = "Changed"
+    REMOVED     = "Removed"         # Only the author folder and file are kept
+    ERROR       = "Error"           # Index error new in the run
+    ERROR_FIXED = "Error Fixed"     # Index error of the run before not in the run
+
+# Files of a run deleted when the run is folded into the history
+RUN_FILES = ["_Index.csv", "_Index.parquet", "_Index_Error.csv", "_Index_Error.parquet",
+             "_Index_Debug.txt", "_Index_New.csv", "_Index_Changed.csv", "_Index_Removed.csv"]
+
+def parquet_available():
+    return pq is not None
+
+# Format the snapshots are written in, Parquet only if pyarrow is installed
+def get_snapshot_format():
+    snapshot_format = mticonfig.ini['Settings'].get('IndexSnapshotFormat', fallback=CSV).strip()
+    if snapshot_format.lower() != PARQUET.lower():
+        return CSV
+
+    if not parquet_available():
+        print("WARNING: pyarrow is not installed, index snapshots are written as CSV.")
+        return CSV
+
+    return PARQUET
+
+# The CSV files are only deleted once written as Parquet if asked for in settings
+def is_csv_deleted():
+    return mticonfig.ini['Settings'].getboolean('DeleteIndexCSV', fallback=False)
+
+def get_snapshots_to_keep():
+    return max(1, mticonfig.ini['Settings'].getint('SnapshotsToKeep', fallback=10))
+
+def is_parquet(file):
+    return Path(file).suffix == ".parquet"
+
+# Get the snapshot of a run from the path of its CSV file, the Parquet file if the run was
+# written (or compacted) as Parquet
+def get_snapshot_file(csv_file):
+    parquet_file = Path(csv_file).with_suffix(".parquet")
+    return parquet_file if parquet_file.exists() else Path(csv_file)
+
+# Read a snapshot (or CSV file) with all columns as strings, empty values as ""
+def read_snapshot(file, delimiter=","):
+    if is_parquet(file):
+        return pd.read_parquet(file)
+
+    return pd.read_csv(file, dtype=str, delimiter=delimiter, keep_default_na=False)
+
+def read_header(file):
+    if is_parquet(file):
+        return pq.read_schema(file).names
+
+    with open(file, "r", newline="", encoding="utf-8") as csvfile:
+        return next(csv.reader(csvfile), [])
+
+def read_rows(file):
+    return read_snapshot(file).values.tolist()
+
+def read_records(file):
+    return read_snapshot(file).to_dict("records")
+
+# Read a snapshot (or CSV index file) as an Arrow table of strings with the columns given,
+# empty for the columns it doesn't have
+def read_table(file, columns):
+    if is_parquet(file):
+        table = pq.read_table(file)
+    else:
+        column_types = {name: pa.string() for name in read_header(file)}
+        table = pa_csv.read_csv(file, convert_options=pa_csv.ConvertOptions(column_types=column_types))
+
+    return pa.table([table.column(name).cast(pa.string()) if name in table.column_names
+                     else pa.array([""] * table.num_rows, pa.string()) for name in columns], names=columns)
+
+# Get the rows of the old and new index not in both, as lists in the order of the columns
+# given. The rows are compared in Arrow, so only the rows not in both are converted to lists.
+def get_unmatched_rows(old_file, new_file, columns):
+    (old_table, new_table) = (read_table(old_file, columns), read_table(new_file, columns))
+    (old_lines, new_lines) = (join_rows(old_table), join_rows(new_table))
+
+    old_rows = to_rows(old_table.filter(pc.invert(pc.is_in(old_lines, value_set=new_lines))))
+    new_rows = to_rows(new_table.filter(pc.invert(pc.is_in(new_lines, value_set=old_lines))))
+    return (old_rows, new_rows)
+
+def join_rows(table):
+    return pc.binary_join_element_wise(*table.columns, ROW_SEPARATOR)
+
+def to_rows(table):
+    return [list(row) for row in zip(*(column.to_pylist() for column in table.columns))]
+
+def count_rows(file):
+    return pq.ParquetFile(file).metadata.num_rows
+
+# Write a CSV index file as a Parquet snapshot, deleting the CSV file if delete_csv is set
+def write_parquet(csv_file, delete_csv=False):
+    parquet_file = Path(csv_file).with_suffix(".parquet")
+    read_snapshot(csv_file).to_parquet(parquet_file, compression=PARQUET_COMPRESSION, index=False)
+    if delete_csv:
+        os.remove(csv_file)
+
+    return parquet_file
+
+# Write the index files of a run in the snapshot format in settings
+def write_snapshots(index_file, index_error_file):
+    if get_snapshot_format() == PARQUET:
+        write_parquet(index_file, is_csv_deleted())
+        write_parquet(index_error_file, is_csv_deleted())
+
+# Snapshots in the same format are compared as files, otherwise by their rows
+def snapshots_equal(file1, file2):
+    if not is_parquet(file1) and not is_parquet(file2):
+        return filecmp.cmp(file1, file2, shallow=False)
+
+    (df1, df2) = (read_snapshot(file1), read_snapshot(file2))
+    return df1.columns.tolist() == df2.columns.tolist() and df1.values.tolist() == df2.values.tolist()
+
+def get_history_file(output_dir, archive_key, snapshot_format):
+    extension = ".parquet" if snapshot_format == PARQUET else ".csv.gz"
+    return Path(output_dir) / f'{archive_key}_Index_History{extension}'
+
+def find_history_file(output_dir, archive_key):
+    for snapshot_format in (PARQUET, CSV):
+        history_file = get_history_file(output_dir, archive_key, snapshot_format)
+        if history_file.exists():
+            return history_file
+
+    return None
+
+def read_history(history_file):
+    if history_file is None:
+        return []
+
+    return read_snapshot(history_file).to_dict("records")
+
+def write_history(records, history_file):
+    df = pd.DataFrame.from_records(records).fillna("")
+    if is_parquet(history_file):
+        df.to_parquet(history_file, compression=PARQUET_COMPRESSION, index=False)
+    else:
+        df.to_csv(history_file, index=False, compression="gzip")
+
+# Get the runs (timestamps) with an index snapshot in the output folder, oldest first
+def get_snapshot_runs(output_dir, archive_key):
+    pattern = re.compile(re.escape(archive_key) + r"_(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})_Index\.(csv|parquet)$")
+    return sorted({match.group(1) for match in map(pattern.match, os.listdir(output_dir)) if match})
+
+def get_run_file(output_dir, archive_key, run, suffix):
+    return Path(output_dir) / f'{archive_key}_{run}{suffix}'
+
+# The document of an index record (author folder and file)
+def get_record_key(record, key_names):
+    return tuple(record.get(name, "") for name in key_names)
+
+def get_key_names(columns):
+    return [columns[i] for i in index_diff.get_key_columns(columns)]
+
+def records_equal(record1, record2):
+    return all(record1.get(name, "") == record2.get(name, "") for name in record1.keys() | record2.keys())
+
+# Rebuild the index and index errors of each run from the history, up to and including
+# the run given (all the runs if None). Returns the records of the last run rebuilt, keyed
+# by document, and its errors (counted, as the same error can be in a run more than once).
+def replay_history(history, run=None):
+    index = {}
+    errors = Counter()
+    key_names = None
+    for record in history:
+        if run is not None and record[RUN_COLUMN] > run:
+            break
+
+        change = record[CHANGE_COLUMN]
+        if change in (Change.ERROR, Change.ERROR_FIXED):
+            error = tuple(record.get(name, "") for name in ERROR_COLUMNS)
+            errors[error] += 1 if change == Change.ERROR else -1
+            continue
+
+        doc = {name: value for (name, value) in record.items()
+               if name not in (RUN_COLUMN, CHANGE_COLUMN) and name not in ERROR_COLUMNS}
+        key_names = key_names or get_key_names(list(doc))
+        key = get_record_key(doc, key_names)
+        if change == Change.REMOVED:
+            index.pop(key, None)
+        else:
+            index[key] = doc
+
+    return (index, +errors)
+
+# Get the index and index errors (not in the order of the run's error file) of a run
+# folded into the archive's history
+def read_history_run(output_dir, archive_key, run):
+    (index, errors) = replay_history(read_history(find_history_file(output_dir, archive_key)), run)
+    return (list(index.values()), [dict(zip(ERROR_COLUMNS, error)) for error in errors.elements()])
+
+# Get the history records of a run, the changes of its index and index errors since the
+# ones given (of the run before). Returns the records and the index and errors of the run.
+def get_run_changes(run, run_records, error_records, index, errors):
+    changes = []
+    run_index = {}
+    key_names = get_key_names(list(run_records[0])) if run_records else []
+    for record in run_records:
+        run_index[get_record_key(record, key_names)] = record
+
+    for (key, record) in run_index.items():
+        old_record = index.pop(key, None)
+        if old_record is None:
+            changes.append({RUN_COLUMN: run, CHANGE_COLUMN: Change.ADDED, **record})
+        elif not records_equal(old_record, record):
+            changes.append({RUN_COLUMN: run, CHANGE_COLUMN: Change.CHANGED, **record})
+
+    old_key_names = get_key_names(list(next(iter(index.values())))) if index else []
+    for old_record in index.values():
+        changes.append({RUN_COLUMN: run, CHANGE_COLUMN: Change.REMOVED,
+                        **{name: old_record[name] for name in old_key_names}})
+
+    run_errors = Counter(tuple(record.get(name, "") for name in ERROR_COLUMNS) for record in error_records)
+    for (change, change_errors) in ((Change.ERROR, run_errors - errors), (Change.ERROR_FIXED, errors - run_errors)):
+        for error in change_errors.elements():
+            changes.append({RUN_COLUMN: run, CHANGE_COLUMN: change, **dict(zip(ERROR_COLUMNS, error))})
+
+    return (changes, run_index, run_errors)
+
+# Fold the runs older than the runs kept into the archive's history, and write the runs
+# kept as snapshots in the format in settings. The runs kept are the last keep runs and
+# the runs from the oldest of the protected runs on. Returns the number of runs folded.
+def compact_archive(output_dir, archive_key, keep, protected_runs=()):
+    runs = get_snapshot_runs(output_dir, archive_key)
+    kept_runs = runs[-keep:] + [run for run in protected_runs if run in runs]
+    oldest_kept = min(kept_runs) if kept_runs else None
+    fold_runs = [run for run in runs if oldest_kept is None or run < oldest_kept]
+
+    snapshot_format = get_snapshot_format()
+    if fold_runs:
+        old_history_file = find_history_file(output_dir, archive_key)
+        history = read_history(old_history_file)
+        (index, errors) = replay_history(history)
+
+        for run in fold_runs:
+            run_records = read_records(get_snapshot_file(get_run_file(output_dir, archive_key, run, '_Index.csv')))
+            error_file = get_snapshot_file(get_run_file(output_dir, archive_key, run, '_Index_Error.csv'))
+            error_records = read_records(error_file) if error_file.exists() else []
+
+            (changes, index, errors) = get_run_changes(run, run_records, error_records, index, errors)
+            history.extend(changes)
+
+        history_file = get_history_file(output_dir, archive_key, snapshot_format)
+        write_history(history, history_file)
+        if old_history_file and old_history_file != history_file:
+            os.remove(old_history_file)
+
+        # Only delete the files of the runs once they are in the history
+        for run in fold_runs:
+            for suffix in RUN_FILES:
+                run_file = get_run_file(output_dir, archive_key, run, suffix)
+                if run_file.exists():
+                    os.remove(run_file)
+
+    # Snapshots written as CSV before the format was changed in settings, and the CSV files
+    # kept next to the Parquet files before DeleteIndexCSV was set
+    if snapshot_format == PARQUET:
+        for run in runs:
+            if run in fold_runs:
+                continue
+            for suffix in ['_Index.csv', '_Index_Error.csv']:
+                run_file = get_run_file(output_dir, archive_key, run, suffix)
+                if not run_file.exists():
+                    continue
+                if not run_file.with_suffix(".parquet").exists():
+                    write_parquet(run_file, is_csv_deleted())
+                elif is_csv_deleted():
+                    os.remove(run_file)
+
+    return len(fold_runs)
+
+# Compact the index snapshots of all the archives in settings
+def start():
+    print("Compacting index snapshots")
+    print("==========================")
+
+    keep = get_snapshots_to_keep()
+    for coll_name in mticonfig.coll_list:
+        for doct_name in mticonfig.doct_list:
+            archive_key = f'{MTIConfig.fileNameFormat(coll_name)}_{MTIConfig.fileNameFormat(doct_name)}'
+            output_dir = Path(mticonfig.data_dir) / archive_key
+            if not output_dir.is_dir():
+                continue
+
+            # The indexer compares new runs with the last generated and loaded runs
+            archive_data = mticonfig.exe_details if archive_key == mticonfig.archive_key else mticonfig.dat.get(archive_key, {})
+            protected_runs = [run for run in (archive_data.get(MTIDataKey.LAST_IDX_GEN_FILE_DT),
+                                              archive_data.get(MTIDataKey.LAST_IDX_LOAD_FILE_DT)) if run]
+
+            folded = compact_archive(output_dir, archive_key, keep, protected_runs)
+            print(mticonfig.idtab, f"{coll_name}:{doct_name:10}: {folded} runs folded into history, "
+                                   f"{len(get_snapshot_runs(output_dir, archive_key))} snapshots kept")
@@ -0,0 +1,276 @@
+'''
+The index store keeps the index runs, documents, load status and indexing errors of all
+the archives in a SQLite database (mti_index.db in the ScriptDataFolder), so questions
+about the archive are indexed queries instead of comparing whole CSV files, e.g.:
+
+    - documents new since the last load     (get_not_loaded)
+    - documents loaded but missing locally   (get_loaded_missing_locally)
+    - documents by author                    (get_documents_by_author)
+
+Documents are kept once per archive, keyed by author folder and document file, with the
+first and last index run they were found in, so the documents of the latest run are the
+ones whose last run is the latest run. The indexer records each run and the loader the
+status of each document it loaded (or couldn't load).
+
+With the store on, the loader takes the documents to load from the store instead of the
+Index_New file, so a document that couldn't be loaded is tried again on the next load,
+and the New tab of the Google report is exported from the same query (export_csv). The
+timestamped CSV files are still written, for the other report tabs and the index diffs.
+
+    Settings in [Settings]:
+        IndexStore=False        Keep the index runs and load status in mti_index.db
+'''
+import csv, glob, os, sqlite3
+from pathlib import Path
+from mti.mti_config import MTIConfig, mticonfig
+from mti.lazy_imports import lazy_import
+
+author_doc_scan = lazy_import("mti.author_doc_scan")
+
+# Document columns in the store and the index file column each one comes from
+DOC_COLUMNS = {
+    "first_name":       "First Name",
+    "middle_name":      "Middle Name",
+    "last_name":        "Last Name",
+    "date":             "Date",
+    "periodical":       "Periodical",
+    "title":            "{doct} Title",
+    "file":             "{doct} File",
+    "cover_file":       "{doct} Cover File",
+    "author_folder":    "Author Folder",
+    "base_path":        "Base Path",
+}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS index_runs (
+    run_id          INTEGER PRIMARY KEY,
+    archive_key     TEXT NOT NULL,
+    run_date        TEXT NOT NULL,
+    document_count  INTEGER NOT NULL,
+    error_count     INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS index_runs_archive ON index_runs (archive_key, run_id);
+
+CREATE TABLE IF NOT EXISTS documents (
+    archive_key     TEXT NOT NULL,
+    author_folder   TEXT NOT NULL,
+    file            TEXT NOT NULL,
+    doct_name       TEXT NOT NULL,
+    first_name      TEXT,
+    middle_name     TEXT,
+    last_name       TEXT,
+    date            TEXT,
+    periodical      TEXT,
+    title           TEXT,
+    cover_file      TEXT,
+    base_path       TEXT,
+    first_run_id    INTEGER NOT NULL,
+    last_run_id     INTEGER NOT NULL,
+    changed_run_id  INTEGER NOT NULL,
+    PRIMARY KEY (archive_key, author_folder, file)
+);
+CREATE INDEX IF NOT EXISTS documents_last_run ON documents (archive_key, last_run_id);
+CREATE INDEX IF NOT EXISTS documents_author ON documents (last_name, first_name, middle_name);
+
+CREATE TABLE IF NOT EXISTS load_status (
+    archive_key     TEXT NOT NULL,
+    author_folder   TEXT NOT NULL,
+    file            TEXT NOT NULL,
+    status          TEXT NOT NULL,
+    post_id         TEXT,
+    load_date       TEXT,
+    error           TEXT,
+    PRIMARY KEY (archive_key, author_folder, file)
+);
+CREATE INDEX IF NOT EXISTS load_status_status ON load_status (archive_key, status);
+CREATE INDEX IF NOT EXISTS load_status_post_id ON load_status (post_id);
+
+CREATE TABLE IF NOT EXISTS errors (
+    run_id          INTEGER NOT NULL,
+    archive_key     TEXT NOT NULL,
+    author_folder   TEXT,
+    file_name       TEXT,
+    error           TEXT
+);
+CREATE INDEX IF NOT EXISTS errors_run ON errors (run_id);
+'''
+
+# Load status of a document
+class LoadStatus:
+    LOADED      = "Loaded"      # Loaded to WordPress
+    EXISTS      = "Exists"      # Already in WordPress when loaded
+    ERROR       = "Error"       # Not loaded, will be loaded again
+    DUPLICATE   = "Duplicate"   # Not loaded, a copy of a document loaded from another folder
+
+class IndexStore:
+
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self.conn = sqlite3.connect(db_file)
+        self.conn.row_factory = sqlite3.Row
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def get_latest_run_id(self, archive_key):
+        row = self.conn.execute(
+            "SELECT MAX(run_id) FROM index_runs WHERE archive_key = ?", (archive_key,)).fetchone()
+        return row[0]
+
+    # Record an index run from the indexer's index and error files, read a row at a time.
+    # Returns the run id.
+    def record_run(self, archive_key, doct_name, run_date, index_file, index_error_file=None):
+        records = read_csv(index_file)
+        errors = read_csv(index_error_file) if index_error_file and os.path.exists(index_error_file) else ()
+
+        with self.conn:
+            run_id = self.conn.execute(
+                "INSERT INTO index_runs (archive_key, run_date, document_count, error_count) VALUES (?, ?, 0, 0)",
+                (archive_key, run_date)).lastrowid
+
+            # New documents get the run as their first run, documents with different
+            # details than last time get it as their changed run
+            doc_columns = list(DOC_COLUMNS)
+            detail_columns = [column for column in doc_columns if column not in ("author_folder", "file")]
+            document_count = self.conn.executemany(f'''
+                INSERT INTO documents (archive_key, doct_name, {", ".join(doc_columns)},
+                                       first_run_id, last_run_id, changed_run_id)
+                VALUES (:archive_key, :doct_name, {", ".join(":" + column for column in doc_columns)},
+                        :run_id, :run_id, :run_id)
+                ON CONFLICT (archive_key, author_folder, file) DO UPDATE SET
+                    last_run_id = excluded.last_run_id,
+                    changed_run_id = CASE WHEN ({" OR ".join(f"{column} IS NOT excluded.{column}" for column in detail_columns)})
+                                     THEN excluded.last_run_id ELSE changed_run_id END,
+                    {", ".join(f"{column} = excluded.{column}" for column in detail_columns)}
+                ''',
+                (to_doc_row(record, archive_key, doct_name, run_id)
+                 for record in records)).rowcount
+
+            error_count = self.conn.executemany(
+                "INSERT INTO errors (run_id, archive_key, author_folder, file_name, error) VALUES (?, ?, ?, ?, ?)",
+                ((run_id, archive_key, error.get("Author Directory"), error.get("File Name"), error.get("Error"))
+                 for error in errors)).rowcount
+
+            self.conn.execute("UPDATE index_runs SET document_count = ?, error_count = ? WHERE run_id = ?",
+                              (max(0, document_count), max(0, error_count), run_id))
+
+        return run_id
+
+    # Record the documents loaded (records with a Post ID) and not loaded (records with an
+    # Error) by the WordPress loader
+    def record_loads(self, archive_key, doct_name, loaded_records, error_records, load_date):
+        rows = []
+        for record in loaded_records:
+            rows.append(to_load_row(archive_key, doct_name, record, LoadStatus.LOADED,
+                                    record.get('Post ID'), record.get('WBG Load Date') or load_date, None))
+        for record in error_records:
+            if record.get('Duplicate Of'):
+                status = LoadStatus.DUPLICATE
+            elif record.get('Post IDs'):
+                status = LoadStatus.EXISTS
+            else:
+                status = LoadStatus.ERROR
+            rows.append(to_load_row(archive_key, doct_name, record, status,
+                                    record.get('Post IDs'), load_date, record.get('Error')))
+
+        with self.conn:
+            self.conn.executemany('''
+                INSERT OR REPLACE INTO load_status (archive_key, author_folder, file, status, post_id, load_date, error)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', rows)
+
+    # Load the load status from the Loaded files the loader wrote before there was a store
+    def import_loaded_files(self, archive_key, doct_name, output_dir):
+        for loaded_file in sorted(glob.glob(os.path.join(output_dir, f'{glob.escape(archive_key)}_*_Loaded.csv'))):
+            self.record_loads(archive_key, doct_name, read_csv(loaded_file, delimiter="|"), [], None)
+
+    def has_load_status(self, archive_key):
+        return self.conn.execute(
+            "SELECT 1 FROM load_status WHERE archive_key = ? LIMIT 1", (archive_key,)).fetchone() is not None
+
+    # Documents in the latest index run not loaded to WordPress (or not loaded because
+    # of an error), duplicates of a loaded document are left out
+    def get_not_loaded(self, archive_key):
+        return self.conn.execute('''
+            SELECT d.* FROM documents d
+            LEFT JOIN load_status l USING (archive_key, author_folder, file)
+            WHERE d.archive_key = ? AND d.last_run_id = ?
+              AND (l.status IS NULL OR l.status = ?)
+            ORDER BY d.author_folder, d.file
+            ''', (archive_key, self.get_latest_run_id(archive_key), LoadStatus.ERROR)).fetchall()
+
+    # Documents loaded to WordPress that were not found by the latest index run
+    def get_loaded_missing_locally(self, archive_key):
+        return self.conn.execute('''
+            SELECT l.*, d.title, d.first_name, d.middle_name, d.last_name, d.last_run_id
+            FROM load_status l
+            LEFT JOIN documents d USING (archive_key, author_folder, file)
+            WHERE l.archive_key = ? AND l.status = ?
+              AND (d.last_run_id IS NULL OR d.last_run_id < ?)
+            ORDER BY l.author_folder, l.file
+            ''', (archive_key, LoadStatus.LOADED, self.get_latest_run_id(archive_key))).fetchall()
+
+    # Documents found by the latest index run of each archive for the author
+    def get_documents_by_author(self, first_name, last_name, middle_name=None):
+        query = '''
+            SELECT d.* FROM documents d
+            JOIN (SELECT archive_key, MAX(run_id) AS run_id FROM index_runs GROUP BY archive_key) r
+              ON r.archive_key = d.archive_key AND r.run_id = d.last_run_id
+            WHERE d.last_name = ? AND d.first_name = ?
+            '''
+        params = [last_name, first_name]
+        if middle_name is not None:
+            query += " AND d.middle_name = ?"
+            params.append(middle_name)
+
+        return self.conn.execute(query + " ORDER BY d.archive_key, d.author_folder, d.file", params).fetchall()
+
+    def get_run_errors(self, run_id):
+        return self.conn.execute(
+            "SELECT author_folder, file_name, error FROM errors WHERE run_id = ?", (run_id,)).fetchall()
+
+# Convert an index record to the document columns in the store, plus the run details
+def to_doc_row(record, archive_key, doct_name, run_id):
+    doct_prefix = MTIConfig.tosingular(doct_name)
+    row = {column: record.get(field.format(doct=doct_prefix), "") for (column, field) in DOC_COLUMNS.items()}
+    row.update(archive_key=archive_key, doct_name=doct_name, run_id=run_id)
+    return row
+
+def to_load_row(archive_key, doct_name, record, status, post_id, load_date, error):
+    doct_prefix = MTIConfig.tosingular(doct_name)
+    return (archive_key, record.get('Author Folder', ""), record.get(f"{doct_prefix} File", ""),
+            status, post_id, load_date, error)
+
+# Convert document rows from the store back to index records
+def to_records(rows, doct_name):
+    doct_prefix = MTIConfig.tosingular(doct_name)
+    return [{field.format(doct=doct_prefix): row[column] for (column, field) in DOC_COLUMNS.items()} for row in rows]
+
+# Rows of a CSV file as dicts, read as they are used instead of all at once
+def read_csv(file, delimiter=","):
+    with open(file, "r", newline="", encoding="utf-8") as csvfile:
+        yield from csv.DictReader(csvfile, delimiter=delimiter)
+
+# Export document rows to an index CSV file (e.g. for the Google report tabs)
+def export_csv(rows, doct_name, csv_file, delimiter=","):
+    doct_prefix = MTIConfig.tosingular(doct_name)
+    with open(csv_file, "w", newline="", encoding="utf-8") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=author_doc_scan.get_fieldnames(doct_prefix),
+                                delimiter=delimiter, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(to_records(rows, doct_name))
+
+def is_enabled():
+    return mticonfig.ini['Settings'].getboolean('IndexStore', fallback=False)
+
+# The store is opened once and shared for the run
+store = None
+
+def get_index_store():
+    global store
+    if store is None:
+        store = IndexStore(Path(mticonfig.data_dir) / 'mti_index.db')
+
+    return store
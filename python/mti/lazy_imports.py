@@ -0,0 +1,38 @@
+'''
+Lazy imports for the libraries that are slow to import (pandas, pyarrow, PIL, gspread and
+the Google auth libraries, requests, rich), so a run only pays for the ones it uses, e.g.
+the WordPress file sync never loads Google or PIL. A lazy module is imported the first
+time one of its attributes is used:
+
+    pd = lazy_import("pandas")
+    pd.read_csv(...)                    # pandas is imported here
+
+Optional libraries are checked with is_available, which finds the library without
+importing it. See benchmarks/startup.py for the import time of each quick launch option.
+'''
+import importlib, importlib.util
+
+class LazyModule:
+    def __init__(self, name):
+        self._lazy_name = name
+        self._lazy_module = None
+
+    def __getattr__(self, attr):
+        if self._lazy_module is None:
+            self._lazy_module = importlib.import_module(self._lazy_name)
+
+        return getattr(self._lazy_module, attr)
+
+    def __repr__(self):
+        return f"<lazy module '{self._lazy_name}'{'' if self._lazy_module is None else ' (imported)'}>"
+
+def lazy_import(name):
+    return LazyModule(name)
+
+# Check a library is installed without importing it (only the top level package is found,
+# as finding a sub-module imports its package)
+def is_available(name):
+    try:
+        return importlib.util.find_spec(name.split(".")[0]) is not None
+    except ValueError:
+        return False
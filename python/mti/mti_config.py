@@ -1,8 +1,9 @@
-import configparser, json
+import configparser, os
 from datetime import datetime
 from pathlib import Path
 from typing import Self
 from xml.sax.handler import property_declaration_handler
+from mti.archiver_state import ArchiverState, ArchiverStateError
 
 class MTIDataKey:
 	LAST_INDEXER_RUN_DT		= "Last Indexer Run Date"
@@ -16,6 +17,9 @@ class MTIDataKey:
 	COLLECTION              = "Selected Collection"
 	DOCUMENT_TYPE			= "Selected Document Type"
 
+# The settings and the archiver data are loaded the first time they are used, not when
+# the config is created, so importing a module (e.g. in the worker processes generating
+# covers and hashing documents) doesn't read any files. Each is read once and kept.
 class MTIConfig:
 
 	idtab = "\t==>"
@@ -24,13 +28,43 @@ class MTIConfig:
 	script_dir		= Path(__file__).parent.parent.parent
 	#settings_file	= script_dir / 'settings' / 'archive.ini'
 	# TODO: Not sure why setting MTIConfig.settings_file doesn't work (somehow not setting correct scope)
-	settings_file = Path(r"F:\Scripts\MTI-Archiver") / 'settings' / 'archive.ini'
+	# The settings file can be set with the MTI_ARCHIVER_SETTINGS environment variable
+	settings_file = Path(os.environ.get("MTI_ARCHIVER_SETTINGS", Path(r"F:\Scripts\MTI-Archiver") / 'settings' / 'archive.ini'))
 	indexer_script	= script_dir / 'powershell' / 'author_document_scan.ps1'
 
-	def __init__(self):
-
-		# Load INI from archive.ini file
-		self.load_ini()
+	# Attributes loaded on first use and the method loading them (the private collection and
+	# document type attributes are the ones behind the properties below)
+	LAZY_ATTRIBUTES = {
+		"ini":					"load_ini",
+		"data_dir":				"load_ini",
+		"coll_list":			"load_ini",
+		"doct_list":			"load_ini",
+		"temp_dir":				"load_ini",
+		"data_file":			"load_ini",
+		"state_file":			"load_ini",
+		"dat":					"load_data",
+		"exe_summary":			"load_data",
+		"exe_details":			"load_data",
+		"_MTIConfig__coll_idx":	"load_data",
+		"_MTIConfig__coll_key":	"load_data",
+		"_MTIConfig__doct_idx":	"load_data",
+		"_MTIConfig__doct_key":	"load_data",
+	}
+
+	def __init__(self, settings_file: Path = None):
+		self.settings_file = settings_file if settings_file else MTIConfig.settings_file
+
+	# Only called for attributes not set yet, so once loaded they are plain attributes
+	def __getattr__(self, name):
+		load = MTIConfig.LAZY_ATTRIBUTES.get(name)
+		if load is None:
+			raise AttributeError(f"'MTIConfig' object has no attribute '{name}'")
+
+		getattr(self, load)()
+		return self.__dict__[name]
+
+	# Load the archiver data and the collection and document type selected last time
+	def load_data(self):
 
 		# Load DAT JSON file config attributes
 		self.dat		= self.load_archiver_data()
@@ -61,6 +95,7 @@ class MTIConfig:
 
 	@coll_idx.setter
 	def coll_idx(self, new_value):
+		self.dat		# The archiver data is loaded first, as it sets the collection
 		if not hasattr(self,'__coll_idx') or self.__coll_idx != new_value:
 			self.__coll_idx = new_value
 			self.__coll_key = MTIConfig.fileNameFormat(self.coll_list[self.coll_idx])
@@ -76,6 +111,7 @@ class MTIConfig:
 
 	@doct_idx.setter
 	def doct_idx(self, new_value):
+		self.dat		# The archiver data is loaded first, as it sets the document type
 		if (not hasattr(self,'__doct_idx') or self.__doct_idx != new_value):
 			self.__doct_idx = new_value
 			self.__doct_key = MTIConfig.fileNameFormat(self.doct_list[self.doct_idx])
@@ -87,8 +123,9 @@ class MTIConfig:
 
 	@property
 	def archive_key(self):
-		#Note in constructor doct_key may still not have been initialized
-		return f'{self.__coll_key}_{self.__doct_key}' if hasattr(self,'_MTIConfig__doct_key') else ""
+		self.dat		# Loads the collection and document type selected last time
+		#Note while loading doct_key may still not have been initialized
+		return f'{self.__coll_key}_{self.__doct_key}' if '_MTIConfig__doct_key' in self.__dict__ else ""
 
 	@property
 	def archive_sectkey(self):
@@ -106,7 +143,7 @@ class MTIConfig:
 		# Intiialize ini to config parser
 		self.ini = configparser.ConfigParser()
 		
-		ini_file = settings_file if settings_file else MTIConfig.settings_file
+		ini_file = settings_file if settings_file else self.settings_file
 
 		# Load INI from file
 		try:
@@ -123,16 +160,21 @@ class MTIConfig:
 
 		# Setup temp dir
 		self.temp_dir		= Path(self.data_dir) / 'temp'
-		self.data_file		= Path(self.data_dir) / 'mtiarchiver.json'
+		self.data_file		= Path(self.data_dir) / 'mtiarchiver.json'	# Before the state store
+		self.state_file		= Path(self.data_dir) / 'mtiarchiver.db'
 
+	# The archiver data is kept in the state store, one row per archive (see archiver_state)
 	def load_archiver_data(self):
 		data = {}
+		self.state_store = ArchiverState(self.state_file, self.data_file)
+
 		# Load existing data
 		try:
-			with open(self.data_file, 'r') as file:
-				data = json.load(file)
-		except IOError:
-			print('WARNING: Missing previous execution data.')
+			(data, found) = self.state_store.load()
+			if not found:
+				print('WARNING: Missing previous execution data.')
+		except ArchiverStateError as e:
+			print(f'WARNING: {e.message}')
 	
 		return data
 
@@ -144,14 +186,18 @@ class MTIConfig:
 		self.dat[self.archive_key]			= self.exe_details
 		self.dat[MTIDataKey.SUMMARY_KEY]	= self.exe_summary
 		
+		# Only the rows of this archive and the summary are saved, the other archives' rows
+		# may have been saved by another run since they were loaded
 		try:
 			print("Saving execution details ... .", end="")
-			with open(self.data_file, 'w') as file:
-				json.dump(self.dat, file, indent=4)
+			self.state_store.save({
+				self.archive_key:			self.exe_details,
+				MTIDataKey.SUMMARY_KEY:		self.exe_summary
+			})
 		
 			print("done.")
-		except IOError:
-			print('ERROR occured. Please verify output and data.')
+		except ArchiverStateError as e:
+			print(f'ERROR occured. Please verify output and data. {e.message}')
 
 	def get_exe_details(self):
 		return self.dat.get(self.archive_key) if self.dat.get(self.archive_key) else {}
@@ -214,6 +260,6 @@ class MTIConfig:
 
 
 		
-# Setup Global Variables, note config is loaded when created, no need to call load again
+# Setup Global Variables, note the settings and data are loaded when first used
 mticonfig = MTIConfig()
 		
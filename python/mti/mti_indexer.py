@@ -1,5 +1,5 @@
-import subprocess, filecmp, difflib, os, shutil
-from mti import author_doc_scan
+import subprocess, os, shutil
+from mti import author_doc_scan, doc_hasher, index_diff, index_snapshots, index_store, scan_snapshot
 from mti.mti_config import MTIDataKey, mticonfig
 from pathlib import Path
 
@@ -10,34 +10,22 @@ class IndexerException(Exception):
 
 class MTIIndexer:
     
+    # Find the documents added, removed and changed in the new index file (file2) since
+    # the old one (file1), see index_diff
     @staticmethod
-    def find_new_lines(file1, file2):
-        with open(file1, 'r', encoding="utf-8") as f1, open(file2, 'r', encoding="utf-8") as f2:
-            # Read both files
-            file1_lines = f1.readlines()
-            file2_lines = f2.readlines()
-
-            # Get the differences between the files using unified_diff
-            #diff = difflib.unified_diff(file1_lines, file2_lines, fromfile=str(file1), tofile=str(file2))
-            diff = difflib.ndiff(file1_lines, file2_lines)
-            #print('\n'.join(diff))
-            #TODO: It appears once you process the diff, you can't read the same content from it again, it appears to become empty
-
-            # Extract only the new lines that are in file2
-            new_lines = [line[2:] for line in diff if line.startswith('+ ')]
-
-            # Add header row from
-            new_lines.insert(0, file1_lines[0])
-        
-            # Check if more new lines than files indexed (account for header row, hence -1)
-            if ((len(new_lines) - 1) > len(file2_lines)):
-                raise IndexerException("Issues detected: More new items found than total items indexed. Verify data files created for archive.")
-
-            return new_lines
-
-    # This method starts the indexing process based on the current collection & document type selected
+    def find_changes(file1, file2):
+        try:
+            return index_diff.diff_index_files(file1, file2)
+        except index_diff.IndexDiffError as e:
+            raise IndexerException(f"Issues detected: {e.message} Verify data files created for archive.")
+
+    # This method starts the indexing process based on the current collection & document type selected.
+    # If changed_authors is passed, those author folders are rescanned (see ScanManifest),
+    # and with only_changed the others are reused without checking them for changes.
+    # Watch mode indexes one archive at a time as it changes, so it passes check_duplicates
+    # False to skip hashing the documents of every archive on each run.
     @staticmethod
-    def start():
+    def start(changed_authors=None, check_duplicates=True, only_changed=False):
         folder_to_index = ""
         try:                        
             folder_to_index = mticonfig.ini[mticonfig.archive_sectkey]['DocumentFolder'].strip()
@@ -52,13 +40,19 @@ class MTIIndexer:
         index_debug_file    = Path(mticonfig.output_dir + '/' + file_prefix + '_Index_Debug.txt')
         index_error_file    = Path(mticonfig.output_dir + '/' + file_prefix + '_Index_Error.csv')
         index_new_file      = Path(mticonfig.output_dir + '/' + file_prefix + '_Index_New.csv')
+        index_changed_file  = Path(mticonfig.output_dir + '/' + file_prefix + '_Index_Changed.csv')
+        index_removed_file  = Path(mticonfig.output_dir + '/' + file_prefix + '_Index_Removed.csv')
     
         print("Indexing started")
         print("================")
         print("  Document Folder", folder_to_index)
     
         #run_powershell_author_doc_scan(folder_to_index, index_output_file, index_debug_file, index_error_file)
-        run_python_author_doc_scan(folder_to_index, index_output_file, index_debug_file, index_error_file)
+        run_python_author_doc_scan(folder_to_index, index_output_file, index_debug_file, index_error_file, changed_authors, only_changed)
+
+        # Record the run in the index store (before the files are removed if unchanged)
+        if index_store.is_enabled():
+            record_index_store_run(index_output_file, index_error_file, timestamp)
 
         # Update some archiver data
         mticonfig.exe_details[MTIDataKey.LAST_INDEXER_RUN_DT]   = timestamp     
@@ -72,14 +66,14 @@ class MTIIndexer:
         # Check current indexer output to output from last execution
         changes_found = False
         if last_idx_load_dt:
-            last_idx_output_file = Path(mticonfig.output_dir + '/' + mticonfig.archive_key + '_' + last_idx_gen_dt + '_Index.csv')
-            last_idx_error_file  = Path(mticonfig.output_dir + '/' + mticonfig.archive_key + '_' + last_idx_gen_dt + '_Index_Error.csv')
+            last_idx_output_file = index_snapshots.get_snapshot_file(mticonfig.output_dir + '/' + mticonfig.archive_key + '_' + last_idx_gen_dt + '_Index.csv')
+            last_idx_error_file  = index_snapshots.get_snapshot_file(mticonfig.output_dir + '/' + mticonfig.archive_key + '_' + last_idx_gen_dt + '_Index_Error.csv')
             
 
             # If last index output is same as current, no chances since las load, then
             # delete output, no need to keep them around
-            if (filecmp.cmp(index_output_file, last_idx_output_file, shallow=False) and
-               filecmp.cmp(index_error_file, last_idx_error_file, shallow=False)):
+            if (index_snapshots.snapshots_equal(index_output_file, last_idx_output_file) and
+               index_snapshots.snapshots_equal(index_error_file, last_idx_error_file)):
                 os.remove(index_output_file)
                 os.remove(index_debug_file)
                 os.remove(index_error_file)
@@ -89,14 +83,22 @@ class MTIIndexer:
             else:
                 changes_found           = True              
                 
-                idx_comp_file = Path(mticonfig.output_dir + '/' + mticonfig.archive_key + '_' + last_idx_load_dt + '_Index.csv')
+                idx_comp_file = index_snapshots.get_snapshot_file(mticonfig.output_dir + '/' + mticonfig.archive_key + '_' + last_idx_load_dt + '_Index.csv')
                 
-                # Find the new lines
-                newlines = MTIIndexer.find_new_lines(idx_comp_file, index_output_file)              
+                # Find the new documents, and the changed and removed ones which are written
+                # to their own files instead of being loaded as new
+                diff = MTIIndexer.find_changes(idx_comp_file, index_output_file)
                 
-                print(mticonfig.idtab, 'New Documents Identified   :', len(newlines)-1)
-                with open(index_new_file, "w", encoding="utf-8") as file:
-                    file.writelines(line for line in newlines)
+                print(mticonfig.idtab, 'New Documents Identified   :', len(diff.added))
+                print(mticonfig.idtab, 'Changed Documents          :', len(diff.changed))
+                print(mticonfig.idtab, 'Removed Documents          :', len(diff.removed))
+                diff.write_rows(index_new_file, diff.added)
+                if diff.changed:
+                    diff.write_rows(index_changed_file, diff.changed)
+                    print(f"\t==> Changed documents file created: {index_changed_file}")
+                if diff.removed:
+                    diff.write_rows(index_removed_file, diff.removed)
+                    print(f"\t==> Removed documents file created: {index_removed_file}")
         
         # The entire index is new as it has never been loaded
         else:
@@ -108,10 +110,18 @@ class MTIIndexer:
         if changes_found:
             mticonfig.exe_details[MTIDataKey.LAST_IDX_GEN_FILE_DT]  = timestamp
             print(f"\t==> Index file created: {index_new_file}")
+
+            # Keep the index of the run as a snapshot in the format in settings
+            index_snapshots.write_snapshots(index_output_file, index_error_file)
         
         print()
         mticonfig.save_archiver_data()
 
+        # Check for documents filed more than once across all the archives
+        if check_duplicates and doc_hasher.is_enabled():
+            print()
+            doc_hasher.start()
+
 def run_powershell_author_doc_scan(folder_to_index, index_output_file, index_debug_file, index_error_file):
     #Powershell command arguments for indexer script
     ps_command = f"& '{mticonfig.indexer_script}' -foldersPath '{folder_to_index}' -outputCSV '{index_output_file}' "
@@ -129,5 +139,29 @@ def run_powershell_author_doc_scan(folder_to_index, index_output_file, index_deb
     if (result.returncode != 0):
         raise IndexerException("Error encountered in Powershell script to process folder.")
 
-def run_python_author_doc_scan(folder_to_index, index_output_file, index_debug_file, index_error_file):
-    author_doc_scan.process_all_author_folders(folder_to_index, mticonfig.doct_name, index_output_file, index_debug_file, index_error_file, mticonfig.debug_flag('indexer'))
+def record_index_store_run(index_output_file, index_error_file, timestamp):
+    store = index_store.get_index_store()
+
+    # Get the load status of documents loaded before the store was used
+    if not store.has_load_status(mticonfig.archive_key):
+        store.import_loaded_files(mticonfig.archive_key, mticonfig.doct_name, mticonfig.output_dir)
+
+    store.record_run(mticonfig.archive_key, mticonfig.doct_name, timestamp, index_output_file, index_error_file)
+    print(mticonfig.idtab, 'Documents Not Yet Loaded   :', len(store.get_not_loaded(mticonfig.archive_key)))
+
+# Unchanged author folders are reused from the scan snapshot for the archive (see
+# scan_snapshot). If changed_authors is passed, those author folders are rescanned
+# without checking them for changes, and with only_changed the others are reused
+# without checking them either.
+def run_python_author_doc_scan(folder_to_index, index_output_file, index_debug_file, index_error_file, changed_authors=None, only_changed=False):
+    snapshot = scan_snapshot.get_selected_snapshot(folder_to_index)
+
+    snapshot.changed_authors = changed_authors
+    snapshot.only_changed = only_changed
+    try:
+        author_doc_scan.process_all_author_folders(folder_to_index, mticonfig.doct_name, index_output_file, index_debug_file, index_error_file, mticonfig.debug_flag('indexer'), manifest=snapshot)
+    finally:
+        snapshot.changed_authors = None
+        snapshot.only_changed = False
+
+    snapshot.save()
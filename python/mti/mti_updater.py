@@ -244,7 +244,8 @@ def process_cover_file(w_book, old_file, old_part, new_part):
 
 # This renames a file by replacing the old_part of the filename with the new_part in 
 # the file system and removes the file from WordPress so it can later be reloaded with 
-# the new file name.
+# the new file name. A file in the media cache is renamed in WordPress instead, so the
+# same media is reused when the book is updated (see media_cache).
 #
 # The "part" of the file name is usually the component separated by an "_". This can be
 # tht title, author, publication, etc.
@@ -258,8 +259,11 @@ def process_file(base, folder, old_file, old_part, new_part, media_id):
     os.rename(os.path.join(base, folder, old_file), os.path.join(base, folder, new_file))
     print(f"Renamed file: {old_file} -> {new_file}")
 
-    wbgclient.delete_media(media_id)
-    print("Deleted old file from WordPress:", media_id)
+    if wbgclient.rename_cached_media(media_id, new_file):
+        print("Renamed file in WordPress:", media_id)
+    else:
+        wbgclient.delete_media(media_id)
+        print("Deleted old file from WordPress:", media_id)
 
     return new_file
 
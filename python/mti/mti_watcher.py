@@ -0,0 +1,190 @@
+'''
+Watch mode keeps the index for every archive folder up to date as documents are dropped
+into the DocumentFolders, so there is no need to run the indexer from the menu.
+
+File system events (from the watchdog library) are collected per archive as the set of
+author folders they happened in. Once no new events have come in for the debounce time,
+the indexer is run for that archive only, rescanning those author folders; the rest are
+reused from the scan snapshot without checking them, so a run doesn't walk the archive.
+New documents end up in the archive's Index_New file, the same as a regular indexer run,
+ready for the loader. Documents are not hashed for duplicates in watch mode (that reads
+every archive), run the indexer from the menu for that.
+
+The covers the indexer and the loader generate into the author folders (see
+cover_generator) don't count as changes, or each run would start another one.
+
+Every WatchPollSeconds the archives are polled by checking the folder times and file
+stats in the scan snapshot, so a missed event doesn't leave stale results for long. If
+watchdog is not installed, or a folder can't be watched (e.g. some network shares),
+polling is the only way its changes are found.
+'''
+import os, time, threading
+from datetime import datetime
+from pathlib import Path
+from mti.mti_config import mticonfig
+from mti.mti_indexer import MTIIndexer
+from mti import cover_generator, scan_snapshot
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+# An archive DocumentFolder being watched and the author folders changed in it
+class WatchedArchive:
+    def __init__(self, coll_name, doct_name, folder):
+        self.coll_name = coll_name
+        self.doct_name = doct_name
+        self.folder = folder
+
+        self.changed_authors = set()
+        self.last_change_time = 0
+
+    @property
+    def archive_sectkey(self):
+        return f'{self.coll_name}:{self.doct_name}'
+
+class AuthorFolderEventHandler(FileSystemEventHandler):
+    def __init__(self, watcher, archive):
+        self.watcher = watcher
+        self.archive = archive
+
+    def on_any_event(self, event):
+        # Files only being read don't change the index, and a folder is modified by the
+        # changes to its files, which have their own events
+        if event.event_type in ('opened', 'closed_no_write'):
+            return
+        if event.is_directory and event.event_type == 'modified':
+            return
+
+        for path in (event.src_path, getattr(event, 'dest_path', None)):
+            if path and not is_generated_cover(path):
+                self.watcher.add_changed_path(self.archive, path)
+
+# Covers generated for the documents (see cover_generator)
+def is_generated_cover(path):
+    return os.fsdecode(path).endswith((cover_generator.CARD_COVER_SUFFIX, cover_generator.PDF_COVER_SUFFIX))
+
+class MTIWatcher:
+
+    def __init__(self):
+        self.debounce_secs  = mticonfig.ini['Settings'].getint('WatchDebounceSeconds', fallback=5)
+        self.poll_secs      = mticonfig.ini['Settings'].getint('WatchPollSeconds', fallback=60)
+        self.lock           = threading.Lock()
+        self.archives       = MTIWatcher.get_watched_archives()
+        self.observer       = None
+
+    # Get the archives in settings with a DocumentFolder
+    @staticmethod
+    def get_watched_archives():
+        archives = []
+        for coll_name in mticonfig.coll_list:
+            for doct_name in mticonfig.doct_list:
+                try:
+                    folder = mticonfig.ini[f'{coll_name}:{doct_name}']['DocumentFolder'].strip()
+                    if len(folder) > 0 and os.path.isdir(folder):
+                        archives.append(WatchedArchive(coll_name, doct_name, folder))
+                except KeyError:
+                    continue
+
+        return archives
+
+    # Record the author folder a changed path is in
+    def add_changed_path(self, archive, path):
+        rel_path = Path(os.path.relpath(path, archive.folder))
+        if rel_path.parts and rel_path.parts[0] not in ('.', '..'):
+            self.add_changed_authors(archive, {rel_path.parts[0]})
+
+    def add_changed_authors(self, archive, author_names):
+        with self.lock:
+            archive.changed_authors.update(author_names)
+            archive.last_change_time = time.monotonic()
+
+    # Check the polled archives for changed author folders using the scan snapshot
+    def poll(self, archives):
+        for archive in archives:
+            try:
+                snapshot = scan_snapshot.get_snapshot(archive.coll_name, archive.doct_name, archive.folder)
+                changed_authors = snapshot.find_changed_authors()
+                if changed_authors:
+                    self.add_changed_authors(archive, changed_authors)
+            except OSError as e:
+                print(f"Unable to check {archive.folder} for changes ({e}).")
+
+    def start_observer(self):
+        if Observer is None:
+            print("Watchdog library not installed, polling folders for changes.")
+            return
+
+        self.observer = Observer()
+        for archive in self.archives:
+            try:
+                self.observer.schedule(AuthorFolderEventHandler(self, archive), archive.folder, recursive=True)
+            except OSError as e:
+                print(f"Unable to watch {archive.folder}, polling for changes instead ({e}).")
+
+        self.observer.start()
+
+    # Index the archives with changes and no new events for the debounce time. The author
+    # folders not changed are reused without checking them, the poll checks them.
+    def index_changed_archives(self):
+        for archive in self.archives:
+            with self.lock:
+                if (not archive.changed_authors or
+                    time.monotonic() - archive.last_change_time < self.debounce_secs):
+                    continue
+                changed_authors = archive.changed_authors
+                archive.changed_authors = set()
+
+            print(f"\n[{datetime.now():%Y-%m-%d %H:%M:%S}] Changes in {archive.archive_sectkey}:",
+                  ", ".join(sorted(changed_authors)))
+            try:
+                select_archive(archive)
+                os.makedirs(mticonfig.output_dir, exist_ok=True)
+                MTIIndexer.start(changed_authors, check_duplicates=False, only_changed=True)
+            except Exception as e:
+                # Keep the changes to try again after the next debounce
+                print(f"Unable to index {archive.archive_sectkey}!\n    !!! ", e)
+                self.add_changed_authors(archive, changed_authors)
+
+    def start(self):
+        print("Watching archive folders for changes (press Ctrl+C to stop)")
+        print("===========================================================")
+        for archive in self.archives:
+            print(mticonfig.idtab, f"{archive.archive_sectkey}: {archive.folder}")
+
+        # Pick up any changes made since the last indexer run before watching for events
+        self.poll(self.archives)
+        self.start_observer()
+
+        last_poll_time = time.monotonic()
+        try:
+            while True:
+                self.index_changed_archives()
+                time.sleep(1)
+
+                if time.monotonic() - last_poll_time >= self.poll_secs:
+                    self.poll(self.archives)
+                    last_poll_time = time.monotonic()
+        except KeyboardInterrupt:
+            print("\nWatch mode stopped.")
+        finally:
+            if self.observer:
+                self.observer.stop()
+                self.observer.join()
+
+# Make the archive the active collection and document type in the config
+def select_archive(archive):
+    mticonfig.coll_idx = mticonfig.coll_list.index(archive.coll_name)
+    mticonfig.doct_idx = mticonfig.doct_list.index(archive.doct_name)
+
+def start():
+    # Restore the archive selected when done since watching switches between archives
+    (coll_idx, doct_idx) = (mticonfig.coll_idx, mticonfig.doct_idx)
+    try:
+        MTIWatcher().start()
+    finally:
+        mticonfig.coll_idx = coll_idx
+        mticonfig.doct_idx = doct_idx
@@ -0,0 +1,100 @@
+'''
+PDF covers are covers made from the first page of the document, for the documents without
+a cover file, instead of the title and author card (CoverSource=PDF in settings). The page
+is rendered with pypdfium2 (PDFium, no other programs needed) in the cover pool's processes
+like the cards, and the card is still used for a document whose first page can't be
+rendered (e.g. a damaged or password protected PDF), or if pypdfium2 isn't installed.
+
+Rendered pages are cached on disk (pdf_cover_cache in the ScriptDataFolder) by the hash
+of the PDF, so a document that is renamed, moved or filed twice is never rendered again,
+its cover is copied from the cache. The hash of a PDF already hashed by doc_hasher (and
+unchanged since) is taken from its digest cache instead of reading the PDF again.
+'''
+import os, shutil, threading
+from mti.lazy_imports import is_available, lazy_import
+
+pdfium = lazy_import("pypdfium2") if is_available("pypdfium2") else None
+
+# Imported when first used, as doc_hasher imports the index readers, which import the scan
+doc_hasher = lazy_import("mti.doc_hasher")
+
+# Width of the rendered page, the height is the page's for its width
+COVER_WIDTH = 600
+JPEG_QUALITY = 85
+
+# PDFium can't render in two threads at once, and covers are rendered in the scan
+# threads when there is no cover pool
+render_lock = threading.Lock()
+
+def pdf_rendering_available():
+    return pdfium is not None
+
+# Render the first page of the PDF, width pixels wide
+def render_first_page(pdf_path, width=COVER_WIDTH):
+    with render_lock:
+        pdf = pdfium.PdfDocument(pdf_path)
+        try:
+            page = pdf[0]
+            try:
+                bitmap = page.render(scale=width / page.get_width())
+                img = bitmap.to_pil()
+            finally:
+                page.close()
+        finally:
+            pdf.close()
+
+    return img.convert("RGB")
+
+# Makes the covers from the PDFs, passed to the cover pool's processes so it only holds
+# the settings (the digest cache is loaded in each process the first time it's needed)
+class PdfCover:
+    def __init__(self, cache_dir, width=COVER_WIDTH, digest_cache_file=None):
+        self.cache_dir = cache_dir
+        self.width = width
+        self.digest_cache_file = digest_cache_file
+        self.digest_cache = None
+
+    def __getstate__(self):
+        return {**self.__dict__, "digest_cache": None}
+
+    # The hash of the PDF from doc_hasher's digest cache if it's unchanged since hashed
+    def hash_pdf(self, pdf_path):
+        if self.digest_cache_file:
+            if self.digest_cache is None:
+                self.digest_cache = doc_hasher.DigestCache(self.digest_cache_file)
+            digest = self.digest_cache.get(doc_hasher.get_path_key(pdf_path), os.stat(pdf_path))
+            if digest:
+                return digest
+
+        return doc_hasher.hash_file(pdf_path)
+
+    # Write the cover of the PDF to output_path, from the cache if the PDF was rendered
+    # before. Returns False if the first page couldn't be rendered.
+    def generate_cover(self, pdf_path, output_path):
+        try:
+            cache_file = os.path.join(self.cache_dir, f"{self.hash_pdf(pdf_path)}_{self.width}w.jpg")
+            if not os.path.exists(cache_file):
+                img = render_first_page(pdf_path, self.width)
+
+                # Write to a temp file first so a failed save doesn't leave a partial cover,
+                # named for the thread as well as the process since scan threads (one cover
+                # process) can render the same PDF (a duplicate) at the same time
+                os.makedirs(self.cache_dir, exist_ok=True)
+                temp_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+                try:
+                    img.save(temp_file, "JPEG", quality=JPEG_QUALITY, optimize=True)
+                    os.replace(temp_file, cache_file)
+                except Exception:
+                    remove_file(temp_file)
+                    raise
+        except (pdfium.PdfiumError, OSError):
+            return False
+
+        shutil.copyfile(cache_file, output_path)
+        return True
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
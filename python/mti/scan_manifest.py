@@ -0,0 +1,151 @@
+'''
+The scan manifest lets the indexer skip author folders that have not changed since the
+last run. It is saved per archive (next to mtiarchiver.db) and records for each author
+folder the modified times of the folder and its sub-folders, the size and modified time
+of each file, and the index results (records and errors) of the last scan.
+
+Adding, removing or renaming a file changes the modified time of the folder it is in, and
+replacing a file changes its size or modified time, so when none of an author folder's
+folder times and file stats have changed, its cached results are reused without parsing
+file names or generating covers.
+
+The manifest is a SQLite database with a row per author folder, so only the folder being
+checked or reused is read into memory, not the results of the whole archive. Without a
+manifest file (see scan_snapshot) the manifest is kept in an in-memory database for the run,
+so nothing is left on disk after it.
+'''
+import json, os, sqlite3, threading
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS manifest (
+    key             TEXT PRIMARY KEY,
+    value           TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS authors (
+    author_folder   TEXT PRIMARY KEY,
+    dirs            TEXT NOT NULL,
+    files           TEXT NOT NULL,
+    records         TEXT NOT NULL,
+    errors          TEXT NOT NULL,
+    counts          TEXT NOT NULL
+);
+'''
+
+# Seconds to wait for another run (e.g. the watcher) to finish writing to the manifest
+LOCK_TIMEOUT = 30
+
+class ScanManifest:
+
+    VERSION = 2
+
+    # If changed_authors is passed (e.g. by the watcher, which already knows what changed)
+    # those author folders are rescanned even if their folder times haven't changed yet.
+    # If only_changed is also set, the other author folders are reused without checking them.
+    def __init__(self, manifest_file, folders_path, doct_name, generate_cover, changed_authors=None):
+        self.manifest_file  = manifest_file
+        self.folders_path   = folders_path
+        self.doct_name      = doct_name
+        self.generate_cover = generate_cover
+        self.changed_authors = changed_authors
+        self.only_changed   = False
+
+        # The scan threads check the manifest while the scanned folders are recorded
+        self.lock = threading.Lock()
+        self.conn = self.open()
+
+    def open(self):
+        if self.manifest_file is None:
+            conn = sqlite3.connect(":memory:", check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.manifest_file, check_same_thread=False, timeout=LOCK_TIMEOUT)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+
+        # Cached results are only valid for the same folder, document type and settings
+        settings = json.dumps({
+            "Version":          ScanManifest.VERSION,
+            "Base Path":        str(self.folders_path),
+            "Document Type":    self.doct_name,
+            "Generate Cover":   self.generate_cover
+        })
+        row = conn.execute("SELECT value FROM manifest WHERE key = 'Settings'").fetchone()
+        if row is None or row[0] != settings:
+            with conn:
+                conn.execute("DELETE FROM authors")
+                conn.execute("INSERT OR REPLACE INTO manifest (key, value) VALUES ('Settings', ?)", (settings,))
+
+        return conn
+
+    # Author folders are saved as they are scanned, the ones removed since they were
+    # scanned are dropped when saved
+    def save(self):
+        with self.lock:
+            names = [row[0] for row in self.conn.execute("SELECT author_folder FROM authors")]
+            removed = [(name,) for name in names if not os.path.isdir(os.path.join(self.folders_path, name))]
+            with self.conn:
+                self.conn.executemany("DELETE FROM authors WHERE author_folder = ?", removed)
+
+    # Whether none of the author folder's folders and files changed since it was scanned
+    def is_unchanged(self, author_folder):
+        if self.changed_authors is not None and author_folder.name in self.changed_authors:
+            return False
+
+        with self.lock:
+            row = self.conn.execute("SELECT dirs, files FROM authors WHERE author_folder = ?",
+                                    (author_folder.name,)).fetchone()
+        if row is None:
+            return False
+
+        if self.changed_authors is not None and self.only_changed:
+            return True
+
+        try:
+            for rel_dir, mtime in json.loads(row[0]).items():
+                if os.stat(os.path.join(self.folders_path, rel_dir)).st_mtime_ns != mtime:
+                    return False
+
+            for rel_file, (size, mtime) in json.loads(row[1]).items():
+                file_stat = os.stat(os.path.join(self.folders_path, rel_file))
+                if file_stat.st_size != size or file_stat.st_mtime_ns != mtime:
+                    return False
+        except OSError:
+            return False
+
+        return True
+
+    # Returns the cached entry for the author folder if none of its folders or files changed
+    def get_cached(self, author_folder):
+        if not self.is_unchanged(author_folder):
+            return None
+
+        with self.lock:
+            row = self.conn.execute("SELECT dirs, files, records, errors, counts FROM authors WHERE author_folder = ?",
+                                    (author_folder.name,)).fetchone()
+        if row is None:
+            return None
+
+        return dict(zip(("Dirs", "Files", "Records", "Errors", "Counts"), (json.loads(value) for value in row)))
+
+    # Get the names of the author folders added, removed or changed since the last run
+    def find_changed_authors(self):
+        with os.scandir(self.folders_path) as entries:
+            author_folders = [entry for entry in entries if entry.is_dir()]
+
+        changed_authors = {author_folder.name for author_folder in author_folders
+                           if not self.is_unchanged(author_folder)}
+
+        with self.lock:
+            names = {row[0] for row in self.conn.execute("SELECT author_folder FROM authors")}
+        changed_authors.update(names - {author_folder.name for author_folder in author_folders})
+
+        return changed_authors
+
+    # Record the entry for an author folder scanned in this run
+    def update(self, author_folder_name, entry):
+        with self.lock, self.conn:
+            self.conn.execute('''
+                INSERT OR REPLACE INTO authors (author_folder, dirs, files, records, errors, counts)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ''', (author_folder_name, json.dumps(entry["Dirs"]), json.dumps(entry["Files"]),
+                      json.dumps(entry["Records"]), json.dumps(entry["Errors"]), json.dumps(entry["Counts"])))
@@ -0,0 +1,41 @@
+'''
+The scan snapshot is the one scan of each DocumentFolder shared by everything that needs
+its index in a run: the indexer, wp_file_sync and wp_catalog_sync (and every indexer run
+in watch mode). Each author folder's scan results are kept in the snapshot, so a folder
+scanned by one job is reused by the next instead of being listed, parsed and checked for
+covers again.
+
+A snapshot is a ScanManifest kept for the run (in a temporary database). An author folder's folder times are checked
+before its results are reused, so documents added during the run are still picked up.
+With IncrementalIndex on in settings the snapshot is also loaded from and saved to the
+archive's scan manifest file, so it carries over to the next run.
+'''
+from pathlib import Path
+from mti.mti_config import MTIConfig, mticonfig
+from mti.scan_manifest import ScanManifest
+from mti import author_doc_scan
+
+# Snapshots for this run, keyed by archive key and DocumentFolder
+snapshots = {}
+
+def get_archive_key(coll_name, doct_name):
+    return f'{MTIConfig.fileNameFormat(coll_name)}_{MTIConfig.fileNameFormat(MTIConfig.toPlural(doct_name))}'
+
+def is_persisted():
+    return mticonfig.ini['Settings'].getboolean('IncrementalIndex', fallback=False)
+
+# Get the snapshot for a DocumentFolder, the document type can be singular or plural
+def get_snapshot(coll_name, doct_name, folders_path):
+    archive_key = get_archive_key(coll_name, doct_name)
+    snapshot = snapshots.get((archive_key, folders_path))
+    if snapshot is None:
+        manifest_file = Path(mticonfig.data_dir) / f'{archive_key}_scan_manifest.db' if is_persisted() else None
+        snapshot = ScanManifest(manifest_file, folders_path, MTIConfig.toPlural(doct_name),
+                                author_doc_scan.get_cover_settings())
+        snapshots[(archive_key, folders_path)] = snapshot
+
+    return snapshot
+
+# Get the snapshot for the selected collection and document type
+def get_selected_snapshot(folders_path):
+    return get_snapshot(mticonfig.coll_name, mticonfig.doct_name, folders_path)
@@ -6,23 +6,29 @@
 # -qlaunch for quick launch of menu items
 #---------------------------------------------------------------------------------------
 
-import os, traceback, argparse, sys
+import os, traceback, argparse, importlib, sys
 from pathlib import Path
-from consolemenu import ConsoleMenu, SelectionMenu
-from consolemenu.items import FunctionItem, SubmenuItem
-from mti.mti_indexer import MTIIndexer
-import mti.mti_updater as MTIUpdater
 from mti.mti_config import MTIConfig, MTIDataKey, mticonfig
-from wordpressmti.wbg_book_post import WPGBookAPIException
-from wordpressmti import wp_loader_main, wp_catalog_sync, wp_file_sync
-from googlemti import google_csv_loader
 
+# The modules of each tool are imported by its launch function when it is run, so a quick
+# launch only imports what it uses (Google, PIL and pandas take seconds to import). The
+# launch functions import the modules listed here for their option, so the startup
+# benchmark (benchmarks/startup.py) times the same imports as the launch
+QUICK_LAUNCH_MODULES = {
+	"INDEXER":		["mti.mti_indexer", "googlemti.google_csv_loader"],
+	"LOADER":		["wordpressmti.wbg_book_post", "wordpressmti.wp_loader_main", "googlemti.google_csv_loader"],
+	"LOADMANUAL":	["wordpressmti.wbg_book_post", "wordpressmti.wp_loader_main", "googlemti.google_csv_loader"],
+	"UPDATER":		["wordpressmti.wbg_book_post", "mti.mti_updater"],
+	"WCSYNC":		["wordpressmti.wbg_book_post", "wordpressmti.wp_catalog_sync"],
+	"WFSYNC":		["wordpressmti.wbg_book_post", "wordpressmti.wp_file_sync"],
+	"COMPACT":		["mti.index_snapshots"],
+}
+
+# Menu items changed by the settings menu, created with the menus (the console menu is
+# only imported in interactive mode)
 class MenuItem:
-	def placeholder_func():
-		print("Placeholder function for Menu Item")
-
-	collection_settings = FunctionItem(f'Collection', placeholder_func)
-	doc_type_settings	= FunctionItem(f'Document Type', placeholder_func)
+	collection_settings = None
+	doc_type_settings	= None
 
 
 def print_error_details():
@@ -36,12 +42,14 @@ def print_error_details():
 
 # Indexer option to scan and index documents in the archive folder
 def launch_indexer():
+	(mti_indexer, google_csv_loader) = import_quick_launch_modules("INDEXER")
+
 	try:
 		# Setup directories for archiver
 		os.makedirs(mticonfig.output_dir, exist_ok=True)	
 
 		# Run the indexer to index the archive folder
-		MTIIndexer.start()
+		mti_indexer.MTIIndexer.start()
 		update_menu_text()
 
 		# Load index to google (TODO: Check Google Load flag)
@@ -55,6 +63,8 @@ def launch_indexer():
 
 # Loader function to load the new indexed documents to WordPress Books Gallery Plugin
 def launch_wp_loader(loadManual=False):
+	(wbg_book_post, wp_loader_main, google_csv_loader) = import_quick_launch_modules("LOADMANUAL" if loadManual else "LOADER")
+
 	try:
 		# Run the loader to load documents/books to Wordpress
 		wp_loader_main.load(loadManual)
@@ -63,7 +73,7 @@ def launch_wp_loader(loadManual=False):
 		google_csv_loader.update_catalog_sheet()
 
 		input("Press enter to continue.")
-	except WPGBookAPIException as e:
+	except wbg_book_post.WPGBookAPIException as e:
 		e.print_details()
 		print_error_details()
 	except Exception as e:
@@ -72,12 +82,14 @@ def launch_wp_loader(loadManual=False):
 
 # Updater function to make changes to loaded documents
 def launch_updater():
+	(wbg_book_post, MTIUpdater) = import_quick_launch_modules("UPDATER")
+
 	try:
 		# Run the loader to load documents/books to Wordpress
 		MTIUpdater.start()
 
 		input("Press enter to continue.")
-	except WPGBookAPIException as e:
+	except wbg_book_post.WPGBookAPIException as e:
 		e.print_details()
 		print_error_details()
 	except Exception as e:
@@ -86,23 +98,39 @@ def launch_updater():
 
 # Wordpress catalog sync process
 def launch_wp_catalog_sync():
+	(wbg_book_post, wp_catalog_sync) = import_quick_launch_modules("WCSYNC")
+
 	try:
 		wp_catalog_sync.start()
 
 		input("Press enter to continue.")
-	except WPGBookAPIException as e:
+	except wbg_book_post.WPGBookAPIException as e:
 		e.print_details()
 		print_error_details()
 	except Exception as e:
 		print("\nUnexpected Error occured running Word Press sync!\n")
 		print_error_details()
 
+# Fold old index runs into the history of each archive, keeping the last runs as snapshots
+def launch_index_compaction():
+	(index_snapshots,) = import_quick_launch_modules("COMPACT")
+
+	try:
+		index_snapshots.start()
+
+		input("Press enter to continue.")
+	except Exception as e:
+		print("\nUnexpected Error occured compacting index snapshots!\n")
+		print_error_details()
+
 def launch_wp_file_sync():
+	(wbg_book_post, wp_file_sync) = import_quick_launch_modules("WFSYNC")
+
 	try:
 		wp_file_sync.start()
 
 		input("Press enter to continue.")
-	except WPGBookAPIException as e:
+	except wbg_book_post.WPGBookAPIException as e:
 		e.print_details()
 		print_error_details()
 	except Exception as e:
@@ -110,7 +138,19 @@ def launch_wp_file_sync():
 		print_error_details()
 
 
+def launch_watcher():
+	from mti import mti_watcher
+
+	mti_watcher.start()
+
+# Import the modules of a quick launch option, in the order they are listed. Also used by
+# benchmarks/startup.py to import an option without running it.
+def import_quick_launch_modules(menuname):
+	return [importlib.import_module(module_name) for module_name in QUICK_LAUNCH_MODULES[menuname]]
+
 def get_collection():
+	from consolemenu import SelectionMenu
+
 	coll_idx = SelectionMenu.get_selection(mticonfig.coll_list, 
 		f"Collection [{mticonfig.coll_name}]", "Select to change:")
 	
@@ -120,6 +160,8 @@ def get_collection():
 		update_menu_text()
 
 def get_doc_type():
+	from consolemenu import SelectionMenu
+
 	doct_idx = SelectionMenu.get_selection(mticonfig.doct_list, 
 		f"Document Type [{mticonfig.doct_name}]", "Select to change:")
 	
@@ -129,13 +171,13 @@ def get_doc_type():
 		update_menu_text()
 
 def get_settings_menu():
+	from consolemenu import ConsoleMenu
+	from consolemenu.items import FunctionItem
+
 	menu = ConsoleMenu("Select Archive Folder")
 
-	MenuItem.collection_settings.function	= get_collection
-	MenuItem.collection_settings.text		= f"Collection Folder : [{mticonfig.coll_name}]"
-	
-	MenuItem.doc_type_settings.function		= get_doc_type
-	MenuItem.doc_type_settings.text			= f"Document Folder: [{mticonfig.doct_name}]"
+	MenuItem.collection_settings	= FunctionItem(f"Collection Folder : [{mticonfig.coll_name}]", get_collection)
+	MenuItem.doc_type_settings		= FunctionItem(f"Document Folder: [{mticonfig.doct_name}]", get_doc_type)
 
 	menu.append_item(MenuItem.collection_settings)
 	menu.append_item(MenuItem.doc_type_settings)
@@ -143,10 +185,14 @@ def get_settings_menu():
 	return menu
 
 def get_more_options_menu():
+	from consolemenu import ConsoleMenu
+	from consolemenu.items import FunctionItem
+
 	menu = ConsoleMenu("More Archving Options")
 
 	menu.append_item(FunctionItem("Run WordPress Catalog Sync", launch_wp_catalog_sync))
 	menu.append_item(FunctionItem("Run WordPress File Sync", launch_wp_file_sync))
+	menu.append_item(FunctionItem("Compact Index Snapshots", launch_index_compaction))
 
 	return menu
 
@@ -159,6 +205,9 @@ def update_menu_text():
 		menu.epilogue_text += f"Last processed on [ {mticonfig.exe_details.get(MTIDataKey.LAST_INDEXER_RUN_DT)} ]"
 
 def create_main_menu():
+	from consolemenu import ConsoleMenu
+	from consolemenu.items import FunctionItem, SubmenuItem
+
 	menu = ConsoleMenu("Archiving Main Menu", clear_screen=not mticonfig.debug_flag('menu'))
 	
 	menu.append_item(SubmenuItem("Open Archive Folder", get_settings_menu(), menu=menu))
@@ -185,6 +234,8 @@ def quick_launch(menuname):
 			launch_wp_file_sync()
 		case "UPDATER":
 			launch_updater()
+		case "COMPACT":
+			launch_index_compaction()
 
 def get_args_parser():
 	parser = argparse.ArgumentParser(
@@ -200,6 +251,9 @@ def get_args_parser():
 
 	   Run a specific option: 
 	        mti-archiver.py -m quick --menu UPDATER
+
+	   Keep the indexes up to date as documents are added:
+	        mti-archiver.py -m watch
 	""",
 	formatter_class=argparse.RawTextHelpFormatter  # preserves formatting
 	)		
@@ -207,7 +261,7 @@ def get_args_parser():
 	
 	parser.add_argument(
 		"-m", "--mode",
-		choices=["quick", "interactive"],
+		choices=["quick", "interactive", "watch"],
 		default="interactive",
 		metavar="MODE",
 		type=str.lower,
@@ -215,6 +269,7 @@ def get_args_parser():
 			"Run mode:\n"
 			"  quick         - Runs program wihtout a menu, requires --menuname arg\n"
 			"  interactive   - Runs program with interactive menu\n"
+			"  watch         - Watches the archive folders and indexes new documents as they are added\n"
 		)
 	)
 
@@ -222,7 +277,7 @@ def get_args_parser():
 		"--menu",
 		metavar="MENU_NAME",
 		type=str.upper,
-		choices=["INDEXER", "LOADER", "UPDATER", "WCSYNC","WFSYNC"],
+		choices=["INDEXER", "LOADER", "UPDATER", "WCSYNC","WFSYNC","COMPACT"],
 		help=(
 			"Menu options:\n"
 			"  INDEXER - Run the indexer with the last intearctively processed collection.\n"
@@ -230,6 +285,7 @@ def get_args_parser():
 			"  UPDATER - Run the updater to process actions in updater sheet\n"
 			"  WCSYNC  - Run the wordpress catalog sync process\n"
 			"  WFSYNC  - Run the wordpress file sync process\n"
+			"  COMPACT - Fold old index runs into the index history, keeping the last runs\n"
 		)
 	)
 
@@ -238,38 +294,43 @@ def get_args_parser():
 
 # BEGIN PROGRAM ------------------------------------------------------------------------
 
-try:
-	# Get Command line arguments
-	parser = get_args_parser()
+# Only run the program when launched, not when imported by the worker processes used to
+# hash documents (on Windows these import the main module again)
+if __name__ == "__main__":
+	try:
+		# Get Command line arguments
+		parser = get_args_parser()
 
-	# If no arguments passed in print help text and exit
-	if len(sys.argv) == 1:
-		parser.print_help()
-		sys.exit(0)
+		# If no arguments passed in print help text and exit
+		if len(sys.argv) == 1:
+			parser.print_help()
+			sys.exit(0)
 
-	# Get the args
-	args = parser.parse_args()
+		# Get the args
+		args = parser.parse_args()
 
-	# shutil.rmtree(temp_dir)						# Delete Existing Temp Directory??
-	os.makedirs(mticonfig.temp_dir, exist_ok=True)	# Temporary Working Directory
+		# shutil.rmtree(temp_dir)						# Delete Existing Temp Directory??
+		os.makedirs(mticonfig.temp_dir, exist_ok=True)	# Temporary Working Directory
 
-	if args.mode == "quick":
-		if not args.menu:
-			parser.error("--menu is required when mode is 'quick'")
+		if args.mode == "quick":
+			if not args.menu:
+				parser.error("--menu is required when mode is 'quick'")
 
-		quick_launch(args.menu)
-	elif args.mode == "interactive":
-		# Create the application menu
-		menu = create_main_menu()
-		update_menu_text()
+			quick_launch(args.menu)
+		elif args.mode == "interactive":
+			# Create the application menu
+			menu = create_main_menu()
+			update_menu_text()
 
-		# Show the main menu
-		menu.show()
+			# Show the main menu
+			menu.show()
+		elif args.mode == "watch":
+			launch_watcher()
 
-	mticonfig.save_archiver_data()
-except Exception as e:
-	print("\nAn unxpected error occured running the Archiver Program!\n\n")
-	print_error_details()
+		mticonfig.save_archiver_data()
+	except Exception as e:
+		print("\nAn unxpected error occured running the Archiver Program!\n\n")
+		print_error_details()
 
 
 # END PROGRAM --------------------------------------------------------------------------------------------
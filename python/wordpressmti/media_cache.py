@@ -0,0 +1,143 @@
+'''
+The media cache maps the files uploaded to WordPress (the SHA-256 of the bytes uploaded,
+and the file name they were uploaded with) to the media they were uploaded as, so a loader
+run retried after an error reuses the covers and PDFs it already uploaded instead of
+uploading them again.
+
+When the updater renames a file whose media is cached, the media is kept and renamed (its
+title and slug, WordPress keeps the file's URL) and the cache entry takes the new file
+name, so the book update reuses it instead of the media being deleted and the same bytes
+uploaded again. Media not in the cache are deleted and uploaded again as before.
+
+The cache is a SQLite database (media_cache.db in the ScriptDataFolder), keyed by site as
+the settings can point at a sandbox site. A cached media is checked in the media library
+(GET /media/{id}) the first time it's reused in a run, a media deleted in WordPress (404)
+is dropped from the cache and its file uploaded again.
+
+    Settings in [WordPress]:
+        MediaCache=True         Reuse the media already uploaded with the same content
+'''
+import os, sqlite3
+from datetime import datetime
+from mti.mti_config import mticonfig
+
+# Version 2 added the file name to the key, the media cached before are dropped
+SCHEMA_VERSION = 2
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS media (
+    site_url        TEXT NOT NULL,
+    digest          TEXT NOT NULL,
+    filename        TEXT NOT NULL,
+    media_id        INTEGER NOT NULL,
+    source_url      TEXT,
+    uploaded_on     TEXT,
+    PRIMARY KEY (site_url, digest, filename)
+);
+CREATE INDEX IF NOT EXISTS media_filename ON media (site_url, filename);
+CREATE INDEX IF NOT EXISTS media_id ON media (site_url, media_id);
+'''
+
+# Seconds to wait for another run's write to finish before giving up
+LOCK_TIMEOUT = 30
+
+# A media uploaded to the site
+class CachedMedia:
+    def __init__(self, media_id, source_url):
+        self.media_id   = media_id
+        self.source_url = source_url
+
+# Each call opens its own connection, so the cache can be used by the threads of the async
+# client and by two runs at the same time
+class MediaCache:
+
+    def __init__(self, db_file, site_url):
+        self.db_file = db_file
+        self.site_url = site_url.rstrip("/")
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_file, timeout=LOCK_TIMEOUT)
+        conn.execute("PRAGMA journal_mode=WAL")
+        if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            with conn:
+                conn.execute("DROP TABLE IF EXISTS media")
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.executescript(SCHEMA)
+        return conn
+
+    def get(self, digest, filename):
+        conn = self.connect()
+        try:
+            row = conn.execute("SELECT media_id, source_url FROM media WHERE site_url = ? AND digest = ? AND filename = ?",
+                               (self.site_url, digest, filename)).fetchone()
+        finally:
+            conn.close()
+
+        return CachedMedia(*row) if row else None
+
+    # Whether a file was uploaded with the file name, so files never uploaded under their
+    # name don't need to be hashed before they are uploaded
+    def has_filename(self, filename):
+        conn = self.connect()
+        try:
+            row = conn.execute("SELECT 1 FROM media WHERE site_url = ? AND filename = ? LIMIT 1",
+                               (self.site_url, filename)).fetchone()
+        finally:
+            conn.close()
+
+        return row is not None
+
+    def put(self, digest, media_id, source_url, filename):
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO media (site_url, digest, filename, media_id, source_url, uploaded_on)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ''', (self.site_url, digest, filename, media_id, source_url,
+                          datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        finally:
+            conn.close()
+
+    def has_media(self, media_id):
+        conn = self.connect()
+        try:
+            row = conn.execute("SELECT 1 FROM media WHERE site_url = ? AND media_id = ? LIMIT 1",
+                               (self.site_url, media_id)).fetchone()
+        finally:
+            conn.close()
+
+        return row is not None
+
+    # Give a media the name of its renamed file, keeping the extension it was uploaded
+    # with (covers are uploaded as WebP/JPEG derivatives of the cover file)
+    def rename_media(self, media_id, name):
+        conn = self.connect()
+        try:
+            with conn:
+                rows = conn.execute("SELECT digest, filename FROM media WHERE site_url = ? AND media_id = ?",
+                                    (self.site_url, media_id)).fetchall()
+                for (digest, filename) in rows:
+                    conn.execute("UPDATE OR REPLACE media SET filename = ? WHERE site_url = ? AND digest = ? AND filename = ?",
+                                 (name + os.path.splitext(filename)[1], self.site_url, digest, filename))
+        finally:
+            conn.close()
+
+    # Drop a media deleted or no longer in the media library
+    def remove_media(self, media_id):
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM media WHERE site_url = ? AND media_id = ?", (self.site_url, media_id))
+        finally:
+            conn.close()
+
+def is_enabled():
+    return mticonfig.ini['WordPress'].getboolean('MediaCache', fallback=True)
+
+# The media cache for the site, None if it's turned off in settings
+def get_media_cache(site_url):
+    if not is_enabled():
+        return None
+
+    return MediaCache(os.path.join(mticonfig.data_dir, 'media_cache.db'), site_url)
@@ -1,6 +1,11 @@
-import requests, base64, os, json, textwrap, html
-from rich.console import Console
+import base64, hashlib, os, json, textwrap, html
 from mti.mti_config import MTIConfig, mticonfig
+from mti import cover_derivatives
+from mti.lazy_imports import lazy_import
+from wordpressmti import media_cache, wp_books_mirror, wp_session, wp_uploads
+
+rich_console = lazy_import("rich.console")
+doc_hasher = lazy_import("mti.doc_hasher")
 
 class WPGBookAPIException(Exception):
    def __init__(self, message, response):
@@ -106,13 +111,27 @@ class WPGBook:
 
 class WPGBookPostClient:
 
-    def __init__(self, site_url, username, password):
+    def __init__(self, site_url, username, password, session_settings=None, media_cache=None,
+                 books_mirror=None):
         # Setup WordPress URLs
         self.__init_urls__(site_url)
 
         # Setup WordPress Authorization
         self.__init_authorization__(username, password)
 
+        # Setup the pooled session the API calls are made with (see wp_session)
+        self.__init_session__(session_settings or wp_session.SessionSettings())
+
+        # Media already uploaded, by content, to reuse instead of uploading (see media_cache),
+        # the cached media found in the media library in this run, and the digests of the
+        # documents hashed by the indexer, loaded when first needed
+        self.media_cache = media_cache
+        self.verified_media = set()
+        self.digest_cache = None
+
+        # Local copy of the books to check books exist against (see wp_books_mirror)
+        self.books_mirror = books_mirror
+
         # Additional Properties
         self.dflt_post_cat_id =  self.get_category_id_by_slug("book")
     
@@ -152,14 +171,28 @@ class WPGBookPostClient:
             "Authorization": "Basic " + self.base64_credentials
         }
 
+    def __init_session__(self, session_settings):
+        self.session_settings = session_settings
+
+        # Connect and read timeout of every call
+        self.timeout = session_settings.timeout
+
+        # Connections are kept open between calls and failed calls are retried
+        self.session = wp_session.create_session(session_settings)
+
+    # Close the connections kept open to the site
+    def close(self):
+        self.session.close()
+
     def get_book(self, post_id):
         """
         Fetches a book post by its ID.
         Returns the book data as a dictionary if successful, raises an exception if not.
         """
-        response = requests.get(
+        response = self.session.get(
             f"{self.wp_books_post_api_url}/{post_id}",
-            headers=self.headers
+            headers=self.headers,
+            timeout=self.timeout
         )
 
 
@@ -187,9 +220,14 @@ class WPGBookPostClient:
 
 
     # WPG Book Post Module Functions, returns post ID if successful, throws error if not 
-    # If post_id is passed in it will update existing book
-    def create_book(self, book: WPGBook, uploadMedia, post_id = None):
-        console = Console()
+    # If post_id is passed in it will update existing book. The progress is shown in a
+    # console status, unless a status (anything with an update(message) method) is passed
+    # in to show it instead (e.g. the async client, creating books at the same time).
+    def create_book(self, book: WPGBook, uploadMedia, post_id = None, status = None):
+        if status is not None:
+            return self._create_book(book, uploadMedia, status, post_id)
+
+        console = rich_console.Console()
         with console.status(f"[bold green][Loading       ] {book.title}") as status:
             return self._create_book(book, uploadMedia, status, post_id)
     
@@ -238,26 +276,31 @@ class WPGBookPostClient:
         # Upload book cover (if exists) and set its cover id
         if (uploadMedia and book.cover_file):
             status_msg.update(f"[bold green][Loading Cover  ] {book.title}")
-            cover_id = self.upload_book_cover(book)
+            cover_id = self.upload_book_cover(book, get_upload_progress(status_msg, "Loading Cover", book.title))
             post_data["featured_media"] = cover_id
 
         # Upload book pdf file
         if (uploadMedia and book.file):
             status_msg.update(f"[bold green][Loading PDF    ] {book.title}")
-            file_url = self.upload_book_file(book)
+            file_url = self.upload_book_file(book, get_upload_progress(status_msg, "Loading PDF", book.title))
             post_data["wbg_download_link"] = file_url
 
         # Send the POST request to create a new book
         status_msg.update(f"[bold green][Loading Details] {book.title}")        
-        response = requests.post(
+        response = self.session.post(
             f"{self.wp_books_post_api_url}{"/"+post_id if post_id else ''}",
             json=post_data,
-            headers=self.headers  # Use the headers with the Authorization
+            headers=self.headers,  # Use the headers with the Authorization
+            timeout=self.timeout
         )
 
         # Check the response status
         if response.status_code == 200 or response.status_code == 201:
-            return response.json()['id']
+            post = response.json()
+            # Add the book to the mirror so it's found before the site's search has it
+            if self.books_mirror:
+                self.books_mirror.put_post(post)
+            return post['id']
         else:
             raise WPGBookAPIException("Failed to create/update book", response )
 
@@ -267,10 +310,11 @@ class WPGBookPostClient:
             "categories_to_remove": categories_to_remove
         }
         
-        response = requests.post(
+        response = self.session.post(
             f"{self.wp_books_post_api_url}/{post_id}",
             json=post_data,
-            headers=self.headers  # Use the headers with the Authorization
+            headers=self.headers,  # Use the headers with the Authorization
+            timeout=self.timeout
         )
 
         # Check the response status
@@ -280,19 +324,25 @@ class WPGBookPostClient:
             raise WPGBookAPIException("Failed to update book categories.", response )
 
     
-    def upload_book_cover(self, book: WPGBook):
+    def upload_book_cover(self, book: WPGBook, progress=None):
         image_path = f"{book.base_path}\\{book.folder}\\{book.cover_file}"
 
-        # Read the image file
+        # Get the cover as it is uploaded, scaled down and compressed (see cover_derivatives)
+        # and open it to stream it as it is uploaded (see wp_uploads)
         try:
-            with open(image_path, 'rb') as img_file:
-                image_data = img_file.read()
+            cover = cover_derivatives.get_cover_derivative(image_path)
+            (media, digest) = self.get_cached_media(cover.path, cover.filename)
+            if media:
+                return media.media_id
+            image_data = wp_uploads.UploadFile(cover.path, progress, self.get_upload_digest(digest))
         except FileNotFoundError as fe:
             # This will allow this exception to be properly handled up the chain
             raise WPGBookPostException(f"Cover file not found at {image_path}") from fe
+        except cover_derivatives.CoverDerivativeError as de:
+            raise WPGBookPostException(de.message) from de
 
-        # Extract image filename
-        image_filename = os.path.basename(image_path)
+        # Extract image filename (of the derivative, so its extension matches its type)
+        image_filename = cover.filename
     
         # Clean up the filename for WordPress title
         image_title = os.path.splitext(image_filename)[0]
@@ -300,7 +350,7 @@ class WPGBookPostClient:
         # Set headers for the media upload
         headers = {
             'Content-Disposition': f'attachment; filename="{image_filename}"',
-            'Content-Type': 'image/jpeg', 
+            'Content-Type': cover.mime_type, 
             "Authorization": "Basic " + self.base64_credentials
         }
 
@@ -310,31 +360,26 @@ class WPGBookPostClient:
         }
 
         # Upload the image
-        response = requests.post(
-            self.wp_media_api_url,
-            headers=headers,
-            data=image_data,
-            params=metadata,  
-        )
+        with image_data:
+            response = self.session.post(
+                self.wp_media_api_url,
+                headers=headers,
+                data=image_data,
+                params=metadata,
+                timeout=self.timeout
+            )
 
         if response.status_code == 201:
             media_response = response.json()
             cover_id = media_response['id']
+            self.cache_media(digest or image_data.get_digest(), media_response, image_filename)
             return cover_id
         else:
             raise WPGBookAPIException("Failed to upload cover", response )
 
-    def upload_book_file(self, book: WPGBook):
+    def upload_book_file(self, book: WPGBook, progress=None):
         pdf_path = f"{book.base_path}\\{book.folder}\\{book.file}"
 
-        # Read the pdf file
-        try:
-            with open(pdf_path, 'rb') as pdf_file:            
-                pdf_data = pdf_file.read()
-        except FileNotFoundError as fe:
-            # This will allow this exception to be properly handled up the chain
-            raise WPGBookPostException(f"PDF file not found at {pdf_path}") from fe
-
         # Extract pdf filename
         pdf_filename = os.path.basename(pdf_path)
     
@@ -343,50 +388,55 @@ class WPGBookPostClient:
 
         mime_type = 'application/pdf'
 
-         # Prepare the payload for multipart form data
-        files = {
-            'file': (pdf_filename, pdf_data, mime_type)
-        }
+        # Prepare the multipart form data, the pdf file is streamed as it is uploaded
+        # instead of being read into memory (see wp_uploads)
+        try:
+            (media, digest) = self.get_cached_media(pdf_path, pdf_filename)
+            if media:
+                return media.source_url
+            pdf_data = wp_uploads.MultipartUpload('file', pdf_path, pdf_filename, mime_type, progress,
+                                                  self.get_upload_digest(digest))
+        except FileNotFoundError as fe:
+            # This will allow this exception to be properly handled up the chain
+            raise WPGBookPostException(f"PDF file not found at {pdf_path}") from fe
+
+        headers = dict(self.headers)
+        headers['Content-Type'] = pdf_data.content_type
 
         # Upload the pdf file
-        response = requests.post(
-            self.wp_media_api_url,
-            headers=self.headers,
-            files=files  
-        )
+        with pdf_data:
+            response = self.session.post(
+                self.wp_media_api_url,
+                headers=headers,
+                data=pdf_data,
+                timeout=self.timeout
+            )
 
         if response.status_code == 201:
             media_response = response.json()
             file_url = media_response.get('source_url')
+            self.cache_media(digest or pdf_data.get_digest(), media_response, pdf_filename)
             return file_url
         else:
             raise WPGBookAPIException("Failed to upload PDF", response )
 
-    # Checks post details against book details to see if it is a match
+    # Checks post details against book details to see if it is a match. The title, author
+    # and date are normalized the same way as in the books mirror (see wp_books_mirror).
     def is_book_match(self, book, post):
-        isMatch = False
-
-        # Unescape the title to match the search term
-        post_title  = html.unescape(post['title']['rendered'])
-        post_title  = post_title.replace("’", "'")
-        post_date   = post.get('wbg_published_on', '').strip()
-        post_author = post.get('wbg_author', '').strip()
-        
-        # Handle empty date values
-        date = book.published_on
-        if (date == 'Undated' or date==''): date = None
-        if (post_date == ''): post_date = None
-        
-
-        if (post_title.lower().strip() == book.title.lower().strip()
-            and post_author.lower() == book.author.lower()
-            and post_date == date):
-            isMatch = True
-
-        return isMatch
+        post = wp_books_mirror.to_mirror_post(post)
+        post_key = wp_books_mirror.get_match_key(post['title'], post['author'], post['date'])
 
+        return post_key == wp_books_mirror.get_book_key(book)
 
+    # Checks the book exists in WordPress, returns whether it does and the ids of the posts
+    # matching it. Books are looked up in the books mirror, refreshed the first time it's
+    # used, or searched for if there is no mirror.
     def check_book_exists(self, book):
+        if self.books_mirror:
+            self.books_mirror.ensure_refreshed(self)
+            post_ids = self.books_mirror.find(book)
+            return len(post_ids) > 0, post_ids
+
         title = book.title
         page  = 0
         keep_checking = True
@@ -400,10 +450,11 @@ class WPGBookPostClient:
                 "page": page
             }
 
-            response = requests.get(
+            response = self.session.get(
                 self.wp_books_post_api_url, 
                 params=params, 
-                headers=self.headers
+                headers=self.headers,
+                timeout=self.timeout
             )
 
             if response.status_code == 200:
@@ -430,6 +481,35 @@ class WPGBookPostClient:
         
         return book_exists, post_ids
     
+    # Fetches a page of book posts with the fields given (all if None), modified after the
+    # date given (site time) if any, in the order they were created. Returns the posts and
+    # the total number of posts and pages.
+    def get_book_posts(self, page=1, per_page=100, fields=None, modified_after=None):
+        params = {
+            "page": page,
+            "per_page": per_page,
+            "orderby": "id",
+            "order": "asc"
+        }
+        if fields:
+            params["_fields"] = fields
+        if modified_after:
+            params["modified_after"] = modified_after
+
+        response = self.session.get(
+            self.wp_books_post_api_url, 
+            params=params, 
+            headers=self.headers,
+            timeout=self.timeout
+        )
+
+        if response.status_code == 200:
+            return (extract_json(response),
+                    int(response.headers.get("X-WP-Total", 0)),
+                    int(response.headers.get("X-WP-TotalPages", 0)))
+        else:
+            raise WPGBookAPIException("Failed to fetch books", response)
+
     # Warning: The Book file is extracted from download link, which may not be reliable since
     # Wordpress is modifying the filename in the link. May need to rebuild using book title.
     def get_books(self, page=1, per_page=100):
@@ -438,10 +518,11 @@ class WPGBookPostClient:
             "per_page": per_page
         }
 
-        response = requests.get(
+        response = self.session.get(
             self.wp_books_post_api_url, 
             params=params, 
-            headers=self.headers
+            headers=self.headers,
+            timeout=self.timeout
         )
 
         book_list = []
@@ -489,26 +570,126 @@ class WPGBookPostClient:
         return book_list
 
     def delete_media(self, media_id):
-        response = requests.delete(
+        response = self.session.delete(
             f"{self.wp_media_api_url}/{media_id}?force=true",
-            headers=self.headers
+            headers=self.headers,
+            timeout=self.timeout
         )
 
         if response.status_code == 200 or response.status_code == 204:
+            self.uncache_media(media_id)
             return True
         elif response.status_code == 404:
+            self.uncache_media(media_id)
             return False
         else:
             raise WPGBookAPIException("Failed to delete media", response)
-        
+
+    # Fetches a media, returns None if it isn't in the media library
+    def get_media(self, media_id):
+        response = self.session.get(
+            f"{self.wp_media_api_url}/{media_id}",
+            params={"_fields": "id,source_url"},
+            headers=self.headers,
+            timeout=self.timeout
+        )
+
+        if response.status_code == 200:
+            return response.json()
+        elif response.status_code == 404:
+            return None
+        else:
+            raise WPGBookAPIException("Failed to fetch media", response)
+
+    # Renames a media kept for its renamed file (see media_cache) instead of deleting it,
+    # its title and slug are set from the new file name. Returns False if the media isn't
+    # in the media cache or no longer in the media library, so it must be uploaded again.
+    def rename_cached_media(self, media_id, filename):
+        if not (self.media_cache and self.media_cache.has_media(media_id)):
+            return False
+
+        name = os.path.splitext(filename)[0]
+        response = self.session.post(
+            f"{self.wp_media_api_url}/{media_id}",
+            json={"title": name, "slug": name},
+            headers=self.headers,
+            timeout=self.timeout
+        )
+
+        if response.status_code == 200:
+            self.media_cache.rename_media(media_id, name)
+            return True
+        elif response.status_code == 404:
+            self.uncache_media(media_id)
+            return False
+        else:
+            raise WPGBookAPIException("Failed to rename media", response)
+
+    # The digest of a file from doc_hasher's digest cache if the indexer hashed it and it's
+    # unchanged since, None if it didn't
+    def get_indexed_digest(self, path):
+        if self.digest_cache is None:
+            self.digest_cache = doc_hasher.DigestCache(doc_hasher.get_cache_file())
+
+        return self.digest_cache.get(doc_hasher.get_path_key(path), os.stat(path))
+
+    # The media already uploaded with the same content and file name (None if there is
+    # none) and the digest of the file. A file never uploaded under its name isn't read to
+    # hash it, it's hashed as it is uploaded (its digest is None unless the indexer hashed
+    # it). A cached media is checked in the media library the first time it's reused in
+    # the run, if it's no longer there it's dropped from the cache and uploaded again.
+    def get_cached_media(self, path, filename):
+        if not self.media_cache:
+            return (None, None)
+
+        digest = self.get_indexed_digest(path)
+        if digest is None and self.media_cache.has_filename(filename):
+            digest = doc_hasher.hash_file(path)
+
+        cached = self.media_cache.get(digest, filename) if digest else None
+        if cached and cached.media_id not in self.verified_media:
+            if self.get_media(cached.media_id) is None:
+                self.uncache_media(cached.media_id)
+                return (None, digest)
+            self.verified_media.add(cached.media_id)
+
+        return (cached, digest)
+
+    # A hash to update as the file is uploaded (see wp_uploads), if it must be cached and
+    # wasn't hashed yet
+    def get_upload_digest(self, digest):
+        return hashlib.sha256() if self.media_cache and digest is None else None
+
+    # Media uploaded without a digest (e.g. the upload didn't read all the file) aren't cached
+    def cache_media(self, digest, media_response, filename):
+        if self.media_cache and digest:
+            self.media_cache.put(digest, media_response['id'], media_response.get('source_url'), filename)
+
+    def uncache_media(self, media_id):
+        self.verified_media.discard(media_id)
+        if self.media_cache:
+            self.media_cache.remove_media(media_id)
+
     def get_category_id_by_slug(self, category_slug):
-        resp = requests.get(f"{self.wp_categories_api_url}?slug={category_slug}")
+        resp = self.session.get(f"{self.wp_categories_api_url}?slug={category_slug}", timeout=self.timeout)
         if resp.status_code == 200 and resp.json():
             return resp.json()[0]['id']
         else:
             #raise ValueError(f"Category slug '{category_slug}' not found\n {resp}")
             return " "
 
+# Progress of an upload shown in the console status, as a percentage of the file sent
+def get_upload_progress(status_msg, action, title):
+    shown = [None]
+
+    def progress(bytes_sent, total_bytes):
+        percent = bytes_sent * 100 // total_bytes if total_bytes else 100
+        if percent != shown[0]:
+            shown[0] = percent
+            status_msg.update(f"[bold green][{action:11} {percent:3}%] {title}")
+
+    return progress
+
 def get_wbg_client():
     # Setup Book post client 
     # (TODO: Maybe only create this once per archiver instead of for every load event)
@@ -516,7 +697,8 @@ def get_wbg_client():
     wp_username = mticonfig.ini['WordPress']['Username']
     wp_password = mticonfig.ini['WordPress']['Password']
     
-    return WPGBookPostClient(wp_url, wp_username, wp_password)
+    return WPGBookPostClient(wp_url, wp_username, wp_password, wp_session.get_session_settings(),
+                             media_cache.get_media_cache(wp_url), wp_books_mirror.get_books_mirror(wp_url))
 
 # Only use this if response.json() does not work even if API returns Content-Type: application/json
 # This method attempts to extract the JSON from response when it is incorrectly including both HTML
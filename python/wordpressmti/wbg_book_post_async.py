@@ -0,0 +1,124 @@
+'''
+An asyncio counterpart of WPGBookPostClient, for the jobs that make thousands of API calls
+that don't depend on each other (e.g. the sync jobs checking every indexed document exists
+in WordPress), so the calls wait on the site at the same time instead of one after another.
+
+It has the same methods as WPGBookPostClient, as coroutines, and makes the calls with it:
+each call runs in one of Concurrency worker threads over the client's pooled session (see
+wp_session), so the retries, timeouts and responses are the same as the sync client's, and
+no more than Concurrency calls are made to the site at once.
+
+    async_client = get_async_wbg_client()
+    results = asyncio.run(async_client.check_books_exist(books, progress=pbar.update))
+
+    Settings in [WordPress]:
+        Concurrency=8           Calls made to the site at the same time
+'''
+import asyncio, functools
+from concurrent.futures import ThreadPoolExecutor
+from mti.mti_config import mticonfig
+from wordpressmti import media_cache, wp_books_mirror, wp_session
+from wordpressmti.wbg_book_post import WPGBook, WPGBookPostClient
+
+DEFAULT_CONCURRENCY = 8
+
+def get_concurrency():
+    return max(1, mticonfig.ini['WordPress'].getint('Concurrency', fallback=DEFAULT_CONCURRENCY))
+
+# Stands in for the console status create_book shows, as books created at the same time
+# can't each show a status in the console
+class NoStatus:
+    def update(self, *args, **kwargs):
+        pass
+
+class AsyncWPGBookPostClient:
+
+    def __init__(self, client: WPGBookPostClient, concurrency=DEFAULT_CONCURRENCY):
+        self.client = client
+        self.concurrency = concurrency
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="wp_api")
+
+        # The semaphore belongs to the event loop it's used in, each asyncio.run has its own
+        self.semaphore = None
+        self.semaphore_loop = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.client.close()
+
+    def get_semaphore(self):
+        loop = asyncio.get_running_loop()
+        if self.semaphore_loop is not loop:
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+            self.semaphore_loop = loop
+
+        return self.semaphore
+
+    # Run a method of the sync client in a worker thread, once a call is free
+    async def call(self, method, *args, **kwargs):
+        async with self.get_semaphore():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(method, *args, **kwargs))
+
+    async def get_book(self, post_id):
+        return await self.call(self.client.get_book, post_id)
+
+    async def check_book_exists(self, book):
+        return await self.call(self.client.check_book_exists, book)
+
+    async def get_books(self, page=1, per_page=100):
+        return await self.call(self.client.get_books, page, per_page)
+
+    async def create_book(self, book: WPGBook, uploadMedia, post_id=None):
+        return await self.call(self.client.create_book, book, uploadMedia, post_id, NoStatus())
+
+    async def update_categories(self, post_id, categories_to_add, categories_to_remove):
+        return await self.call(self.client.update_categories, post_id, categories_to_add, categories_to_remove)
+
+    async def upload_book_cover(self, book: WPGBook, progress=None):
+        return await self.call(self.client.upload_book_cover, book, progress)
+
+    async def upload_book_file(self, book: WPGBook, progress=None):
+        return await self.call(self.client.upload_book_file, book, progress)
+
+    async def delete_media(self, media_id):
+        return await self.call(self.client.delete_media, media_id)
+
+    # Check the books exist in WordPress, (book_exists, post_ids) for each book in the order
+    # of the books. progress is called as each check is done. If a check raises an error,
+    # the checks not made yet are cancelled and the error is raised.
+    async def check_books_exist(self, books, progress=None):
+        async def check(book):
+            result = await self.check_book_exists(book)
+            if progress:
+                progress(1)
+            return result
+
+        tasks = [asyncio.create_task(check(book)) for book in books]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+# The session's pool keeps a connection open for each call made at the same time
+def get_async_wbg_client():
+    wp_url      = mticonfig.ini['WordPress']['SiteURL']
+    wp_username = mticonfig.ini['WordPress']['Username']
+    wp_password = mticonfig.ini['WordPress']['Password']
+
+    concurrency = get_concurrency()
+    session_settings = wp_session.get_session_settings()
+    session_settings.pool_size = max(session_settings.pool_size, concurrency)
+
+    client = WPGBookPostClient(wp_url, wp_username, wp_password, session_settings,
+                               media_cache.get_media_cache(wp_url), wp_books_mirror.get_books_mirror(wp_url))
+    return AsyncWPGBookPostClient(client, concurrency)
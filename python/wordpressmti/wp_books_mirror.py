@@ -0,0 +1,210 @@
+'''
+The books mirror is a local copy of the book posts in WordPress (the fields a book is
+matched on), so checking whether a document is already loaded is a dictionary lookup
+instead of paged ?search= queries for every document, which was most of the time taken by
+the loader and the sync jobs.
+
+The mirror is kept in the ScriptDataFolder (one file per site) and refreshed the first
+time a client checks a book:
+    - The first time, or when the mirror is older than BooksMirrorMaxAge hours, all the
+      books are fetched, 100 per page, the pages after the first at the same time (as
+      many as the client's session has connections for).
+    - Otherwise only the books modified since the last one in the mirror are fetched
+      (modified_after). If the site then doesn't have as many books as the mirror (books
+      deleted or unpublished, which modified_after can't show), all the books are fetched
+      again.
+Books created or updated by the client are added to the mirror as they are posted, so a
+document loaded twice in the same run is found even before the site's search has it.
+
+Books are matched on their title, author and published date, normalized the way
+WPGBookPostClient.is_book_match compares them (unescaped, smart quotes as plain quotes,
+case and surrounding spaces ignored, Undated as no date).
+
+    Settings in [WordPress]:
+        BooksMirror=True        Check books against the mirror instead of searching
+        BooksMirrorMaxAge=24    Hours before all the books are fetched again
+'''
+import hashlib, html, json, os, threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from mti.mti_config import mticonfig
+
+PER_PAGE = 100
+
+# Fields of the book posts fetched for the mirror
+POST_FIELDS = "id,title,modified,wbg_author,wbg_published_on"
+
+# Books modified this long before the last one in the mirror are fetched again, for posts
+# saved in the same second as it (modified has no fractions of a second)
+MODIFIED_OVERLAP = timedelta(minutes=1)
+
+DEFAULT_MAX_AGE = 24
+
+DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+def normalize_title(title):
+    return html.unescape(title or "").replace("’", "'").strip().lower()
+
+def get_match_key(title, author, date):
+    date = (date or "").strip()
+    if date == "Undated":
+        date = ""
+
+    return (normalize_title(title), (author or "").strip().lower(), date)
+
+def get_book_key(book):
+    return get_match_key(book.title, book.author, book.published_on)
+
+# A book post from the API as it is kept in the mirror
+def to_mirror_post(post):
+    return {
+        "id":           post["id"],
+        "title":        post.get("title", {}).get("rendered", ""),
+        "author":       post.get("wbg_author") or "",
+        "date":         post.get("wbg_published_on") or "",
+        "modified":     post.get("modified") or "",
+    }
+
+class BooksMirror:
+
+    VERSION = 1
+
+    def __init__(self, mirror_file, site_url, max_age=DEFAULT_MAX_AGE):
+        self.mirror_file = mirror_file
+        self.site_url = site_url
+        self.max_age = timedelta(hours=max_age)
+
+        # Mirrored posts by id, post ids by match key, and when all the posts were fetched
+        self.posts = {}
+        self.index = {}
+        self.fetched_on = None
+
+        # Refreshed once per client, the async client's threads check books at once
+        self.refreshed = False
+        self.lock = threading.RLock()
+
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.mirror_file, 'r', encoding="utf-8") as file:
+                data = json.load(file)
+        except (IOError, ValueError):
+            return
+
+        if data.get("Version") != BooksMirror.VERSION or data.get("SiteURL") != self.site_url:
+            return
+
+        self.fetched_on = datetime.strptime(data["FetchedOn"], DATETIME_FORMAT)
+        for post in data.get("Posts", []):
+            self.put(post)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.mirror_file), exist_ok=True)
+        temp_file = f"{self.mirror_file}.{os.getpid()}.tmp"
+        with open(temp_file, 'w', encoding="utf-8") as file:
+            json.dump({
+                "Version":      BooksMirror.VERSION,
+                "SiteURL":      self.site_url,
+                "FetchedOn":    self.fetched_on.strftime(DATETIME_FORMAT),
+                "Posts":        list(self.posts.values()),
+            }, file)
+        os.replace(temp_file, self.mirror_file)
+
+    def put(self, post):
+        with self.lock:
+            self.remove(post["id"])
+            self.posts[post["id"]] = post
+            self.index.setdefault(get_match_key(post["title"], post["author"], post["date"]), set()).add(post["id"])
+
+    def remove(self, post_id):
+        with self.lock:
+            post = self.posts.pop(post_id, None)
+            if post:
+                key = get_match_key(post["title"], post["author"], post["date"])
+                self.index[key].discard(post_id)
+                if not self.index[key]:
+                    del self.index[key]
+
+    # Add a book post the client created or updated (the post returned by the API)
+    def put_post(self, post):
+        self.put(to_mirror_post(post))
+
+    # Ids of the posts matching the book, in the order they were created
+    def find(self, book):
+        with self.lock:
+            return sorted(self.index.get(get_book_key(book), ()))
+
+    # Refresh the mirror from the site, the first time it's used by the client
+    def ensure_refreshed(self, client):
+        with self.lock:
+            if not self.refreshed:
+                self.refresh(client)
+                self.refreshed = True
+
+    def refresh(self, client):
+        with self.lock:
+            if self.fetched_on is None or datetime.now() - self.fetched_on > self.max_age:
+                self.fetch_all(client)
+            elif not self.fetch_modified(client):
+                self.fetch_all(client)
+
+            self.save()
+
+    # Fetch all the books, the pages after the first at the same time
+    def fetch_all(self, client):
+        fetched_on = datetime.now()
+        (posts, _, total_pages) = client.get_book_posts(1, PER_PAGE, POST_FIELDS)
+
+        pages = range(2, total_pages + 1)
+        if pages:
+            workers = min(len(pages), client.session_settings.pool_size)
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="wp_mirror") as executor:
+                for (page_posts, _, _) in executor.map(
+                        lambda page: client.get_book_posts(page, PER_PAGE, POST_FIELDS), pages):
+                    posts += page_posts
+
+        self.posts = {}
+        self.index = {}
+        for post in posts:
+            self.put(to_mirror_post(post))
+        self.fetched_on = fetched_on
+
+    # Fetch the books modified since the last one in the mirror. Returns False if the site
+    # doesn't have as many books as the mirror, so all the books must be fetched again.
+    def fetch_modified(self, client):
+        modified_after = self.get_last_modified()
+        page = 1
+        while True:
+            (posts, _, total_pages) = client.get_book_posts(page, PER_PAGE, POST_FIELDS, modified_after)
+            for post in posts:
+                self.put(to_mirror_post(post))
+            if page >= total_pages:
+                break
+            page += 1
+
+        (_, total, _) = client.get_book_posts(1, 1, "id")
+        return total == len(self.posts)
+
+    def get_last_modified(self):
+        modified = [post["modified"] for post in self.posts.values() if post["modified"]]
+        if not modified:
+            return None
+
+        last_modified = datetime.strptime(max(modified), DATETIME_FORMAT) - MODIFIED_OVERLAP
+        return last_modified.strftime(DATETIME_FORMAT)
+
+def is_enabled():
+    return mticonfig.ini['WordPress'].getboolean('BooksMirror', fallback=True)
+
+def get_max_age():
+    return max(0.0, mticonfig.ini['WordPress'].getfloat('BooksMirrorMaxAge', fallback=DEFAULT_MAX_AGE))
+
+# The books mirror of the site, None if it's turned off in settings
+def get_books_mirror(site_url):
+    if not is_enabled():
+        return None
+
+    site_hash = hashlib.sha256(site_url.rstrip("/").encode("utf-8")).hexdigest()[:12]
+    mirror_file = os.path.join(mticonfig.data_dir, 'wp_books_mirror', f'{site_hash}.json')
+    return BooksMirror(mirror_file, site_url.rstrip("/"), get_max_age())
@@ -3,14 +3,15 @@
 This module is used to read all books in wordpress and synchronize with the Google Catalog sheets
 to ensure all books are in the catalof files and ensure the book files exist in the file system.
 '''
-import atexit, os, gspread
+import asyncio, atexit, os, gspread
 import pandas as pd
 from datetime import datetime
 from wordpressmti import wp_loader_main
 from wordpressmti.wbg_book_post import get_wbg_client
+from wordpressmti.wbg_book_post_async import get_async_wbg_client
 from mti.mti_config import MTIDataKey, mticonfig, MTIConfig
 from mti.mti_logger import MTILogger
-from mti import author_doc_scan, book_csv_reader
+from mti import author_doc_scan, book_csv_reader, scan_snapshot
 from googlemti import gspread_client, collection_catalog, google_util
 from pathlib import Path
 from tqdm import tqdm
@@ -154,10 +155,13 @@ def index_and_catalog_books_in_collection(folder_to_index, missing_authors, coll
     index_debug_file    = Path(working_dir + file_prefix + '_Index_Debug.txt')
     index_error_file    = Path(working_dir + file_prefix + '_Index_Error.csv')
 
+    # Author folders already scanned in this run (e.g. by wp_file_sync) are reused
+    snapshot = scan_snapshot.get_snapshot(coll_name, doct_name, folder_to_index)
+
     logc(f'Processing folder: {folder_to_index}')    
     num_processed = author_doc_scan.process_selected_author_folders(
         folder_to_index, missing_authors, doct_name,
-        index_output_file, index_debug_file, index_error_file, debug=True)
+        index_output_file, index_debug_file, index_error_file, debug=True, manifest=snapshot)
     
     entries = set()
     if num_processed > 0:
@@ -225,7 +229,7 @@ def update_catalog_sheet(coll_name, doct_name, catalog_records):
 
 
 def create_missing_catalog_entries(coll_name, doct_prefix, idx_file):
-    wbgclient = get_wbg_client()
+    wbgclient = get_async_wbg_client()
     
     logc('')
     try:
@@ -233,10 +237,13 @@ def create_missing_catalog_entries(coll_name, doct_prefix, idx_file):
 
         records_to_catalog = []
 
-        for record in book_csv_reader.read_csv_file(doct_prefix, idx_file):
-            new_book = wp_loader_main.record_to_book(record, doct_prefix)
+        records = list(book_csv_reader.read_csv_file(doct_prefix, idx_file))
+        new_books = [wp_loader_main.record_to_book(record, doct_prefix) for record in records]
+
+        # The books are checked at the same time (up to the client's concurrency)
+        results = asyncio.run(wbgclient.check_books_exist(new_books))
 
-            (book_exists, post_ids) = wbgclient.check_book_exists(new_book)
+        for (record, new_book, (book_exists, post_ids)) in zip(records, new_books, results):
 
             if (len(post_ids) > 1):
                 logc(f'Multiple books found in wordpress: {new_book.title} - {new_book.author}')
@@ -261,6 +268,8 @@ def create_missing_catalog_entries(coll_name, doct_prefix, idx_file):
             update_catalog_sheet(coll_name, mticonfig.toPlural(doct_prefix), records_to_catalog)
     except Exception as e:
        logc(f"Error processing missing catalog entry: {e}")
+    finally:
+        wbgclient.close()
 
     return created_entries
 
@@ -12,13 +12,14 @@ in wordpress are also in the catalog.
 The two wp sync processes can be used to ensure consistency across the file system, wordpress
 and the catalog sheets
 '''
-import os, tqdm
+import asyncio, os
 from datetime import datetime
-from wordpressmti.wbg_book_post import get_wbg_client
+from tqdm import tqdm
+from wordpressmti.wbg_book_post_async import get_async_wbg_client
 from wordpressmti import wp_loader_main
 from mti.mti_config import mticonfig
 from mti.mti_logger import MTILogger
-from mti import author_doc_scan, book_csv_reader
+from mti import author_doc_scan, book_csv_reader, scan_snapshot
 from pathlib import Path
 
 # Global Variables
@@ -52,7 +53,7 @@ in Wordpress
 '''
 def process_index_file(doct_name, index_output_file):
 
-    wbgclient = get_wbg_client()
+    wbgclient = get_async_wbg_client()
 
     single_found_count = 0
     multiple_found_count = 0
@@ -63,16 +64,17 @@ def process_index_file(doct_name, index_output_file):
         logc("\nChecking Wordpress for documents ...")
 
         doct_prefix = mticonfig.tosingular(doct_name)
+
+        books = [wp_loader_main.record_to_book(record, doct_prefix)
+                 for record in book_csv_reader.read_csv_file(doct_prefix, index_output_file)]
         
-        total_lines = sum(1 for _ in open(index_output_file, "r")) - 1
-        pbar = tqdm(desc=" Processing:", total=total_lines)
-        
-        for record in book_csv_reader.read_csv_file(doct_prefix, index_output_file):
-            total_count += 1
-            pbar.update(1)
-            book = wp_loader_main.record_to_book(record, doct_prefix)
+        # The books are checked at the same time (up to the client's concurrency)
+        pbar = tqdm(desc=" Processing:", total=len(books))
+        results = asyncio.run(wbgclient.check_books_exist(books, progress=pbar.update))
+        pbar.close()
 
-            (book_exists, post_ids) = wbgclient.check_book_exists(book)
+        for (book, (book_exists, post_ids)) in zip(books, results):
+            total_count += 1
             if (not book_exists): 
                 none_found_count +=1 
                 log(f"Not Found: {book}")
@@ -82,7 +84,6 @@ def process_index_file(doct_name, index_output_file):
                     log(f"Multiple : {post_ids}{book}")
                 else:
                     single_found_count +=1
-        pbar.close()
 
         logc("\nWordpress Check Summary")
         logc(f"{mticonfig.idtab} Total Book Count    : {total_count}")
@@ -92,6 +93,8 @@ def process_index_file(doct_name, index_output_file):
 
     except Exception as e:
        logc(f"Error processing missing catalog entry: {e}")
+    finally:
+        wbgclient.close()
 
     return
 
@@ -110,10 +113,14 @@ def process_document_folder(folder_to_index, coll_name, doct_name):
     index_debug_file    = Path(working_dir + file_prefix + '_Index_Debug.txt')
     index_error_file    = Path(working_dir + file_prefix + '_Index_Error.csv')
 
+    # Author folders already scanned in this run (e.g. by the indexer) are reused
+    snapshot = scan_snapshot.get_snapshot(coll_name, doct_name, folder_to_index)
+
     logc(f'\nIndexing folder: {folder_to_index} ... \n')    
     num_processed = author_doc_scan.process_all_author_folders(
         folder_to_index, doct_name,
-        index_output_file, index_debug_file, index_error_file, debug=True)
+        index_output_file, index_debug_file, index_error_file, debug=True, manifest=snapshot)
+    snapshot.save()
     
     if num_processed > 0:
         process_index_file(doct_name, index_output_file)
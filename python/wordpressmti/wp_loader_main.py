@@ -1,5 +1,5 @@
-import csv
-from mti import book_csv_reader, author_doc_scan
+import csv, os
+from mti import book_csv_reader, author_doc_scan, cover_generator, doc_hasher, index_store
 from wordpressmti.wbg_book_post import *
 from mti.mti_config import MTIConfig, MTIDataKey, mticonfig
 from pathlib import Path
@@ -54,7 +54,11 @@ def load(loadManual=False):
 
         # Print messages
         print('Wordpress loader started ...')
-        print(mticonfig.idtab, f"Index File: {idx_new_file}")
+        from_store = is_loaded_from_store(loadManual)
+        if (from_store):
+            print(mticonfig.idtab, f"Index Store: documents not loaded yet ({index_store.get_index_store().db_file})")
+        else:
+            print(mticonfig.idtab, f"Index File: {idx_new_file}")
         if (isDryRun):
             print('\n ===== Dry Run Output ==== \n')
             print('The following documents would have been loaded: \n')
@@ -69,9 +73,17 @@ def load(loadManual=False):
         loaderrors          = []
         loadtimestamp       = mticonfig.get_timestamp()
         doct_prefix         = MTIConfig.tosingular(mticonfig.doct_name)
+        duplicate_index     = doc_hasher.load_duplicate_index()
         
         try:
-            for record in book_csv_reader.read_csv_file(doct_prefix, idx_new_file):
+            for record in read_records_to_load(doct_prefix, idx_new_file, from_store):
+                # Skip documents that are copies of a document loaded from another folder
+                duplicate_of = duplicate_index.get_duplicate_of(doc_hasher.get_doc_path(record, doct_prefix))
+                if (duplicate_of):
+                    book_error_count += 1
+                    loaderrors.append(log_book_duplicate(doct_prefix, record, duplicate_of))
+                    continue
+
                 new_book = record_to_book(record, doct_prefix)
 
                 (book_exists, post_ids) = wbgclient.check_book_exists(new_book)
@@ -98,10 +110,15 @@ def load(loadManual=False):
         
                 with open(load_error_file, "w", newline="", encoding="utf-8") as csvfile:                
                     fieldnames = ['Error', 'Post IDs'] + author_doc_scan.get_fieldnames(doct_prefix)
-                    writer = csv.DictWriter(csvfile, fieldnames=fieldnames, delimiter="|")
+                    writer = csv.DictWriter(csvfile, fieldnames=fieldnames, delimiter="|", extrasaction="ignore")
                     writer.writeheader()
                     writer.writerows(loaderrors)
 
+                # Record the load status of each document in the index store
+                if index_store.is_enabled():
+                    index_store.get_index_store().record_loads(
+                        mticonfig.archive_key, mticonfig.doct_name, loadedbooks, loaderrors, loadtimestamp)
+
                 # Save execution details checkpoint since wordpress loaded and loaded file created
                 mticonfig.exe_details[MTIDataKey.LAST_IDX_LOAD_FILE_DT]  = last_idx_gen_dt
                 mticonfig.exe_details[MTIDataKey.LAST_WP_LOADER_RUN_DT]  = loadtimestamp
@@ -120,6 +137,20 @@ def load(loadManual=False):
             print('\n ===== Dry Run Output ==== \n')
        
 
+# The documents to load come from the index store when it's on and has a run of the
+# archive (see index_store), documents that couldn't be loaded before included. A manually
+# created index file is always loaded from the file.
+def is_loaded_from_store(loadManual):
+    return (not loadManual and index_store.is_enabled() and
+            index_store.get_index_store().get_latest_run_id(mticonfig.archive_key) is not None)
+
+def read_records_to_load(doct_prefix, idx_new_file, from_store):
+    if (from_store):
+        rows = index_store.get_index_store().get_not_loaded(mticonfig.archive_key)
+        return index_store.to_records(rows, mticonfig.doct_name)
+
+    return book_csv_reader.read_csv_file(doct_prefix, idx_new_file)
+
 def record_to_book(record, doct_prefix):
     new_book = WPGBook(
         title       = record[f"{doct_prefix} Title"],
@@ -152,11 +183,25 @@ def record_to_book(record, doct_prefix):
     return new_book
 
 
+# Covers indexed with GenerateCover=Lazy are only named in the index, so they are generated
+# here for the documents being loaded, just before the cover is uploaded
+def generate_pending_cover(new_book):
+    cover_path = os.path.join(new_book.base_path, new_book.folder, new_book.cover_file)
+    pdf_path = os.path.join(new_book.base_path, new_book.folder, new_book.file)
+    pdf_cover = author_doc_scan.get_pdf_cover() if cover_generator.is_pdf_cover_file(new_book.cover_file) else None
+    try:
+        if cover_generator.generate_pending_cover(new_book.title, new_book.author, cover_path, pdf_cover, pdf_path):
+            print("[Generated Cover]", new_book.cover_file)
+    except OSError as e:
+        raise WPGBookPostException(f"Cover file could not be generated at {cover_path}: {e}") from e
+
 def load_book(isDryRun, new_book, wbgclient, record, uploadMedia, loadtimestamp):
     # Get Document Type Prefix (eg. Article, Book, etc)
     doct_prefix = MTIConfig.tosingular(mticonfig.doct_name)    
 
     if (not isDryRun):
+        if (uploadMedia and new_book.cover_file):
+            generate_pending_cover(new_book)
         postid = wbgclient.create_book(new_book, uploadMedia)
         print("[Loaded]", record[f"{doct_prefix} Title"])
     else:
@@ -175,3 +220,11 @@ def log_book_exists(doct_prefix, record, post_ids):
     print("[Exists]", record[f"{doct_prefix} Title"])
 
     return record
+
+def log_book_duplicate(doct_prefix, record, duplicate_of):
+    record['Error']         = f"{doct_prefix} Duplicate Of {duplicate_of}"
+    record['Duplicate Of']  = duplicate_of
+
+    print("[Duplicate]", record[f"{doct_prefix} Title"])
+
+    return record
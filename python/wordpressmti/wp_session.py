@@ -0,0 +1,104 @@
+'''
+The HTTP session the WordPress client makes its API calls with. The calls used to be made
+with requests.get/post/delete, which open a new connection (and TLS handshake) for each
+call and give up on the first error, so a single 502 from the site stopped a whole load.
+
+The session keeps its connections to the site open between calls (a pool of PoolSize
+connections, for the threads of a sync), every call has a connect and read timeout, and
+failed calls are retried with exponential backoff and jitter:
+    - Calls that can be repeated safely (GET, PUT, DELETE, ...) are retried on connection
+      errors, timeouts and 429/5xx responses, waiting as long as a Retry-After asks.
+    - POSTs (creating books and uploading media) are only retried when the connection to
+      the site couldn't be made, as a POST that reached the site may have created the
+      book or media even if it failed after, and repeating it would create it twice.
+When the retries run out, the last response is returned as it is, so the client reports
+it as before.
+
+    Settings in [WordPress]:
+        PoolSize=10             Connections kept open to the site
+        ConnectTimeout=10       Seconds to wait to connect to the site
+        ReadTimeout=120         Seconds to wait for the site to respond (uploads included)
+        Retries=3               Retries of a failed call
+        RetryBackoff=1          Seconds to wait before the second retry, doubling for each
+                                retry after (the first retry is made at once)
+'''
+from mti.mti_config import mticonfig
+from mti.lazy_imports import lazy_import
+
+requests = lazy_import("requests")
+urllib3_retry = lazy_import("urllib3.util.retry")
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 120
+DEFAULT_RETRIES = 3
+DEFAULT_RETRY_BACKOFF = 1
+
+# Longest wait between retries, and the random time (up to) added to each wait so the
+# threads of a sync don't all retry at the same time
+MAX_BACKOFF = 60
+BACKOFF_JITTER = 0.5
+
+# Responses worth retrying: rate limited, and server or gateway errors
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Methods that can be repeated without changing the result (no POST)
+IDEMPOTENT_METHODS = ("GET", "HEAD", "PUT", "DELETE", "OPTIONS")
+
+# The settings of a session, the defaults are used for the ones not in settings
+class SessionSettings:
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, retries=DEFAULT_RETRIES,
+                 retry_backoff=DEFAULT_RETRY_BACKOFF):
+        self.pool_size          = pool_size
+        self.connect_timeout    = connect_timeout
+        self.read_timeout       = read_timeout
+        self.retries            = retries
+        self.retry_backoff      = retry_backoff
+
+    # Timeout of each call, as requests takes it
+    @property
+    def timeout(self):
+        return (self.connect_timeout, self.read_timeout)
+
+def get_session_settings():
+    wp_settings = mticonfig.ini['WordPress']
+    return SessionSettings(
+        pool_size       = max(1, wp_settings.getint('PoolSize', fallback=DEFAULT_POOL_SIZE)),
+        connect_timeout = max(1.0, wp_settings.getfloat('ConnectTimeout', fallback=DEFAULT_CONNECT_TIMEOUT)),
+        read_timeout    = max(1.0, wp_settings.getfloat('ReadTimeout', fallback=DEFAULT_READ_TIMEOUT)),
+        retries         = max(0, wp_settings.getint('Retries', fallback=DEFAULT_RETRIES)),
+        retry_backoff   = max(0.0, wp_settings.getfloat('RetryBackoff', fallback=DEFAULT_RETRY_BACKOFF)))
+
+def create_retry(settings):
+    return urllib3_retry.Retry(
+        total=settings.retries,
+        connect=settings.retries,
+        read=settings.retries,
+        status=settings.retries,
+        other=0,
+        allowed_methods=IDEMPOTENT_METHODS,
+        status_forcelist=RETRY_STATUSES,
+        backoff_factor=settings.retry_backoff,
+        backoff_max=MAX_BACKOFF,
+        backoff_jitter=BACKOFF_JITTER if settings.retry_backoff > 0 else 0.0,
+        respect_retry_after_header=True,
+        raise_on_status=False)
+
+# Create a session with a pool of kept open connections that retries failed calls. The
+# session is shared by the threads using the client.
+def create_session(settings=None, headers=None):
+    settings = settings or SessionSettings()
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=settings.pool_size,
+        max_retries=create_retry(settings))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    if headers:
+        session.headers.update(headers)
+
+    return session
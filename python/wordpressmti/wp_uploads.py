@@ -0,0 +1,149 @@
+'''
+Media uploads that stream the file from disk as it is sent, instead of reading the whole
+file into memory first (some scanned PDFs are hundreds of MB), so the memory used by an
+upload is the same whatever the size of the file, and the upload starts at once.
+
+The body of an upload is a file like object requests sends in blocks as it reads them, of
+a known length so it is sent with a Content-Length (PHP doesn't take chunked uploads):
+    - UploadFile is the file as it is, for the uploads that send the file as the body
+      (covers, with the file name in the Content-Disposition header)
+    - MultipartUpload is a multipart/form-data body with the file as its one field (PDFs)
+Both call progress(bytes_sent, total_bytes) as blocks are sent, and can be rewound so a
+retried upload is sent again from the start. Passed a hashlib object as digest, the file is
+hashed as it is sent, so it isn't read once more to hash it (see get_digest).
+'''
+import io, os, uuid
+from mti.lazy_imports import lazy_import
+
+urllib3_fields = lazy_import("urllib3.fields")
+
+# A file read in blocks as it is sent, calling progress with the bytes read so far
+class UploadFile(io.RawIOBase):
+    def __init__(self, path, progress=None, digest=None):
+        self.file = open(path, 'rb')
+        self.length = os.fstat(self.file.fileno()).st_size
+        self.progress = progress
+
+        # The digest is updated with the bytes read past the ones hashed so far, so a
+        # retried upload reading the file again doesn't hash it twice
+        self.digest = digest
+        self.hashed = 0
+
+    def __len__(self):
+        return self.length
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def read(self, size=-1):
+        start = self.file.tell()
+        data = self.file.read(size)
+        if self.digest and start <= self.hashed < start + len(data):
+            self.digest.update(data[self.hashed - start:])
+            self.hashed = start + len(data)
+        if data and self.progress:
+            self.progress(self.file.tell(), self.length)
+        return data
+
+    # The hex digest of the file once all of it was read, None before (or if the reads
+    # skipped part of it)
+    def get_digest(self):
+        if self.digest is None or self.hashed != self.length:
+            return None
+
+        return self.digest.hexdigest()
+
+    def tell(self):
+        return self.file.tell()
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self.file.seek(offset, whence)
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+# A multipart/form-data body with the file as its field, the headers of the field are made
+# by urllib3 like requests makes them for files=
+class MultipartUpload(io.RawIOBase):
+    def __init__(self, field_name, path, filename, mime_type, progress=None, digest=None):
+        self.boundary = uuid.uuid4().hex
+
+        field = urllib3_fields.RequestField(field_name, b"", filename=filename)
+        field.make_multipart(content_type=mime_type)
+        head = f"--{self.boundary}\r\n".encode() + field.render_headers().encode()
+        tail = f"\r\n--{self.boundary}--\r\n".encode()
+
+        self.file = UploadFile(path, digest=digest)
+        self.parts = [io.BytesIO(head), self.file, io.BytesIO(tail)]
+        self.lengths = [len(head), len(self.file), len(tail)]
+        self.length = sum(self.lengths)
+
+        # The part being read, and where it starts in the body
+        self.part = 0
+        self.part_start = 0
+        self.progress = progress
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        return self.length
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def read(self, size=-1):
+        chunks = []
+        while self.part < len(self.parts) and size != 0:
+            data = self.parts[self.part].read(size)
+            if data:
+                chunks.append(data)
+                if size > 0:
+                    size -= len(data)
+            else:
+                self.part_start += self.lengths[self.part]
+                self.part += 1
+
+        data = b"".join(chunks)
+        if data and self.progress:
+            self.progress(self.tell(), self.length)
+        return data
+
+    def get_digest(self):
+        return self.file.get_digest()
+
+    def tell(self):
+        if self.part >= len(self.parts):
+            return self.length
+
+        return self.part_start + self.parts[self.part].tell()
+
+    # Only seeking from the start of the body is needed (to rewind, or to find the length)
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_END:
+            offset += self.length
+        elif whence == os.SEEK_CUR:
+            offset += self.tell()
+        offset = min(max(0, offset), self.length)
+
+        self.part = 0
+        self.part_start = 0
+        while self.part < len(self.parts) and offset >= self.part_start + self.lengths[self.part]:
+            self.part_start += self.lengths[self.part]
+            self.part += 1
+        for (i, part) in enumerate(self.parts):
+            part.seek(offset - self.part_start if i == self.part else 0)
+
+        return offset
+
+    def close(self):
+        self.file.close()
+        super().close()